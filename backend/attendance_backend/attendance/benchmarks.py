@@ -0,0 +1,84 @@
+# attendance/benchmarks.py - Helpers shared by the benchmark commands
+import os
+import time
+
+import cv2
+import numpy as np
+
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+
+def training_images(folder):
+    """[(employee_id, path)] for a training_data/<EMP>/<image> layout, sorted"""
+    if not os.path.isdir(folder):
+        raise FileNotFoundError(f"Folder '{folder}' not found (expected {folder}/EMP001/face1.jpg, ...)")
+
+    images = []
+    for employee_id in sorted(os.listdir(folder)):
+        employee_dir = os.path.join(folder, employee_id)
+        if not os.path.isdir(employee_dir):
+            continue
+        for name in sorted(os.listdir(employee_dir)):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                images.append((employee_id, os.path.join(employee_dir, name)))
+    return images
+
+
+def synthetic_face(subject, variant, size=200):
+    """Preprocessed-looking 200x200 face: a per-subject texture plus noise"""
+    subject_rng = np.random.default_rng(subject)
+    base = subject_rng.integers(0, 256, (size // 10, size // 10)).astype(np.uint8)
+    face = cv2.resize(base, (size, size), interpolation=cv2.INTER_CUBIC)
+
+    variant_rng = np.random.default_rng(1000 * subject + variant)
+    noise = variant_rng.normal(0, 6, (size, size))
+    face = np.clip(face.astype(np.float64) + noise + 4 * variant, 0, 255).astype(np.uint8)
+
+    face = cv2.equalizeHist(face)
+    return cv2.GaussianBlur(face, (5, 5), 0)
+
+
+def time_calls(func, repeat, *args, **kwargs):
+    """Milliseconds taken by each of repeat calls of func(*args, **kwargs)"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args, **kwargs)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def latency_summary(timings_ms):
+    """mean / p50 / p95 / p99 / max of a list of timings in milliseconds"""
+    if len(timings_ms) == 0:
+        return {'count': 0, 'mean': None, 'p50': None, 'p95': None, 'p99': None, 'max': None}
+    timings = np.asarray(timings_ms, dtype=np.float64)
+    p50, p95, p99 = np.percentile(timings, [50, 95, 99])
+    return {
+        'count': len(timings),
+        'mean': round(float(timings.mean()), 3),
+        'p50': round(float(p50), 3),
+        'p95': round(float(p95), 3),
+        'p99': round(float(p99), 3),
+        'max': round(float(timings.max()), 3),
+    }
+
+
+def equal_error_threshold(genuine, impostor):
+    """(distance threshold, error rate) where false rejects of genuine
+    distances and false accepts of impostor distances are closest"""
+    genuine = np.asarray(genuine, dtype=np.float64)
+    impostor = np.asarray(impostor, dtype=np.float64)
+    genuine, impostor = genuine[np.isfinite(genuine)], impostor[np.isfinite(impostor)]
+    if len(genuine) == 0 or len(impostor) == 0:
+        return None, None
+
+    best = None
+    for threshold in np.unique(np.concatenate([genuine, impostor])):
+        false_reject = float(np.mean(genuine > threshold))
+        false_accept = float(np.mean(impostor <= threshold))
+        gap = abs(false_reject - false_accept)
+        if best is None or gap < best[0]:
+            best = (gap, float(threshold), (false_reject + false_accept) / 2)
+    return best[1], best[2]
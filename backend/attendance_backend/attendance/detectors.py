@@ -0,0 +1,131 @@
+# attendance/detectors.py - Face detector backends
+import os
+
+import cv2
+import numpy as np
+from django.conf import settings
+
+
+class DetectorUnavailable(Exception):
+    """The detector's model file could not be found or loaded"""
+
+
+class CascadeDetector:
+    """OpenCV cascade classifier with configurable detectMultiScale parameters
+
+    cascade is a file name looked up in the cascade directories (see
+    cascade_dirs) or a path. Parameters default to the values the service
+    has always used with the Haar cascade.
+    """
+
+    name = 'cascade'
+    cascade = 'haarcascade_frontalface_default.xml'
+
+    def __init__(self, cascade=None, scale_factor=1.1, min_neighbors=5):
+        self.cascade_path = self.find_cascade(cascade or self.cascade)
+        self.classifier = cv2.CascadeClassifier(self.cascade_path)
+        if self.classifier.empty():
+            raise DetectorUnavailable(f"Could not load cascade {self.cascade_path}")
+        self.scale_factor = scale_factor
+        self.min_neighbors = min_neighbors
+
+    @staticmethod
+    def cascade_dirs():
+        """Where cascade files are looked for, most specific first
+
+        FACE_DETECTOR_CASCADE_DIRS, then the data directories of the
+        installed cv2 package and of a system OpenCV (the pip wheels only
+        ship the Haar cascades; LBP ones come with system packages or a
+        source checkout).
+        """
+        cv2_data = os.path.join(os.path.dirname(cv2.__file__), 'data')
+        dirs = list(getattr(settings, 'FACE_DETECTOR_CASCADE_DIRS', []))
+        dirs += [cv2.data.haarcascades, cv2_data]
+        for root in ('/usr/share/opencv4', '/usr/local/share/opencv4', '/usr/share/opencv'):
+            dirs += [os.path.join(root, 'haarcascades'), os.path.join(root, 'lbpcascades')]
+        return dirs
+
+    @classmethod
+    def find_cascade(cls, cascade):
+        if os.path.isfile(cascade):
+            return cascade
+        for directory in cls.cascade_dirs():
+            path = os.path.join(directory, cascade)
+            if os.path.isfile(path):
+                return path
+        raise DetectorUnavailable(f"Cascade {cascade} not found in {', '.join(cls.cascade_dirs())}")
+
+    @property
+    def window_size(self):
+        """Smallest face (w, h) in pixels the detector can find"""
+        return tuple(self.classifier.getOriginalWindowSize())
+
+    def detect(self, gray, min_size):
+        """(x, y, w, h) boxes of the faces in a grayscale image"""
+        faces = self.classifier.detectMultiScale(
+            gray,
+            scaleFactor=self.scale_factor,
+            minNeighbors=self.min_neighbors,
+            minSize=min_size,
+            flags=cv2.CASCADE_SCALE_IMAGE
+        )
+        return np.asarray(faces, dtype=np.int32).reshape(-1, 4)
+
+    def describe(self):
+        return {
+            'backend': self.name,
+            'cascade': os.path.basename(self.cascade_path),
+            'scale_factor': self.scale_factor,
+            'min_neighbors': self.min_neighbors,
+        }
+
+
+class HaarDetector(CascadeDetector):
+    """Viola-Jones Haar cascade (the service's original detector)"""
+
+    name = 'haar'
+    cascade = 'haarcascade_frontalface_default.xml'
+
+
+class LBPDetector(CascadeDetector):
+    """LBP cascade: integer features, several times faster than Haar on
+    frontal faces at similar recall"""
+
+    name = 'lbp'
+    cascade = 'lbpcascade_frontalface_improved.xml'
+
+    def __init__(self, cascade=None, scale_factor=1.1, min_neighbors=4):
+        super().__init__(cascade, scale_factor, min_neighbors)
+
+
+# Backends selectable with FACE_DETECTOR_BACKEND
+DETECTOR_BACKENDS = {
+    'haar': HaarDetector,
+    'lbp': LBPDetector,
+    'cascade': CascadeDetector,
+}
+
+
+def create_detector(backend=None, options=None, fallback='haar'):
+    """Build the detector named by FACE_DETECTOR_BACKEND (default 'haar')
+
+    options are keyword arguments for the backend (FACE_DETECTOR_OPTIONS
+    by default). If its model file is missing the fallback backend is
+    used instead, with default options, so a server without the LBP
+    cascades still detects faces.
+    """
+    if backend is None:
+        backend = getattr(settings, 'FACE_DETECTOR_BACKEND', 'haar')
+        if options is None:
+            options = getattr(settings, 'FACE_DETECTOR_OPTIONS', {})
+
+    if backend not in DETECTOR_BACKENDS:
+        raise ValueError(f"Unknown face detector backend {backend!r} (choose from {', '.join(DETECTOR_BACKENDS)})")
+
+    try:
+        return DETECTOR_BACKENDS[backend](**(options or {}))
+    except DetectorUnavailable as e:
+        if not fallback or fallback == backend:
+            raise
+        print(f"✗ {e}; falling back to the {fallback} detector")
+        return DETECTOR_BACKENDS[fallback]()
@@ -0,0 +1,165 @@
+# attendance/face_index.py - 1:N search over face descriptors
+import numpy as np
+
+from .lbp import chi_square_distances
+
+
+class IndexFit:
+    """The part of a fitted FaceIndex a later gallery can reuse
+
+    Only the fitted axes and the projected rows (found by template id) are
+    kept, not the descriptors, so holding on to it doesn't pin an old
+    gallery in memory.
+    """
+
+    def __init__(self, mean, basis, ids, projected, fitted_rows):
+        self.mean = mean
+        self.basis = basis
+        self.ids = ids
+        self.projected = projected
+        self.fitted_rows = fitted_rows
+
+
+class FaceIndex:
+    """Coarse-to-fine nearest-template search over LBP histograms
+
+    Histograms are square-rooted (so Euclidean distance tracks the
+    chi-square family), centred and projected onto their top principal
+    components. A query scans that small, contiguous matrix to shortlist
+    candidates, then re-ranks only the shortlist with the exact chi-square
+    distance verify_face uses.
+
+    Given ids (one per row, ascending, as gallery template ids are) and
+    the previous gallery's fit, the index keeps that basis and projects
+    only the rows it hasn't seen, so a registration costs a few rows
+    rather than a refit. It refits once the gallery has grown past
+    refit_growth times the rows the basis was fitted on.
+    """
+
+    def __init__(self, descriptors, labels, components=64, shortlist=200, sample_size=4000,
+                 ids=None, previous_fit=None, refit_growth=2.0):
+        self.descriptors = np.ascontiguousarray(descriptors, dtype=np.float32)
+        self.labels = np.asarray(labels, dtype=np.int32).reshape(-1)
+        self.ids = np.asarray(ids, dtype=np.int64).reshape(-1) if ids is not None else None
+        self.shortlist = shortlist
+
+        self.mean = None
+        self.basis = None
+        self.projected = None
+        self.projected_norms = None
+        self.fitted_rows = 0
+
+        # Small galleries are cheaper to scan exactly
+        if len(self.descriptors) > shortlist:
+            if self._can_reuse(previous_fit, refit_growth):
+                self._carry_over(previous_fit)
+            else:
+                self._fit(components, sample_size)
+
+    def __len__(self):
+        return len(self.descriptors)
+
+    def fit(self):
+        """IndexFit for the next gallery's index, or None if this one scans exactly"""
+        if self.projected is None or self.ids is None:
+            return None
+        return IndexFit(self.mean, self.basis, self.ids, self.projected, self.fitted_rows)
+
+    def _can_reuse(self, fit, refit_growth):
+        return (
+            fit is not None and self.ids is not None
+            and fit.basis.shape[0] == self.descriptors.shape[1]
+            and len(self.descriptors) <= refit_growth * fit.fitted_rows
+        )
+
+    def _project(self, descriptors):
+        return np.ascontiguousarray((np.sqrt(descriptors) - self.mean) @ self.basis, dtype=np.float32)
+
+    def _fit(self, components, sample_size):
+        roots = np.sqrt(self.descriptors)
+
+        # Fit PCA on a sample; projecting the full matrix is a single matmul
+        rng = np.random.default_rng(0)
+        if len(roots) > sample_size:
+            sample = roots[rng.choice(len(roots), sample_size, replace=False)]
+        else:
+            sample = roots
+        self.mean = sample.mean(axis=0)
+        self.basis = self._principal_axes(sample - self.mean, components, rng)
+        self.fitted_rows = len(roots)
+
+        self.projected = np.ascontiguousarray((roots - self.mean) @ self.basis, dtype=np.float32)
+        self.projected_norms = np.einsum('ij,ij->i', self.projected, self.projected)
+
+    def _carry_over(self, fit):
+        """Reuse fit's basis and the projections of rows it already had"""
+        self.mean, self.basis, self.fitted_rows = fit.mean, fit.basis, fit.fitted_rows
+
+        known = np.zeros(len(self.ids), dtype=bool)
+        positions = np.zeros(len(self.ids), dtype=np.intp)
+        if len(fit.ids):
+            positions = np.minimum(np.searchsorted(fit.ids, self.ids), len(fit.ids) - 1)
+            known = fit.ids[positions] == self.ids
+
+        self.projected = np.empty((len(self.ids), self.basis.shape[1]), dtype=np.float32)
+        self.projected[known] = fit.projected[positions[known]]
+        if not known.all():
+            self.projected[~known] = self._project(self.descriptors[~known])
+        self.projected_norms = np.einsum('ij,ij->i', self.projected, self.projected)
+
+    @staticmethod
+    def _principal_axes(centred, components, rng, oversample=10, iterations=2):
+        """Top principal axes via a randomized range finder
+
+        A full SVD of a (samples x thousands-of-bins) matrix takes minutes;
+        projecting onto a few random directions refined by power iterations
+        costs a handful of matmuls and is accurate enough for a shortlist.
+        """
+        components = min(components, *centred.shape)
+        width = min(components + oversample, *centred.shape)
+        q = centred @ rng.standard_normal((centred.shape[1], width)).astype(np.float32)
+        for _ in range(iterations):
+            q, _ = np.linalg.qr(q)
+            q = centred @ (centred.T @ q)
+        q, _ = np.linalg.qr(q)
+        _, _, vt = np.linalg.svd(q.T @ centred, full_matrices=False)
+        return np.ascontiguousarray(vt[:components].T, dtype=np.float32)
+
+    def search(self, probe, top_k=5):
+        """[(label, distance)] of the top_k closest labels, best first
+
+        A label's distance is that of its closest template.
+        """
+        return self.search_batch(probe, top_k)[0]
+
+    def search_batch(self, probes, top_k=5):
+        """search() for several probes at once, one result list per probe
+
+        The coarse scan is a single (probes x templates) product and the
+        exact re-rank a single chi-square pass over the union of the
+        shortlists, so a frame with many faces costs about one query.
+        """
+        probes = np.atleast_2d(np.asarray(probes, dtype=np.float32))
+        if len(self.descriptors) == 0:
+            return [[] for _ in probes]
+
+        if self.projected is None:
+            indices = np.arange(len(self.descriptors))
+        else:
+            queries = self._project(probes)
+            coarse = self.projected_norms[None, :] - 2.0 * (queries @ self.projected.T)
+            shortlists = np.argpartition(coarse, self.shortlist, axis=1)[:, :self.shortlist]
+            indices = np.unique(shortlists)
+
+        distances = chi_square_distances(probes, self.descriptors[indices])
+        return [self._rank(indices, row, top_k) for row in distances]
+
+    def _rank(self, indices, distances, top_k):
+        best = {}
+        for index in np.argsort(distances):
+            label = int(self.labels[indices[index]])
+            if label not in best:
+                best[label] = float(distances[index])
+                if len(best) == top_k:
+                    break
+        return list(best.items())
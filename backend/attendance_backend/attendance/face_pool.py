@@ -0,0 +1,201 @@
+# attendance/face_pool.py - Process pool for CPU-bound face work under ASGI
+import asyncio
+import multiprocessing
+import os
+import threading
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .face_service import face_service
+
+
+_executor = None
+_executor_lock = threading.Lock()
+_slots = weakref.WeakKeyDictionary()  # event loop -> Semaphore
+
+
+def _init_worker():
+    """Runs once in each pool process: set up Django and load the gallery"""
+    import django
+    django.setup()
+
+    from .face_service import warm_up_face_service
+    warm_up_face_service()
+    print(f"✓ Face worker {os.getpid()} ready")
+
+
+def _ping():
+    return os.getpid()
+
+
+def pool_size():
+    """FACE_PROCESS_WORKERS (None = one per CPU, the default; 0 = on a thread)
+
+    Workers map the same gallery snapshot files, so the templates sit in
+    the page cache once however many workers there are; each worker adds
+    its interpreter, OpenCV and request buffers.
+    """
+    workers = getattr(settings, 'FACE_PROCESS_WORKERS', None)
+    if workers is None:
+        return os.cpu_count() or 1
+    return workers
+
+
+def get_executor():
+    """The shared ProcessPoolExecutor, created on first use
+
+    Workers are spawned rather than forked: the ASGI server's threads and
+    event loop must not be copied into them.
+    """
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ProcessPoolExecutor(
+                    max_workers=pool_size(),
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_worker,
+                )
+    return _executor
+
+
+def reset_executor(broken):
+    """Replace a broken executor (a worker died) unless another task already did"""
+    global _executor
+    with _executor_lock:
+        if _executor is broken:
+            _executor = None
+            print("✗ Face process pool broke, starting a new one")
+    broken.shutdown(wait=False, cancel_futures=True)
+
+
+def start():
+    """Spawn every worker now so each has its gallery loaded before traffic"""
+    if pool_size() > 0:
+        executor = get_executor()
+        for _ in range(pool_size()):
+            executor.submit(_ping)
+
+
+async def run_in_pool(func, *args, retry=False):
+    """Await func(*args) on a pool process without blocking the event loop
+
+    At most FACE_PROCESS_QUEUE_LIMIT tasks (default: twice the pool size)
+    are handed to the pool at once; later callers wait their turn here,
+    while the server keeps accepting connections. A broken pool (a worker
+    died) is rebuilt; with retry=True the task is then run again, which
+    is only safe for read-only tasks such as verify_task: a registration
+    may have been written before its worker died.
+    """
+    if pool_size() == 0:
+        return await sync_to_async(func, thread_sensitive=False)(*args)
+
+    loop = asyncio.get_running_loop()
+    slots = _slots.get(loop)
+    if slots is None:
+        limit = getattr(settings, 'FACE_PROCESS_QUEUE_LIMIT', None) or 2 * pool_size()
+        slots = _slots[loop] = asyncio.Semaphore(limit)
+
+    async with slots:
+        executor = get_executor()
+        try:
+            return await loop.run_in_executor(executor, func, *args)
+        except BrokenProcessPool:
+            # A worker died (killed, out of memory): later tasks get a new pool
+            reset_executor(executor)
+            if not retry:
+                raise
+            return await loop.run_in_executor(get_executor(), func, *args)
+
+
+# ==================== TASKS ====================
+# Module-level functions so they pickle; arguments and results are plain
+# data (base64 strings or bytes in, dicts out).
+
+def model_stats(employee_id):
+    snapshot = face_service.snapshot
+    return {
+        'in_model': employee_id in snapshot.label_map,
+        'face_label': snapshot.label_map.get(employee_id),
+        'total_employees': len(snapshot.label_map),
+        'total_faces': len(snapshot.gallery),
+        'gallery_version': snapshot.version,
+    }
+
+
+def verify_task(employee_id, face_images):
+    """Validate and verify a capture, or a burst of them, against employee_id
+
+    result['source_index'] is the position of the capture the decision was
+    made on, so the bytes don't travel back to the caller.
+    """
+    if len(face_images) > 1:
+        frames = [face_service.analyze_frame(image) for image in face_images]
+        is_verified, confidence_score, frames_evaluated, source = face_service.verify_burst(
+            employee_id, frames
+        )
+        source_index = next(i for i, frame in enumerate(frames) if frame.source is source)
+        if is_verified:
+            reason = f"Verified (confidence: {confidence_score:.2f})"
+        elif confidence_score > 0:
+            reason = f"Face mismatch (confidence: {confidence_score:.2f})"
+        else:
+            reason = "Invalid face image"
+        result = {'valid': confidence_score > 0, 'is_verified': is_verified,
+                  'confidence_score': confidence_score, 'reason': reason,
+                  'frames_evaluated': frames_evaluated,
+                  'verification_tier': frames[source_index].tier,
+                  'source_index': source_index}
+        result['model_stats'] = model_stats(employee_id)
+        return result
+
+    # Decode and detect once; both steps share this frame
+    frame = face_service.analyze_frame(face_images[0])
+
+    if not face_service.is_valid_face_image(frame):
+        result = {'valid': False, 'is_verified': False, 'confidence_score': 0.0,
+                  'reason': 'Invalid face image', 'rejection_reason': frame.rejection}
+    else:
+        is_verified, confidence_score = face_service.verify_face(employee_id, frame)
+        if is_verified:
+            reason = f"Verified (confidence: {confidence_score:.2f})"
+        else:
+            reason = f"Face mismatch (confidence: {confidence_score:.2f})"
+        result = {'valid': True, 'is_verified': is_verified,
+                  'confidence_score': confidence_score, 'reason': reason,
+                  'verification_tier': frame.tier}
+
+    result['frames_evaluated'] = 1
+    result['source_index'] = 0
+    result['model_stats'] = model_stats(employee_id)
+    return result
+
+
+def register_task(employee_id, face_images):
+    """Validate captures and register the valid ones for employee_id"""
+    valid_images = []
+    invalid_images = []
+    invalid_reasons = []
+    for i, img_data in enumerate(face_images):
+        frame = face_service.analyze_frame(img_data)
+        if face_service.is_valid_face_image(frame):
+            valid_images.append(frame)
+        else:
+            invalid_images.append(i + 1)
+            invalid_reasons.append(frame.rejection)
+
+    registration_results = []
+    if len(valid_images) >= 3:
+        registration_results = face_service.register_face(employee_id, valid_images)
+
+    return {
+        'valid_images_count': len(valid_images),
+        'invalid_images': invalid_images,
+        'invalid_reasons': invalid_reasons,
+        'registration_results': registration_results,
+        'model_stats': model_stats(employee_id),
+    }
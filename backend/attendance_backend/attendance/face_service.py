@@ -3,57 +3,417 @@ import cv2
 import numpy as np
 import base64
 import json
-import io
 import os
-from PIL import Image
+import threading
+import time
+from functools import cached_property
 from django.conf import settings
 
+from . import quality
+from .detectors import DetectorUnavailable, create_detector
+from .gallery import FaceGallery, GallerySnapshot, GalleryStore
+from .lbp import LBPFeatureExtractor, NumpyLBPHRecognizer, chi_square_distances
+from .recognizers import RECOGNIZER_BACKENDS, create_backend
+
+
+# JPEG start-of-frame markers (SOF0-SOF15 minus DHT, JPG and DAC)
+JPEG_SOF_MARKERS = {
+    0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7,
+    0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF,
+}
+
+# Reduced-size grayscale decode modes, largest reduction first
+REDUCED_GRAYSCALE_MODES = (
+    (8, cv2.IMREAD_REDUCED_GRAYSCALE_8),
+    (4, cv2.IMREAD_REDUCED_GRAYSCALE_4),
+    (2, cv2.IMREAD_REDUCED_GRAYSCALE_2),
+)
+
+
+def jpeg_dimensions(image_data):
+    """Read (width, height) from a JPEG header without decoding pixels
+    
+    Returns None if the data is not a JPEG or no frame header is found.
+    """
+    if len(image_data) < 4 or image_data[0] != 0xFF or image_data[1] != 0xD8:
+        return None
+    
+    i = 2
+    size = len(image_data)
+    while i + 9 < size:
+        if image_data[i] != 0xFF:
+            i += 1
+            continue
+        marker = image_data[i + 1]
+        if marker == 0xFF:
+            # Fill byte
+            i += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD9:
+            # Standalone markers carry no length
+            i += 2
+            continue
+        segment_length = (image_data[i + 2] << 8) | image_data[i + 3]
+        if marker in JPEG_SOF_MARKERS:
+            height = (image_data[i + 5] << 8) | image_data[i + 6]
+            width = (image_data[i + 7] << 8) | image_data[i + 8]
+            return width, height
+        i += 2 + segment_length
+    return None
+
+
+def split_jpeg_stream(image_data):
+    """Split concatenated JPEG files into a list of individual images
+    
+    Segments are skipped by their declared length, so EXIF thumbnails
+    (which carry their own SOI/EOI inside APP1) don't cut an image short.
+    After start-of-scan, 0xFF bytes in entropy-coded data are always
+    followed by 0x00 or a restart marker, so the first FFD9 is the EOI.
+    """
+    images = []
+    size = len(image_data)
+    start = 0
+    while start + 4 <= size:
+        if image_data[start] != 0xFF or image_data[start + 1] != 0xD8:
+            break
+        i = start + 2
+        end = None
+        while i + 2 <= size:
+            if image_data[i] != 0xFF:
+                break
+            marker = image_data[i + 1]
+            if marker == 0xFF:
+                i += 1
+                continue
+            if marker == 0x01 or 0xD0 <= marker <= 0xD7:
+                i += 2
+                continue
+            if marker == 0xD9:
+                end = i + 2
+                break
+            if i + 4 > size:
+                break
+            segment_length = (image_data[i + 2] << 8) | image_data[i + 3]
+            i += 2 + segment_length
+            if marker == 0xDA:
+                # Entropy-coded data runs until the next real marker
+                while i + 1 < size:
+                    if image_data[i] == 0xFF and image_data[i + 1] not in (0x00, *range(0xD0, 0xD8)):
+                        break
+                    i += 1
+        if end is None:
+            break
+        images.append(bytes(image_data[start:end]))
+        start = end
+    return images
+
+
+# verify_face accepts at confidence_score >= MATCH_THRESHOLD, where
+# confidence_score = max(0, 100 - LBPH distance) / 100 (other recognizer
+# backends map their distances with their own scale, see recognizers.py)
+MATCH_THRESHOLD = 0.6
+
+
+def distance_to_confidence(distance):
+    """Map an LBPH chi-square distance to the 0-1 confidence score"""
+    return max(0, 100 - distance) / 100.0
+
+
+class FaceFrame:
+    """A single capture, decoded and analyzed at most once.
+
+    Validation, preprocessing and prediction all receive the same frame, so
+    base64 decoding, grayscale conversion, cascade detection and the face
+    crop are computed on first access and reused afterwards.
+    """
+
+    def __init__(self, service, source):
+        self.service = service
+        self.source = source
+        # Why is_valid_face_image rejected the frame (a quality.REJECT_* or
+        # face-level code), None while it hasn't or if the frame is valid
+        self.rejection = None
+        # Which verification tier decided ('fast' or 'full'), set by verify_face
+        self.tier = None
+
+    @cached_property
+    def decoded(self):
+        """(grayscale image, scale) from decode_image; image is None on failure"""
+        return self.service.decode_image(self.source)
+
+    @property
+    def image(self):
+        """Decoded grayscale image, or None if the source could not be decoded"""
+        return self.decoded[0]
+
+    @property
+    def scale(self):
+        """Original pixels per decoded pixel (1, 2, 4 or 8)"""
+        return self.decoded[1]
+
+    @cached_property
+    def detection(self):
+        """(faces, gray) as returned by detect_faces"""
+        if self.image is None:
+            return [], None
+        # minSize is expressed in original pixels
+        min_side = max(1, int(round(quality.MIN_FACE_SIDE / self.scale)))
+        started = time.perf_counter()
+        detection = self.service.detect_faces(self.image, min_size=(min_side, min_side))
+        quality.quality_stats.record_detection(time.perf_counter() - started)
+        return detection
+
+    @property
+    def faces(self):
+        return self.detection[0]
+
+    @cached_property
+    def fast_detection(self):
+        """(faces, gray) from the fast detector (first tier of
+        FACE_VERIFICATION_MODE = 'tiered')
+
+        Only faces covering FACE_FAST_MIN_FACE_FRACTION of the short side
+        are looked for: the cascade's cost is set by how small a face it
+        has to find relative to the frame, and by its scale step, more than
+        by the frame's size.
+        """
+        if self.image is None:
+            return [], None
+        fraction = getattr(settings, 'FACE_FAST_MIN_FACE_FRACTION', 0.2)
+        min_side = max(1, int(round(quality.MIN_FACE_SIDE / self.scale)), int(fraction * min(self.image.shape[:2])))
+        return self.service.detect_faces(
+            self.image, min_size=(min_side, min_side),
+            max_side=getattr(settings, 'FACE_FAST_DETECTION_MAX_SIDE', None),
+            detector=self.service.fast_detector,
+        )
+
+    @property
+    def fast_faces(self):
+        return self.fast_detection[0]
+
+    @cached_property
+    def fast_face(self):
+        """Preprocessed crop of the only face the fast detector found, or None"""
+        if len(self.fast_faces) != 1:
+            return None
+        x, y, w, h = self.fast_faces[0]
+        return self.service.preprocess_face(self.image[y:y+h, x:x+w])
+
+    @property
+    def gray(self):
+        return self.detection[1]
+
+    @cached_property
+    def processed_face(self):
+        """Preprocessed crop of the first detected face, or None"""
+        if len(self.faces) == 0:
+            return None
+        x, y, w, h = self.faces[0]
+        return self.service.preprocess_face(self.image[y:y+h, x:x+w])
+
+    @cached_property
+    def thumbnail(self):
+        """Decoded image shrunk to quality.THUMBNAIL_SIDE, or None"""
+        if self.image is None:
+            return None
+        return quality.thumbnail(self.image)
+
+    @cached_property
+    def sharpness(self):
+        """Variance of the Laplacian over the thumbnail (0 if undecodable)"""
+        if self.thumbnail is None:
+            return 0.0
+        return quality.sharpness(self.thumbnail)
+
+    @cached_property
+    def quality_issue(self):
+        """Pre-detection gate: a quality.REJECT_* reason, or None to go on
+
+        Looks only at the thumbnail, so frames that are obviously too
+        small, dark, bright, flat or blurred never reach the cascade.
+        Disabled (always None for decodable frames) by FACE_QUALITY_GATE = False.
+        """
+        if self.image is None:
+            reason = quality.REJECT_UNDECODABLE
+        elif not getattr(settings, 'FACE_QUALITY_GATE', True):
+            return None
+        else:
+            height, width = self.image.shape[:2]
+            reason = quality.assess(
+                self.thumbnail,
+                (height * self.scale, width * self.scale),
+                min_sharpness=getattr(settings, 'FACE_QUALITY_MIN_SHARPNESS', 15.0),
+            )
+        quality.quality_stats.record_check(reason)
+        return reason
+
+    @cached_property
+    def processed_faces(self):
+        """Preprocessed crops of every detected face, in detection order"""
+        return [self.service.preprocess_face(self.image[y:y+h, x:x+w]) for x, y, w, h in self.faces]
+
+
 class OpenCVFaceService:
     """Face recognition service using OpenCV LBPH - FIXED VERSION"""
     
     def __init__(self):
         print("=== INITIALIZING FACE SERVICE ===")
         
-        # Initialize face cascade
+        # Initialize face detector (FACE_DETECTOR_BACKEND)
         try:
-            cascade_path = cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
-            self.face_cascade = cv2.CascadeClassifier(cascade_path)
-            
-            if self.face_cascade.empty():
-                print("Warning: Could not load face cascade")
-                # Try alternative path
-                alt_path = os.path.join(os.path.dirname(cv2.__file__), 'data', 'haarcascade_frontalface_default.xml')
-                self.face_cascade = cv2.CascadeClassifier(alt_path)
-                
-            print(f"✓ Face cascade loaded: {not self.face_cascade.empty()}")
+            self.face_detector = create_detector()
+            print(f"✓ Face detector loaded: {self.face_detector.describe()}")
         except Exception as e:
-            print(f"✗ Error loading face cascade: {e}")
-            self.face_cascade = None
+            print(f"✗ Error loading face detector: {e}")
+            self.face_detector = None
+        
+        # Initialize the face recognizer (FACE_RECOGNIZER_BACKEND)
+        self.face_recognizer = self.create_recognizer()
         
-        # Initialize LBPH face recognizer
-        self.face_recognizer = cv2.face.LBPHFaceRecognizer_create()
+        # Gallery and label maps, replaced as a whole (see GallerySnapshot);
+        # gallery, label_map, reverse_label_map and gallery_version read it
+        self.snapshot = GallerySnapshot.empty()
         
-        # Store training data
+        # Store training data (face crops and labels, for scripts that
+        # retrain from them; verification only reads the snapshot)
         self.faces = []
         self.labels = []
-        self.label_map = {}  # employee_id -> label
-        self.reverse_label_map = {}  # label -> employee_id
+        
+        # Templates persisted as memory-mapped snapshots in the gallery store
+        self.gallery_store = GalleryStore(os.path.join(settings.MEDIA_ROOT, 'models', 'gallery'))
+        
+        # Set when the gallery was loaded but face_recognizer not yet trained
+        # on it; only the 'identify' verification mode needs the recognizer
+        self._recognizer_stale = False
+        
+        # Registrations and removals are journaled; a background checkpoint
+        # folds the journal into a new snapshot every so many records
+        self._write_lock = threading.RLock()
+        # cv2's LBPH appends to its histograms in place, so update() and
+        # train() hold this; verification never reads that recognizer (see
+        # predict())
+        self._recognizer_lock = threading.Lock()
+        self._journal_records = 0
+        self._checkpoint_thread = None
+        
+        # Other worker processes write to the same store; (gallery_version,
+        # _journal_offset) is how far this process has read it. None forces
+        # a full reload.
+        self._journal_offset = 0
+        self._last_reload_check = 0.0
+        self._last_catch_up = 0.0
+        self._reload_thread = None
         
         # Load existing model if available
         self.load_or_create_model()
         print("✓ Face service initialized")
     
+    @property
+    def gallery(self):
+        return self.snapshot.gallery
+    
+    @gallery.setter
+    def gallery(self, gallery):
+        self.publish(gallery=gallery)
+    
+    @property
+    def label_map(self):
+        """employee_id -> label (read-only; assign a new dict to change it)"""
+        return self.snapshot.label_map
+    
+    @label_map.setter
+    def label_map(self, label_map):
+        self.publish(label_map=label_map)
+    
+    @property
+    def reverse_label_map(self):
+        """label -> employee_id (read-only; assign a new dict to change it)"""
+        return self.snapshot.reverse_label_map
+    
+    @reverse_label_map.setter
+    def reverse_label_map(self, reverse_label_map):
+        self.publish(reverse_label_map=reverse_label_map)
+    
+    @property
+    def gallery_version(self):
+        return self.snapshot.version
+    
+    @gallery_version.setter
+    def gallery_version(self, version):
+        self.publish(version=version)
+    
+    def publish(self, **changes):
+        """Swap in a copy of the snapshot with some fields replaced
+        
+        Writers pass every field they change in one call, so readers see
+        either all of a change or none of it.
+        """
+        self.snapshot = self.snapshot.replace(**changes)
+    
+    @cached_property
+    def fast_detector(self):
+        """Detector of the tiered mode's fast path (FACE_FAST_DETECTOR_BACKEND)
+        
+        Falls back to the Haar cascade with the same scan options when the
+        backend's cascade isn't installed.
+        """
+        backend = getattr(settings, 'FACE_FAST_DETECTOR_BACKEND', 'lbp')
+        options = getattr(settings, 'FACE_FAST_DETECTOR_OPTIONS', {'scale_factor': 1.2, 'min_neighbors': 4})
+        try:
+            return create_detector(backend, options, fallback=None)
+        except DetectorUnavailable as e:
+            print(f"✗ {e}; the fast path uses the Haar cascade")
+            return create_detector('haar', {k: v for k, v in options.items() if k != 'cascade'})
+        except Exception as e:
+            print(f"✗ Error loading fast face detector: {e}")
+            return self.face_detector
+    
+    @property
+    def recognizer_backend(self):
+        return self.backend.name
+    
+    @cached_property
+    def backend(self):
+        """RecognizerBackend for FACE_RECOGNIZER_BACKEND and FACE_RECOGNIZER_OPTIONS"""
+        return create_backend()
+    
+    @cached_property
+    def lbp_extractor(self):
+        """Gallery descriptors for backends that don't compute LBPH histograms themselves"""
+        return LBPFeatureExtractor()
+    
+    def create_recognizer(self):
+        """Fresh recognizer for the configured backend"""
+        return self.backend.create()
+    
+    def model_path(self):
+        """Where the configured backend's model is saved
+        
+        For the LBPH backends this is the legacy model file, only read to
+        migrate into the gallery store; Eigen/Fisherfaces models are
+        written here at every checkpoint.
+        """
+        return os.path.join(settings.MEDIA_ROOT, 'models', self.backend.model_file)
+    
+    def same_descriptors(self, backend):
+        """Whether gallery descriptors written under backend can be used as they are"""
+        return backend in RECOGNIZER_BACKENDS and RECOGNIZER_BACKENDS[backend].descriptors == self.backend.descriptors
+    
     def load_or_create_model(self):
-        """Load existing model or create new one"""
-        model_path = os.path.join(settings.MEDIA_ROOT, 'models', 'lbph_model.yml')
+        """Load the current gallery snapshot, migrate a legacy model, or start fresh"""
+        model_path = self.model_path()
         
         try:
             # Create models directory if not exists
             models_dir = os.path.join(settings.MEDIA_ROOT, 'models')
             os.makedirs(models_dir, exist_ok=True)
             
-            if os.path.exists(model_path):
-                print(f"Loading model from {model_path}")
+            snapshot = self.gallery_store.load()
+            if snapshot is not None:
+                self.load_gallery(*snapshot)
+                print(f"✓ Loaded gallery v{self.gallery_version} with {len(self.label_map)} employees, {len(self.gallery)} templates")
+            elif not self.backend.saves_model and os.path.exists(model_path):
+                print(f"Loading legacy model from {model_path}")
                 self.face_recognizer.read(model_path)
                 
                 # Load label mapping
@@ -62,99 +422,574 @@ class OpenCVFaceService:
                     with open(map_path, 'r') as f:
                         data = json.load(f)
                         self.label_map = data.get('label_map', {})
-                        self.reverse_label_map = data.get('reverse_map', {})
+                        self.reverse_label_map = {
+                            int(label): employee_id
+                            for label, employee_id in data.get('reverse_map', {}).items()
+                        }
                         
                     print(f"✓ Loaded model with {len(self.label_map)} employees")
                 else:
                     print("ℹ No label map found, starting fresh")
+                
+                # The legacy model never kept the face crops
+                matrix, labels = self.recognizer_histograms()
+                self.gallery = FaceGallery(matrix, labels, faces=None)
+                self.labels = [int(label) for label in labels]
+                print("ℹ Legacy model will be saved to the gallery store on next save")
             else:
                 print("ℹ No existing model found, will create new one")
+            
+            self.replay_journal()
                 
         except Exception as e:
             print(f"✗ Error loading model: {e}")
             # Create fresh model
-            self.face_recognizer = cv2.face.LBPHFaceRecognizer_create()
+            self.face_recognizer = self.create_recognizer()
     
-    def save_model(self):
-        """Save trained model to disk"""
+    def load_gallery(self, gallery, header):
+        """Adopt a gallery snapshot read from the gallery store"""
+        if not self.same_descriptors(header.get('backend')):
+            if gallery.faces is None:
+                raise ValueError(
+                    f"Gallery was built by the {header.get('backend')} backend "
+                    "and holds no face crops to rebuild it from"
+                )
+            print(f"ℹ Recomputing descriptors for the {self.recognizer_backend} backend")
+            gallery = FaceGallery(
+                self.compute_histograms(gallery.faces), gallery.labels,
+                gallery.faces, gallery.metadata
+            )
+        
+        # replace() lets the identify/ index carry over to the loaded gallery
+        self.publish(
+            gallery=gallery,
+            label_map=header.get('label_map', {}),
+            reverse_label_map={
+                int(label): employee_id for label, employee_id in header.get('reverse_map', {}).items()
+            },
+            version=header['version'],
+        )
+        
+        # Row views into the memory-mapped crops; nothing is copied
+        self.faces = list(gallery.faces) if gallery.faces is not None else []
+        self.labels = [int(label) for label in gallery.labels]
+        
+        self.attach_recognizer()
+    
+    def attach_recognizer(self):
+        """Fresh face_recognizer for the current gallery (trained lazily for cv2)"""
+        recognizer = self.create_recognizer()
+        stale = False
+        if isinstance(recognizer, NumpyLBPHRecognizer):
+            # The numpy backend matches straight against the gallery matrix
+            recognizer.templates = self.gallery.descriptors
+            recognizer.labels = self.gallery.labels
+        elif self.backend.saves_model:
+            # Eigen/Fisherfaces train on the whole gallery; reuse the model
+            # saved at the last checkpoint if it was trained on this one
+            stale = len(self.gallery) > 0 and not self.read_saved_model(recognizer)
+        elif self.gallery.faces is None and os.path.exists(self.model_path()):
+            recognizer.read(self.model_path())
+        else:
+            stale = len(self.gallery) > 0
+        
+        # Raise the stale flag before readers can see the untrained instance
+        if stale:
+            self._recognizer_stale = True
+        self.face_recognizer = recognizer
+        self._recognizer_stale = stale
+    
+    def read_saved_model(self, recognizer):
+        """Load the saved model into recognizer if it covers exactly the current gallery"""
+        path = self.model_path()
+        if not os.path.exists(path):
+            return False
         try:
-            # Create models directory if not exists
-            models_dir = os.path.join(settings.MEDIA_ROOT, 'models')
-            os.makedirs(models_dir, exist_ok=True)
+            recognizer.read(path)
+        except cv2.error as e:
+            print(f"✗ Could not read {path}: {e}")
+            return False
+        return np.array_equal(recognizer.getLabels().reshape(-1), np.asarray(self.gallery.labels))
+    
+    def replay_journal(self):
+        """Apply journal records written since the loaded snapshot"""
+        records, self._journal_offset = self.gallery_store.journal(self.gallery_version).read()
+        for header, arrays in records:
+            self.apply_journal_record(header, arrays)
+        
+        self._journal_records = len(records)
+        if records:
+            self.attach_recognizer()
+            print(f"✓ Replayed {len(records)} journal records on top of gallery v{self.gallery_version}")
+    
+    def stored_gallery_state(self):
+        """(CURRENT version, journal size) on disk: one tiny read and a stat"""
+        version = self.gallery_store.current_version()
+        return version, self.gallery_store.journal(version).size()
+    
+    def gallery_changed(self):
+        """Whether another process saved or journaled since we last read the store"""
+        return self.stored_gallery_state() != (self.gallery_version, self._journal_offset)
+    
+    def reload_gallery(self):
+        """Catch up with the store: replay the journal tail, or load a newer snapshot
+        
+        Every change is a reference swap, so verification running on other
+        threads keeps using the previous gallery until it's replaced.
+        """
+        with self._write_lock:
+            version, _ = self.stored_gallery_state()
             
-            # Save LBPH model
-            model_path = os.path.join(models_dir, 'lbph_model.yml')
-            self.face_recognizer.save(model_path)
+            if version == self.gallery_version and self._journal_offset is not None:
+                journal = self.gallery_store.journal(version)
+                records, self._journal_offset = journal.read(self._journal_offset)
+                for header, arrays in records:
+                    self.apply_journal_record(header, arrays)
+                self._journal_records += len(records)
+                if records:
+                    self.attach_recognizer()
+                    print(f"✓ Reloaded {len(records)} journal records from other workers")
+                return
             
-            # Save label mapping
-            map_path = os.path.join(models_dir, 'label_map.json')
-            with open(map_path, 'w') as f:
-                json.dump({
-                    'label_map': self.label_map,
-                    'reverse_map': self.reverse_label_map
-                }, f, indent=2)
+            snapshot = self.gallery_store.load(version)
+            if snapshot is not None:
+                self.load_gallery(*snapshot)
+            self.replay_journal()
+            print(f"✓ Reloaded gallery v{self.gallery_version} ({len(self.gallery)} templates)")
+    
+    def reload_if_changed(self):
+        """Reload right away if the store moved on (writers call this under the lock)"""
+        if self.gallery_changed():
+            self.reload_gallery()
+    
+    def catch_up(self):
+        """reload_if_changed() for a request naming an employee not loaded here
+        
+        Rate-limited like maybe_reload (FACE_GALLERY_RELOAD_INTERVAL), so a
+        stream of requests for unknown employees costs one store read per
+        interval rather than one each. Returns whether it checked.
+        """
+        interval = getattr(settings, 'FACE_GALLERY_RELOAD_INTERVAL', 2.0)
+        now = time.monotonic()
+        if interval is None or interval < 0 or now - self._last_catch_up < interval:
+            return False
+        self._last_catch_up = now
+        self.reload_if_changed()
+        return True
+    
+    def maybe_reload(self):
+        """Start a background reload if the store changed
+        
+        Checked at most every FACE_GALLERY_RELOAD_INTERVAL seconds, so the
+        per-request cost is a clock read. The request itself is served
+        from the gallery already in memory.
+        """
+        interval = getattr(settings, 'FACE_GALLERY_RELOAD_INTERVAL', 2.0)
+        now = time.monotonic()
+        if interval is None or interval < 0 or now - self._last_reload_check < interval:
+            return
+        self._last_reload_check = now
+        
+        if self._reload_thread is not None and self._reload_thread.is_alive():
+            return
+        try:
+            if not self.gallery_changed():
+                return
+        except Exception as e:
+            print(f"✗ Error checking gallery version: {e}")
+            return
+        
+        self._reload_thread = threading.Thread(
+            target=self.reload_gallery, name='gallery-reload', daemon=True
+        )
+        self._reload_thread.start()
+    
+    def apply_journal_record(self, header, arrays):
+        """Apply one journaled add or remove to the in-memory gallery"""
+        employee_id, label = header['employee_id'], header['label']
+        
+        if header['op'] == 'add':
+            descriptors, faces = arrays
+            rows = header.get('rows')
+            storage = self.gallery.storage
+            if (rows and storage is not None and storage.version == self.gallery_version
+                    and rows[0] == len(self.gallery) and rows[1] <= storage.capacity
+                    and self.same_descriptors(header.get('backend'))):
+                # Written into the shared snapshot files: map, don't copy
+                gallery = self.gallery.grown(rows[1])
+            else:
+                if not self.same_descriptors(header.get('backend')):
+                    descriptors = self.compute_histograms(faces)
+                gallery = self.gallery.append(descriptors, [label] * len(faces), faces)
+            self.publish(
+                gallery=gallery,
+                label_map={**self.label_map, employee_id: label},
+                reverse_label_map={**self.reverse_label_map, label: employee_id},
+            )
+            if len(self.faces) == len(self.labels):
+                # Gallery rows rather than the record's arrays, which pin the
+                # whole journal read buffer
+                self.faces = self.faces + list(gallery.faces[-len(faces):] if gallery.faces is not None else faces)
+            self.labels = self.labels + [label] * len(faces)
+        elif header['op'] == 'remove':
+            self.drop_employee_templates(employee_id, label)
+    
+    def journal_record(self, header, arrays=()):
+        """Append a record to the journal of the current snapshot
+        
+        Costs O(size of the record), independent of the gallery size.
+        Falls back to a full save if the journal can't be written.
+        """
+        try:
+            with self._write_lock:
+                with self.gallery_store.locked():
+                    journal = self.gallery_store.journal()
+                    # If another process appended since we last read, our
+                    # offset no longer marks what we've applied: reload in full
+                    in_step = journal.size() == self._journal_offset
+                    journal.append(header, arrays)
+                    self._journal_offset = journal.size() if in_step else None
+                self._journal_records += 1
+            print(f"✓ Journaled {header['op']} for {header['employee_id']} ({self._journal_records} records since v{self.gallery_version})")
+        except Exception as e:
+            print(f"✗ Error writing gallery journal: {e}")
+            return self.save_model()
+        
+        self.maybe_checkpoint()
+        return True
+    
+    def maybe_checkpoint(self):
+        """Fold the journal into a new snapshot on a background thread once it
+        reaches FACE_GALLERY_CHECKPOINT_RECORDS records
+        
+        A gallery that had to be copied (e.g. after a removal) is private to
+        this process until a snapshot is published again, and every change
+        copies it once more; it's checkpointed sooner, after
+        FACE_GALLERY_PRIVATE_CHECKPOINT_RECORDS records.
+        """
+        limit = getattr(settings, 'FACE_GALLERY_CHECKPOINT_RECORDS', 50)
+        if self.gallery.storage is None and len(self.gallery) > 0:
+            limit = min(limit, getattr(settings, 'FACE_GALLERY_PRIVATE_CHECKPOINT_RECORDS', 10))
+        if self._journal_records < limit:
+            return
+        if self._checkpoint_thread is not None and self._checkpoint_thread.is_alive():
+            return
+        
+        self._checkpoint_thread = threading.Thread(
+            target=self.save_model, name='gallery-checkpoint', daemon=True
+        )
+        self._checkpoint_thread.start()
+    
+    def next_label(self):
+        """Smallest label above every label in use (removed labels aren't reused)"""
+        used = set(self.label_map.values())
+        used.update(int(label) for label in np.unique(self.gallery.labels))
+        return max(used, default=0) + 1
+    
+    def drop_employee_templates(self, employee_id, label):
+        """Remove an employee's label and templates from memory"""
+        self.publish(
+            gallery=self.gallery.without_label(label),
+            label_map={k: v for k, v in self.label_map.items() if k != employee_id},
+            reverse_label_map={k: v for k, v in self.reverse_label_map.items() if k != label},
+        )
+        
+        keep = [i for i, template_label in enumerate(self.labels) if template_label != label]
+        if len(self.faces) == len(self.labels):
+            self.faces = [self.faces[i] for i in keep]
+        self.labels = [self.labels[i] for i in keep]
+    
+    def remove_employee(self, employee_id):
+        """Remove an employee from the model and journal the removal"""
+        with self._write_lock, self.gallery_store.locked():
+            self.reload_if_changed()
+            if employee_id not in self.label_map:
+                return False
+            
+            label = self.label_map[employee_id]
+            self.drop_employee_templates(employee_id, label)
+            self.attach_recognizer()
+            self.journal_record({'op': 'remove', 'employee_id': employee_id, 'label': label})
+        
+        print(f"✓ Removed {employee_id} (label {label}) from the model")
+        return True
+    
+    def clear_gallery(self):
+        """Forget every employee and checkpoint the empty gallery"""
+        with self._write_lock, self.gallery_store.locked():
+            self.publish(gallery=FaceGallery.empty(), label_map={}, reverse_label_map={})
+            self.faces = []
+            self.labels = []
+            self.attach_recognizer()
+            # Whatever other workers stored is being discarded too
+            self.gallery_version, self._journal_offset = self.stored_gallery_state()
+            return self.save_model()
+    
+    def ensure_recognizer(self):
+        """face_recognizer, trained on the gallery crops first if it was loaded lazily"""
+        if self._recognizer_stale:
+            with self._write_lock:
+                if self._recognizer_stale:
+                    print(f"Training recognizer on {len(self.gallery)} gallery templates...")
+                    # Train a new instance, then swap it in
+                    recognizer = self.create_recognizer()
+                    if self.gallery.faces is not None and len(self.gallery) > 0:
+                        recognizer.train(list(self.gallery.faces), np.asarray(self.gallery.labels))
+                    self.face_recognizer = recognizer
+                    self._recognizer_stale = False
+        return self.face_recognizer
+    
+    def train_incremental(self, faces, labels):
+        """Feed only the given new samples to the recognizer"""
+        recognizer = self.face_recognizer
+        if isinstance(recognizer, NumpyLBPHRecognizer):
+            # Its templates are the gallery matrix, already appended to
+            recognizer.templates = self.gallery.descriptors
+            recognizer.labels = self.gallery.labels
+            return
+        
+        if not self.backend.incremental:
+            # Eigen/Fisherfaces have no update(): retrain on the whole
+            # gallery, then swap the new model in
+            recognizer = self.create_recognizer()
+            if self.gallery.faces is not None:
+                recognizer.train(list(self.gallery.faces), np.asarray(self.gallery.labels))
+            self.face_recognizer = recognizer
+            print(f"✓ Retrained {self.recognizer_backend} model on {len(self.gallery)} templates")
+            return
+        
+        try:
+            current_labels = recognizer.getLabels()
+            trained = current_labels is not None and len(current_labels) > 0
+        except cv2.error:
+            trained = False
+        
+        with self._recognizer_lock:
+            if trained:
+                recognizer.update(list(faces), labels)
+                print("✓ Model update complete")
+            else:
+                recognizer.train(list(faces), labels)
+                print("✓ Initial model training complete")
+    
+    def rebuild_model(self):
+        """Recompute every descriptor and retrain the recognizer from the
+        gallery crops, then checkpoint"""
+        with self._write_lock:
+            self.sync_gallery()
+            if self.gallery.faces is None:
+                print("✗ Gallery holds no face crops to rebuild from")
+                return False
+            
+            faces, labels = self.gallery.faces, np.asarray(self.gallery.labels)
+            self.face_recognizer = self.create_recognizer()
+            self._recognizer_stale = False
+            self.gallery = FaceGallery(self.compute_histograms(faces), labels, faces, self.gallery.metadata)
+            if len(self.gallery) > 0:
+                self.train_incremental(faces, labels)
+            print(f"✓ Rebuilt model from {len(self.gallery)} templates")
+            return self.save_model()
+    
+    def sync_gallery(self):
+        """Rebuild the gallery if faces/labels were edited directly
+        
+        create_test_faces.py and rain_real_faces.py rewrite the lists
+        themselves; register_face keeps the gallery in step on its own.
+        """
+        labels = np.asarray(self.labels, dtype=np.int32)
+        if len(self.gallery) == len(labels) and np.array_equal(self.gallery.labels, labels):
+            return
+        
+        faces = np.asarray(self.faces, dtype=np.uint8).reshape(-1, 200, 200)
+        self.gallery = FaceGallery(self.compute_histograms(faces), labels, faces)
+    
+    def save_model(self):
+        """Checkpoint: save the gallery as a new binary snapshot
+        
+        The snapshot includes every journaled change, so the next journal
+        starts empty.
+        """
+        try:
+            with self._write_lock, self.gallery_store.locked():
+                # Don't drop what other workers journaled since we last read
+                self.reload_if_changed()
+                self.sync_gallery()
+                
+                version = self.gallery_store.save(self.gallery, {
+                    'backend': self.recognizer_backend,
+                    'label_map': dict(self.label_map),
+                    'reverse_map': {str(label): employee_id for label, employee_id in self.reverse_label_map.items()},
+                })
+                
+                # Switch to the mapped snapshot so this process shares its
+                # pages with the other workers instead of keeping a copy
+                gallery, _ = self.gallery_store.load(version)
+                self.publish(gallery=gallery, version=version)
+                if gallery.faces is not None:
+                    self.faces = list(gallery.faces)
+                if isinstance(self.face_recognizer, NumpyLBPHRecognizer):
+                    self.face_recognizer.templates = gallery.descriptors
+                    self.face_recognizer.labels = gallery.labels
+                self._journal_records = 0
+                self._journal_offset = 0
+                
+                if self.backend.saves_model:
+                    self.save_trained_model()
             
-            print(f"✓ Model saved to {model_path}")
+            print(f"✓ Gallery v{self.gallery_version} saved to {self.gallery_store.directory}")
             print(f"  Employees in model: {len(self.label_map)}")
+            print(f"  Templates: {len(self.gallery)}")
             return True
         except Exception as e:
             print(f"✗ Error saving model: {e}")
             return False
     
+    def save_trained_model(self):
+        """Write an Eigen/Fisherfaces model trained on the current gallery
+        next to it, so other workers and restarts skip the retraining"""
+        recognizer = self.face_recognizer
+        if self._recognizer_stale or not getattr(recognizer, 'trained', False):
+            return
+        if not np.array_equal(recognizer.getLabels().reshape(-1), np.asarray(self.gallery.labels)):
+            return
+        
+        path = self.model_path()
+        # Written aside and renamed, so readers never load half a file
+        temp_path = f"{path[:-len('.yml')]}.{os.getpid()}.tmp.yml"
+        recognizer.save(temp_path)
+        os.replace(temp_path, path)
+        print(f"✓ Saved {self.recognizer_backend} model to {path}")
+    
+    def base64_to_bytes(self, base64_string):
+        """Strip an optional data URL prefix and decode base64 to raw bytes"""
+        # Remove data URL prefix if present
+        if ',' in base64_string:
+            base64_string = base64_string.split(',')[1]
+        
+        return base64.b64decode(base64_string)
+    
     def base64_to_image(self, base64_string):
-        """Convert base64 string to OpenCV image"""
+        """Convert base64 string to OpenCV (BGR) image"""
         try:
-            # Remove data URL prefix if present
-            if ',' in base64_string:
-                base64_string = base64_string.split(',')[1]
-            
-            # Decode base64
-            image_data = base64.b64decode(base64_string)
-            
-            # Convert to PIL Image
-            image = Image.open(io.BytesIO(image_data))
-            
-            # Convert to RGB if necessary
-            if image.mode != 'RGB':
-                image = image.convert('RGB')
-            
-            # Convert to numpy array (OpenCV format)
-            image_array = np.array(image)
-            
-            # Convert RGB to BGR (OpenCV uses BGR)
-            image_bgr = cv2.cvtColor(image_array, cv2.COLOR_RGB2BGR)
-            
-            return image_bgr
+            image_data = self.base64_to_bytes(base64_string)
+            buffer = np.frombuffer(image_data, dtype=np.uint8)
+            return cv2.imdecode(buffer, cv2.IMREAD_COLOR)
         except Exception as e:
             print(f"✗ Error converting base64 to image: {e}")
             return None
     
-    def detect_faces(self, image):
-        """Detect faces in an image"""
-        if self.face_cascade is None:
-            print("✗ Face cascade not loaded")
-            return [], None
+    def reduced_decode_factor(self, image_data):
+        """Pick the largest JPEG decode reduction that keeps the short side
+        at or above FACE_DECODE_MIN_SIDE pixels"""
+        dimensions = jpeg_dimensions(image_data)
+        if dimensions is None:
+            return 1
+        
+        min_side = getattr(settings, 'FACE_DECODE_MIN_SIDE', 480)
+        short_side = min(dimensions)
+        for factor, _ in REDUCED_GRAYSCALE_MODES:
+            if short_side // factor >= min_side:
+                return factor
+        return 1
+    
+    def image_bytes(self, source):
+        """Raw encoded image bytes from a base64 string, bytes or uploaded file"""
+        if isinstance(source, str):
+            return self.base64_to_bytes(source)
+        if hasattr(source, 'read'):
+            # Django UploadedFile or any file-like object
+            if hasattr(source, 'seek'):
+                source.seek(0)
+            return source.read()
+        return source
+    
+    def decode_image(self, image_base64):
+        """Decode an image straight to grayscale with cv2.imdecode
+        
+        Accepts a base64 string (optionally a data URL), raw bytes from an
+        image/jpeg body, or an uploaded file from a multipart request.
+        Large JPEGs are decoded at 1/2, 1/4 or 1/8 size by libjpeg itself,
+        so the full-resolution frame is never materialized. Returns
+        (gray, scale) where scale is original pixels per decoded pixel, or
+        (None, 1) if the image could not be decoded.
+        """
+        try:
+            image_data = self.image_bytes(image_base64)
+            buffer = np.frombuffer(image_data, dtype=np.uint8)
+            
+            factor = self.reduced_decode_factor(image_data)
+            flag = dict(REDUCED_GRAYSCALE_MODES).get(factor, cv2.IMREAD_GRAYSCALE)
+            gray = cv2.imdecode(buffer, flag)
             
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+            if gray is None:
+                print("✗ Could not decode image")
+                return None, 1
+            return gray, factor
+        except Exception as e:
+            print(f"✗ Error decoding image: {e}")
+            return None, 1
+    
+    def detect_faces(self, image, min_size=(100, 100), max_side=None, detector=None):
+        """Detect faces in a BGR or grayscale image
         
-        # Detect faces
-        faces = self.face_cascade.detectMultiScale(
-            gray,
-            scaleFactor=1.1,
-            minNeighbors=5,
-            minSize=(100, 100),
-            flags=cv2.CASCADE_SCALE_IMAGE
+        The detector (FACE_DETECTOR_BACKEND unless another is given) runs on
+        a copy downscaled so its long side is at most max_side pixels
+        (FACE_DETECTION_MAX_SIDE by default); boxes are mapped back to the
+        coordinates of the input image, which is also what is returned as
+        gray so callers crop at full resolution.
+        """
+        detector = detector or self.face_detector
+        if detector is None:
+            print("✗ Face detector not loaded")
+            return [], None
+        
+        if image.ndim == 2:
+            gray = image
+        else:
+            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        
+        # Downscale to the working resolution
+        if max_side is None:
+            max_side = getattr(settings, 'FACE_DETECTION_MAX_SIDE', 640)
+        long_side = max(gray.shape[:2])
+        ratio = 1.0
+        working = gray
+        if max_side and long_side > max_side:
+            ratio = max_side / long_side
+            working = cv2.resize(gray, None, fx=ratio, fy=ratio, interpolation=cv2.INTER_AREA)
+        
+        # Faces below the detector window can't be found at any resolution
+        window_w, window_h = detector.window_size
+        working_min_size = (
+            max(window_w, int(min_size[0] * ratio)),
+            max(window_h, int(min_size[1] * ratio)),
         )
         
+        # Detect faces
+        faces = detector.detect(working, working_min_size)
+        
+        # Map boxes back to input coordinates
+        if ratio != 1.0 and len(faces) > 0:
+            faces = np.round(np.asarray(faces) / ratio).astype(np.int32)
+        
         return faces, gray
     
+    def analyze_frame(self, image_base64):
+        """Wrap an image in a FaceFrame (frames are passed through as-is)"""
+        if isinstance(image_base64, FaceFrame):
+            return image_base64
+        return FaceFrame(self, image_base64)
+    
     def preprocess_face(self, face_image):
         """Preprocess face for recognition"""
         # Resize to standard size
         resized = cv2.resize(face_image, (200, 200))
         
-        # Convert to grayscale
-        gray = cv2.cvtColor(resized, cv2.COLOR_BGR2GRAY)
+        # Convert to grayscale (frames from decode_image already are)
+        if resized.ndim == 2:
+            gray = resized
+        else:
+            gray = cv2.cvtColor(resized, cv2.COLOR_BGR2GRAY)
         
         # Apply histogram equalization
         equalized = cv2.equalizeHist(gray)
@@ -168,55 +1003,42 @@ class OpenCVFaceService:
         """Extract face from image and return processed face"""
         print("Extracting face features...")
         
-        image = self.base64_to_image(image_base64)
-        if image is None:
+        frame = self.analyze_frame(image_base64)
+        if frame.image is None:
             print("✗ Could not convert image")
             return None
         
-        faces, gray = self.detect_faces(image)
+        print(f"Detected {len(frame.faces)} faces")
         
-        print(f"Detected {len(faces)} faces")
-        
-        if len(faces) == 0:
+        if len(frame.faces) == 0:
             print("✗ No faces detected")
             return None
         
-        # Take the first face
-        x, y, w, h = faces[0]
-        face_roi = image[y:y+h, x:x+w]
-        
-        # Preprocess the face
-        processed_face = self.preprocess_face(face_roi)
+        # Take the first face (cropped and preprocessed once per frame)
+        processed_face = frame.processed_face
         
         print("✓ Face features extracted")
         return processed_face
     
     def register_face(self, employee_id, face_images_base64):
-        """Register multiple faces for an employee"""
+        """Register multiple faces for an employee
+        
+        Accepts base64 strings or FaceFrame objects already analyzed by
+        is_valid_face_image, in which case no image is decoded again.
+        """
         print(f"=== REGISTERING FACE FOR {employee_id} ===")
         print(f"Images received: {len(face_images_base64)}")
         
         try:
-            # Check if employee already has a label
-            if employee_id not in self.label_map:
-                # Assign new label (start from 1)
-                new_label = len(self.label_map) + 1
-                self.label_map[employee_id] = new_label
-                self.reverse_label_map[new_label] = employee_id
-                print(f"Assigned new label {new_label} to {employee_id}")
-            else:
-                print(f"Employee {employee_id} already has label {self.label_map[employee_id]}")
-            
-            label = self.label_map[employee_id]
             registered_faces = []
             successful_extractions = 0
+            new_faces = []
             
             for i, img_base64 in enumerate(face_images_base64):
                 print(f"Processing image {i+1}/{len(face_images_base64)}...")
                 processed_face = self.extract_face_features(img_base64)
                 if processed_face is not None:
-                    self.faces.append(processed_face)
-                    self.labels.append(label)
+                    new_faces.append(processed_face)
                     registered_faces.append(True)
                     successful_extractions += 1
                     print(f"✓ Image {i+1}: Face extracted")
@@ -228,30 +1050,64 @@ class OpenCVFaceService:
             
             # Train or update the model if we have faces
             if successful_extractions > 0:
-                faces_array = np.array(self.faces, dtype=np.uint8)
-                labels_array = np.array(self.labels, dtype=np.int32)
-                
-                print(f"Training with {len(faces_array)} faces, {len(np.unique(labels_array))} labels...")
+                new_faces = np.array(new_faces, dtype=np.uint8)
+                descriptors = self.compute_histograms(new_faces)
                 
-                # Check if model has been trained before
-                try:
-                    # Try to get current labels
-                    current_labels = self.face_recognizer.getLabels()
-                    if current_labels is None or len(current_labels) == 0:
-                        # Initial training
-                        self.face_recognizer.train(faces_array, labels_array)
-                        print("✓ Initial model training complete")
+                # Extraction and descriptors above ran without the lock;
+                # verification keeps using the previous gallery until the
+                # new one is swapped in below
+                with self._write_lock, self.gallery_store.locked():
+                    # Pick up other workers' registrations before choosing a label
+                    self.reload_if_changed()
+                    
+                    # Check if employee already has a label
+                    if employee_id not in self.label_map:
+                        # Assign new label (start from 1)
+                        label = self.next_label()
+                        print(f"Assigned new label {label} to {employee_id}")
                     else:
-                        # Update existing model
-                        self.face_recognizer.update(faces_array, labels_array)
-                        print("✓ Model update complete")
-                except:
-                    # Initial training
-                    self.face_recognizer.train(faces_array, labels_array)
-                    print("✓ Initial model training complete")
-                
-                # Save the updated model
-                self.save_model()
+                        label = self.label_map[employee_id]
+                        print(f"Employee {employee_id} already has label {label}")
+                    
+                    # Bring a lazily loaded recognizer up to date first, so
+                    # the new samples are only ever fed to it once
+                    self.ensure_recognizer()
+                    
+                    # Swap in the gallery with the new templates, then the
+                    # label maps (copied, so readers never see them mid-edit)
+                    new_labels = np.full(len(new_faces), label, dtype=np.int32)
+                    gallery = self.gallery
+                    start = len(gallery)
+                    rows = None
+                    if gallery.storage is not None and gallery.storage.version == self.gallery_version:
+                        # Write into the snapshot's spare rows, shared by every worker
+                        grown = self.gallery_store.append_in_place(gallery, descriptors, new_labels, new_faces)
+                        if grown is not None:
+                            rows = [start, len(grown)]
+                            gallery = grown
+                    if rows is None:
+                        gallery = gallery.append(descriptors, new_labels, new_faces)
+                    self.publish(
+                        gallery=gallery,
+                        label_map={**self.label_map, employee_id: label},
+                        reverse_label_map={**self.reverse_label_map, label: employee_id},
+                    )
+                    self.faces = self.faces + list(gallery.faces[start:] if gallery.faces is not None else new_faces)
+                    self.labels = self.labels + [label] * len(new_faces)
+                    
+                    print(f"Training with {len(new_faces)} new faces ({len(self.gallery)} templates in total)...")
+                    self.train_incremental(new_faces, new_labels)
+                    
+                    # Journal the new templates instead of rewriting the gallery
+                    # The record carries the arrays too, so it can be replayed
+                    # on top of a snapshot that doesn't hold the rows
+                    self.journal_record({
+                        'op': 'add',
+                        'employee_id': employee_id,
+                        'label': label,
+                        'backend': self.recognizer_backend,
+                        'rows': rows,
+                    }, [descriptors, new_faces])
                 
                 print(f"✓ Face registration complete for {employee_id}")
                 print(f"  Label: {label}")
@@ -267,44 +1123,155 @@ class OpenCVFaceService:
             traceback.print_exc()
             return []
     
+    def recognizer_histograms(self):
+        """(matrix, labels) of every histogram held by face_recognizer"""
+        recognizer = self.face_recognizer
+        if isinstance(recognizer, NumpyLBPHRecognizer):
+            # Already one contiguous matrix
+            return recognizer.templates, recognizer.labels
+        
+        try:
+            histograms = recognizer.getHistograms()
+            labels = recognizer.getLabels()
+        except cv2.error:
+            histograms, labels = [], None
+        
+        if labels is None or len(histograms) == 0:
+            return np.empty((0, 0), dtype=np.float32), np.empty(0, dtype=np.int32)
+        matrix = np.vstack([h.reshape(1, -1) for h in histograms]).astype(np.float32)
+        return matrix, np.asarray(labels, dtype=np.int32).reshape(-1)
+    
+    def predict(self, face, snapshot=None):
+        """(label, distance) of the nearest template, like the recognizer's predict()
+        
+        For the LBPH backends the nearest template is found in the
+        snapshot's gallery histograms, the same ones the recognizer holds.
+        The snapshot is published by swapping a reference, so concurrent
+        requests need no lock, unlike cv2's recognizer, which update()
+        grows in place. Eigen/Fisherfaces models are only ever replaced
+        whole, so they're asked directly.
+        """
+        if not self.backend.matches_templates:
+            return self.ensure_recognizer().predict(face)
+        
+        gallery = (snapshot or self.snapshot).gallery
+        if len(gallery) == 0:
+            return -1, float('inf')
+        distances = chi_square_distances(self.compute_histogram(face), gallery.descriptors)[0]
+        best = int(np.argmin(distances))
+        return int(gallery.labels[best]), float(distances[best])
+    
+    def employee_templates(self, label, snapshot=None):
+        """Gallery histograms stored for one label, as a (k, bins) float32 array"""
+        return (snapshot or self.snapshot).templates(label)
+    
+    def compute_histograms(self, faces):
+        """(n, bins) LBPH histograms of preprocessed faces, as the recognizer computes them"""
+        recognizer = self.face_recognizer
+        if isinstance(recognizer, NumpyLBPHRecognizer):
+            return recognizer.extractor.compute(np.asarray(faces))
+        if self.backend.descriptors == 'numpy':
+            return self.lbp_extractor.compute(np.asarray(faces))
+        
+        if len(faces) == 0:
+            return np.empty((0, 0), dtype=np.float32)
+        
+        probe_model = cv2.face.LBPHFaceRecognizer_create(
+            recognizer.getRadius(), recognizer.getNeighbors(),
+            recognizer.getGridX(), recognizer.getGridY()
+        )
+        probe_model.train(list(faces), np.zeros(len(faces), dtype=np.int32))
+        return np.vstack([h.reshape(1, -1) for h in probe_model.getHistograms()]).astype(np.float32)
+    
+    def compute_histogram(self, face):
+        """(1, bins) LBPH histogram of a single preprocessed face"""
+        return self.compute_histograms([face])
+    
+    def match_templates(self, probe, templates, threshold=MATCH_THRESHOLD):
+        """Smallest chi-square distance from probe to templates
+        
+        Stops at the first template that already meets the threshold, since
+        a 1:1 decision only needs one sufficiently close sample.
+        """
+        max_distance = self.backend.distance_scale * (1 - threshold)
+        best = float('inf')
+        for template in templates:
+            distance = cv2.compareHist(probe, template.reshape(1, -1), cv2.HISTCMP_CHISQR_ALT)
+            best = min(best, distance)
+            if best <= max_distance:
+                break
+        return best
+    
     def verify_face(self, employee_id, face_image_base64):
-        """Verify if face matches the employee - FIXED VERSION"""
+        """Verify if face matches the employee - FIXED VERSION
+        
+        face_image_base64 may also be a FaceFrame shared with
+        is_valid_face_image. With FACE_VERIFICATION_MODE = 'one_to_one'
+        (the default) the probe is only compared with the claimed
+        employee's own templates; 'identify' runs a full predict of the
+        configured recognizer over every employee and requires the best
+        match to be the claimed one. 'tiered' tries verify_fast first and
+        runs the one_to_one pipeline only if that is inconclusive; the
+        frame's tier says which one decided.
+        """
         print(f"=== VERIFYING FACE FOR {employee_id} ===")
+        self.maybe_reload()
+        
+        # One consistent view of the gallery for the whole request
+        snapshot = self.snapshot
+        mode = self.verification_mode
+        frame = self.analyze_frame(face_image_base64) if mode == 'tiered' else face_image_base64
         
         try:
+            # Someone registered in another worker moments ago: catch up now
+            # rather than fail until the background reload gets to it
+            if employee_id not in snapshot.label_map and self.catch_up():
+                snapshot = self.snapshot
+            
             # Check if employee is in our model
-            if employee_id not in self.label_map:
+            if employee_id not in snapshot.label_map:
                 print(f"✗ Employee {employee_id} not in model")
                 return False, 0.0
             
+            # Get employee's label
+            label = snapshot.label_map[employee_id]
+            
+            if mode == 'tiered':
+                result = self.verify_fast(employee_id, label, frame, snapshot)
+                if result is not None:
+                    frame.tier = 'fast'
+                    return result
+            if isinstance(frame, FaceFrame):
+                frame.tier = 'full'
+            
             # Extract face features
-            test_face = self.extract_face_features(face_image_base64)
+            test_face = self.extract_face_features(frame)
             if test_face is None:
                 print("✗ Could not extract face from image")
                 return False, 0.0
             
-            # Get employee's label
-            label = self.label_map[employee_id]
+            if mode in ('one_to_one', 'tiered'):
+                return self.verify_one_to_one(employee_id, label, test_face, snapshot)
             
-            # Predict using LBPH
-            predicted_label, confidence = self.face_recognizer.predict(test_face)
+            # Predict using the configured recognizer
+            predicted_label, confidence = self.predict(test_face, snapshot)
             
-            # LBPH returns distance (lower is better)
-            # Convert to confidence score (0-100)
-            confidence_score = max(0, 100 - confidence) / 100.0
+            # The recognizer returns a distance (lower is better)
+            # Convert to confidence score (0-1) on the backend's scale
+            confidence_score = self.backend.confidence(confidence)
             
             print(f"Predicted label: {predicted_label} (expected: {label})")
-            print(f"LBPH distance: {confidence}")
+            print(f"{self.recognizer_backend} distance: {confidence}")
             print(f"Confidence score: {confidence_score:.2f}")
             
             # Get predicted employee
-            predicted_employee = self.reverse_label_map.get(predicted_label, None)
+            predicted_employee = snapshot.employee_for_label(predicted_label)
             
             print(f"Predicted employee: {predicted_employee}")
             print(f"Expected employee: {employee_id}")
             
             # Check if prediction matches
-            match = (predicted_employee == employee_id) and (confidence_score >= 0.6)
+            match = (predicted_employee == employee_id) and (confidence_score >= MATCH_THRESHOLD)
             
             if match:
                 print(f"✓ Face verification PASSED for {employee_id}")
@@ -312,7 +1279,7 @@ class OpenCVFaceService:
                 print(f"✗ Face verification FAILED for {employee_id}")
                 if predicted_employee != employee_id:
                     print(f"  Reason: Predicted different employee ({predicted_employee})")
-                if confidence_score < 0.6:
+                if confidence_score < MATCH_THRESHOLD:
                     print(f"  Reason: Confidence too low ({confidence_score:.2f})")
             
             return match, confidence_score
@@ -323,44 +1290,353 @@ class OpenCVFaceService:
             traceback.print_exc()
             return False, 0.0
     
+    @property
+    def verification_mode(self):
+        return getattr(settings, 'FACE_VERIFICATION_MODE', 'one_to_one')
+    
+    def verify_fast(self, employee_id, label, frame, snapshot=None):
+        """Fast tier: the fast detector's crop against the employee's mean template
+        
+        One histogram comparison instead of one per template, on a face
+        found at FACE_FAST_DETECTION_MAX_SIDE. Returns (True, confidence)
+        when the confidence reaches FACE_FAST_ACCEPT_CONFIDENCE, or None
+        when the full pipeline has to decide.
+        """
+        backend = self.backend
+        if not backend.matches_templates:
+            return None
+        
+        face = frame.fast_face
+        mean = (snapshot or self.snapshot).mean_template(label)
+        if face is None or mean is None:
+            return None
+        
+        distance = cv2.compareHist(self.compute_histogram(face), mean, cv2.HISTCMP_CHISQR_ALT)
+        confidence_score = backend.confidence(distance)
+        print(f"Fast tier: distance to mean template {distance:.2f}, confidence {confidence_score:.2f}")
+        
+        if confidence_score < getattr(settings, 'FACE_FAST_ACCEPT_CONFIDENCE', 0.8):
+            print("  Inconclusive, falling back to the full pipeline")
+            return None
+        
+        print(f"✓ Face verification PASSED for {employee_id} (fast tier)")
+        return True, confidence_score
+    
+    def verify_one_to_one(self, employee_id, label, test_face, snapshot=None):
+        """Compare a preprocessed face with one employee's templates only"""
+        backend = self.backend
+        if not backend.matches_templates:
+            # Eigen/Fisherfaces compare in their own subspace
+            distance = self.ensure_recognizer().label_distance(test_face, label)
+            confidence_score = backend.confidence(distance)
+            match = confidence_score >= MATCH_THRESHOLD
+            print(f"1:1 {backend.name} distance: {distance}")
+        else:
+            templates = self.employee_templates(label, snapshot)
+            if templates is None or len(templates) == 0:
+                print(f"✗ No templates stored for {employee_id}")
+                return False, 0.0
+            
+            probe = self.compute_histogram(test_face)
+            distance = self.match_templates(probe, templates)
+            confidence_score = backend.confidence(distance)
+            match = confidence_score >= MATCH_THRESHOLD
+            print(f"1:1 LBPH distance: {distance} ({len(templates)} templates)")
+        
+        print(f"Confidence score: {confidence_score:.2f}")
+        
+        if match:
+            print(f"✓ Face verification PASSED for {employee_id}")
+        else:
+            print(f"✗ Face verification FAILED for {employee_id}")
+            print(f"  Reason: Confidence too low ({confidence_score:.2f})")
+        
+        return match, confidence_score
+    
+    def verify_burst(self, employee_id, face_images_base64, max_frames=None):
+        """Verify a short burst of captures of one check-in
+        
+        Frames are tried sharpest first (ranked on a small copy, before any
+        detection) and the first one that passes ends the burst; at most
+        max_frames (FACE_BURST_MAX_FRAMES) are validated and verified.
+        Returns (is_verified, confidence_score, frames_evaluated, source):
+        the best confidence seen, and the source of the frame it came from.
+        """
+        if max_frames is None:
+            max_frames = getattr(settings, 'FACE_BURST_MAX_FRAMES', 3)
+        
+        frames = [self.analyze_frame(image) for image in face_images_base64]
+        frames.sort(key=lambda frame: frame.sharpness, reverse=True)
+        
+        best_confidence = 0.0
+        best_source = frames[0].source if frames else None
+        frames_evaluated = 0
+        for frame in frames[:max(1, max_frames)]:
+            frames_evaluated += 1
+            if not self.is_valid_face_image(frame):
+                continue
+            
+            is_verified, confidence_score = self.verify_face(employee_id, frame)
+            if confidence_score > best_confidence:
+                best_confidence, best_source = confidence_score, frame.source
+            if is_verified:
+                print(f"✓ Burst verified on frame {frames_evaluated} of {len(frames)}")
+                return True, confidence_score, frames_evaluated, frame.source
+        
+        print(f"✗ Burst not verified after {frames_evaluated} of {len(frames)} frames")
+        return False, best_confidence, frames_evaluated, best_source
+    
+    def employee_for_label(self, label, snapshot=None):
+        """employee_id for a label (label_map.json stores the keys as strings)"""
+        return (snapshot or self.snapshot).employee_for_label(label)
+    
+    def face_index(self, snapshot=None):
+        """FaceIndex over every gallery template, built once per gallery"""
+        return (snapshot or self.snapshot).index(
+            components=getattr(settings, 'FACE_INDEX_COMPONENTS', 64),
+            shortlist=getattr(settings, 'FACE_INDEX_SHORTLIST', 200),
+        )
+    
+    def histogram_confidence(self, distance):
+        """Confidence score for a chi-square distance between LBPH histograms
+        
+        The LBPH backends map it on their own (configurable) scale. The
+        Eigen/Fisherfaces scales are for pixel distances, so with those the
+        gallery histograms fall back to the default LBPH scale.
+        """
+        if self.backend.matches_templates:
+            return self.backend.confidence(distance)
+        return distance_to_confidence(distance)
+    
+    def identify_face(self, face_image_base64, top_k=5):
+        """Top-k candidate employees for a face, without a claimed identity
+        
+        Returns a list of {employee_id, label, distance, confidence_score}
+        dicts, best first, or None if no face could be extracted.
+        """
+        print("=== IDENTIFYING FACE ===")
+        self.maybe_reload()
+        
+        test_face = self.extract_face_features(face_image_base64)
+        if test_face is None:
+            print("✗ Could not extract face from image")
+            return None
+        
+        snapshot = self.snapshot
+        index = self.face_index(snapshot)
+        probe = self.compute_histogram(test_face)
+        
+        candidates = []
+        for label, distance in index.search(probe, top_k=top_k):
+            employee_id = snapshot.employee_for_label(label)
+            if employee_id is None:
+                # Label of a reset employee still held by the recognizer
+                continue
+            candidates.append({
+                'employee_id': employee_id,
+                'label': label,
+                'distance': distance,
+                'confidence_score': self.histogram_confidence(distance),
+            })
+        
+        print(f"Searched {len(index)} templates, {len(candidates)} candidates")
+        return candidates
+    
+    def face_quality_issue(self, frame, box):
+        """Why one detected face is unusable ('face_too_small', 'face_too_dark'
+        or 'face_too_bright'), or None"""
+        x, y, w, h = box
+        # The decoded frame is already grayscale; reading it (not frame.gray)
+        # doesn't force the full detection for a fast-path box
+        face_region = frame.image[y:y+h, x:x+w]
+        
+        # Size limits are in original pixels, not reduced-decode pixels
+        w, h = w * frame.scale, h * frame.scale
+        print(f"Face size: {w}x{h}")
+        
+        # Check face size (should be reasonable)
+        if w < quality.MIN_FACE_SIDE or h < quality.MIN_FACE_SIDE:
+            print(f"✗ Face too small: {w}x{h}")
+            return 'face_too_small'
+        
+        # Check brightness (avoid too dark or too bright)
+        print(f"Brightness: {np.mean(face_region):.1f}")
+        issue = quality.face_brightness_issue(face_region)
+        if issue is not None:
+            print(f"✗ {issue.replace('_', ' ').capitalize()}")
+        return issue
+    
+    def identify_faces(self, face_image_base64, top_k=1):
+        """Identify every face in one frame (group check-in at a kiosk)
+        
+        Returns one dict per detected face, in detection order: its box in
+        original pixels, 'issue' if it failed the quality checks, and the
+        top_k 'candidates' as identify_face returns them. All usable faces
+        are turned into histograms in one batch and searched together.
+        Returns None if the image could not be decoded, and no faces if the
+        frame fails the quality gate (the reason is left in frame.rejection).
+        """
+        print("=== IDENTIFYING FACES (GROUP) ===")
+        self.maybe_reload()
+        
+        frame = self.analyze_frame(face_image_base64)
+        if frame.image is None:
+            print("✗ Could not convert image")
+            return None
+        
+        if frame.quality_issue is not None:
+            print(f"✗ Rejected before detection: {frame.quality_issue}")
+            frame.rejection = frame.quality_issue
+            return []
+        
+        results = []
+        usable = []
+        for i, box in enumerate(frame.faces):
+            issue = self.face_quality_issue(frame, box)
+            results.append({
+                'box': [int(v * frame.scale) for v in box],
+                'issue': issue,
+                'candidates': [],
+            })
+            if issue is None:
+                usable.append(i)
+        
+        print(f"Detected {len(results)} faces, {len(usable)} usable")
+        if not usable:
+            return results
+        
+        snapshot = self.snapshot
+        index = self.face_index(snapshot)
+        probes = self.compute_histograms([frame.processed_faces[i] for i in usable])
+        
+        for i, matches in zip(usable, index.search_batch(probes, top_k=top_k)):
+            for label, distance in matches:
+                employee_id = snapshot.employee_for_label(label)
+                if employee_id is None:
+                    continue
+                results[i]['candidates'].append({
+                    'employee_id': employee_id,
+                    'label': label,
+                    'distance': distance,
+                    'confidence_score': self.histogram_confidence(distance),
+                })
+        
+        return results
+    
+    def preflight(self, image_base64, capture_width=None):
+        """Capture guidance from a small thumbnail, before the real upload
+        
+        Detection runs on a quality.THUMBNAIL_SIDE copy (clients are expected
+        to send about that size), so the whole check takes a few
+        milliseconds. Face size is judged relative to the frame, since the
+        full-resolution capture will be the same shot at a larger scale:
+        given capture_width (the width the app will upload), the face must
+        come out at the quality.MIN_FACE_SIDE pixels is_valid_face_image
+        requires, otherwise at least 15% of the frame width. Lighting uses
+        the quality module's limits, like the gate and face_quality_issue.
+        Returns a dict of guidance codes; 'ready' is True when nothing
+        needs fixing.
+        """
+        frame = self.analyze_frame(image_base64)
+        if frame.image is None:
+            return {'ready': False, 'face_present': False, 'issues': [quality.REJECT_UNDECODABLE]}
+        
+        thumb = frame.thumbnail
+        height, width = thumb.shape[:2]
+        # Only the cascade window limits how small a face can be found here
+        faces, _ = self.detect_faces(thumb, min_size=(1, 1))
+        
+        issues = []
+        # The same limits the quality gate and is_valid_face_image apply
+        lighting = quality.exposure_issue(thumb) or 'ok'
+        
+        min_sharpness = getattr(settings, 'FACE_QUALITY_MIN_SHARPNESS', 15.0)
+        sharpness = quality.sharpness(thumb)
+        if min_sharpness and sharpness < min_sharpness:
+            issues.append(quality.REJECT_BLURRY)
+        
+        result = {
+            'face_present': len(faces) > 0,
+            'face_count': len(faces),
+            'face_box': None,
+            'face_fraction': None,
+            'face_size': None,
+            'lighting': lighting,
+            'sharpness': round(sharpness, 1),
+        }
+        
+        if len(faces) == 0:
+            issues.append('no_face')
+        elif len(faces) > 1:
+            issues.append('multiple_faces')
+        
+        if len(faces) > 0:
+            # Largest face, as fractions of the frame
+            x, y, w, h = max(faces, key=lambda box: box[2] * box[3])
+            fraction = w / width
+            result['face_box'] = [round(x / width, 3), round(y / height, 3),
+                                  round(w / width, 3), round(h / height, 3)]
+            result['face_fraction'] = round(fraction, 3)
+            if capture_width:
+                # Thumbnail boxes are coarse; allow 10% under the minimum
+                too_small = fraction * capture_width < 0.9 * quality.MIN_FACE_SIDE
+            else:
+                too_small = fraction < 0.15
+            if too_small:
+                result['face_size'] = 'too_small'
+                issues.append('move_closer')
+            elif fraction > 0.8:
+                result['face_size'] = 'too_large'
+                issues.append('move_back')
+            else:
+                result['face_size'] = 'ok'
+            
+            # Face brightness, with the same limits as is_valid_face_image
+            lighting = quality.face_brightness_issue(thumb[y:y+h, x:x+w]) or lighting
+            result['lighting'] = lighting
+        
+        if lighting != 'ok':
+            issues.append(lighting)
+        
+        result['issues'] = issues
+        result['ready'] = not issues
+        return result
+    
     def is_valid_face_image(self, image_base64):
-        """Check if image contains exactly one clear face"""
+        """Check if image contains exactly one clear face
+        
+        The thumbnail quality gate runs first; only frames that pass it pay
+        for the cascade. On rejection the reason is left in frame.rejection.
+        """
         print("Validating face image...")
         
         try:
-            image = self.base64_to_image(image_base64)
-            if image is None:
-                print("✗ Invalid image")
+            frame = self.analyze_frame(image_base64)
+            
+            # Cheap checks on the thumbnail before detection
+            issue = frame.quality_issue
+            if issue is not None:
+                print(f"✗ Rejected before detection: {issue}")
+                frame.rejection = issue
                 return False
             
-            faces, gray = self.detect_faces(image)
+            if self.verification_mode == 'tiered' and len(frame.fast_faces) == 1:
+                # One face from the fast detector is enough; anything else
+                # is left to the full-resolution cascade
+                faces = frame.fast_faces
+            else:
+                faces = frame.faces
             
             print(f"Faces detected: {len(faces)}")
             
             if len(faces) != 1:
                 print(f"✗ Expected 1 face, found {len(faces)}")
+                frame.rejection = 'no_face' if len(faces) == 0 else 'multiple_faces'
                 return False
             
             # Check face quality (size, brightness)
-            x, y, w, h = faces[0]
-            face_region = gray[y:y+h, x:x+w]
-            
-            print(f"Face size: {w}x{h}")
-            
-            # Check face size (should be reasonable)
-            if w < 100 or h < 100:
-                print(f"✗ Face too small: {w}x{h}")
-                return False
-            
-            # Check brightness (avoid too dark or too bright)
-            brightness = np.mean(face_region)
-            print(f"Brightness: {brightness:.1f}")
-            
-            if brightness < 30:
-                print("✗ Face too dark")
-                return False
-            if brightness > 220:
-                print("✗ Face too bright")
+            frame.rejection = self.face_quality_issue(frame, faces[0])
+            if frame.rejection:
                 return False
             
             print("✓ Valid face image")
@@ -370,5 +1646,58 @@ class OpenCVFaceService:
             print(f"✗ Error validating face image: {e}")
             return False
 
-# Create global instance
-face_service = OpenCVFaceService()
\ No newline at end of file
+    def warm_up(self):
+        """Build the caches the first check-in would otherwise pay for"""
+        self.employee_templates(0)
+        if getattr(settings, 'FACE_VERIFICATION_MODE', 'one_to_one') == 'identify':
+            self.ensure_recognizer()
+
+
+class LazyFaceService:
+    """Stand-in for the global service that builds it on first use
+    
+    Importing views (and so every manage.py command, migration and test
+    run) no longer loads the cascade and the gallery. Attribute reads and
+    writes are forwarded to the real OpenCVFaceService.
+    """
+    
+    def __init__(self, factory=OpenCVFaceService):
+        object.__setattr__(self, '_factory', factory)
+        object.__setattr__(self, '_service', None)
+        object.__setattr__(self, '_lock', threading.Lock())
+    
+    @property
+    def is_initialized(self):
+        return self._service is not None
+    
+    def get_service(self):
+        """The real service, created on the first call (thread-safe)"""
+        service = self._service
+        if service is None:
+            with self._lock:
+                service = self._service
+                if service is None:
+                    service = self._factory()
+                    object.__setattr__(self, '_service', service)
+        return service
+    
+    def __getattr__(self, name):
+        return getattr(self.get_service(), name)
+    
+    def __setattr__(self, name, value):
+        setattr(self.get_service(), name, value)
+
+
+def warm_up_face_service():
+    """Create and warm the global service; call from WSGI/ASGI startup so
+    the first request doesn't pay for it"""
+    if not getattr(settings, 'FACE_SERVICE_WARM_UP', True):
+        return
+    try:
+        face_service.get_service().warm_up()
+    except Exception as e:
+        print(f"✗ Error warming up face service: {e}")
+
+
+# Create global instance (built lazily on first use)
+face_service = LazyFaceService()
\ No newline at end of file
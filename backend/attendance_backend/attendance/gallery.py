@@ -0,0 +1,520 @@
+# attendance/gallery.py - Binary face gallery persisted as memory-mapped NumPy files
+import json
+import os
+import shutil
+import struct
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from types import MappingProxyType
+
+import numpy as np
+
+from .face_index import FaceIndex
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process dev server only
+    fcntl = None
+
+
+# 2: arrays are preallocated past header['count'] so rows can be appended
+# in place; version 1 snapshots (no spare rows) still load
+GALLERY_FORMAT_VERSION = 2
+
+# Per-template metadata stored alongside the descriptor matrix
+TEMPLATE_METADATA_DTYPE = np.dtype([
+    ('template_id', '<i8'),
+    ('label', '<i4'),
+    ('added_at', '<f8'),
+])
+
+
+class FaceGallery:
+    """Every registered template: descriptors, labels, crops and metadata
+
+    descriptors is an (N, D) float32 matrix, labels an (N,) int32 vector,
+    faces the (N, 200, 200) uint8 preprocessed crops (None when the gallery
+    was migrated from a model that never kept them) and metadata an (N,)
+    TEMPLATE_METADATA_DTYPE array. Loaded galleries hold read-only memory
+    maps, so append() returns a new gallery instead of modifying this one.
+
+    storage is set when the arrays are the first len(self) rows of a stored
+    snapshot; grown() then maps in rows appended to it without copying.
+    """
+
+    def __init__(self, descriptors, labels, faces=None, metadata=None, storage=None):
+        self.descriptors = descriptors
+        self.labels = labels
+        self.faces = faces
+        if metadata is None:
+            metadata = np.zeros(len(labels), dtype=TEMPLATE_METADATA_DTYPE)
+            metadata['template_id'] = np.arange(len(labels))
+            metadata['label'] = labels
+            metadata['added_at'] = time.time()
+        self.metadata = metadata
+        self.storage = storage
+
+    @classmethod
+    def empty(cls, dimensions=0):
+        return cls(
+            np.empty((0, dimensions), dtype=np.float32),
+            np.empty(0, dtype=np.int32),
+            np.empty((0, 200, 200), dtype=np.uint8),
+        )
+
+    def __len__(self):
+        return len(self.labels)
+
+    @property
+    def dimensions(self):
+        return self.descriptors.shape[1] if self.descriptors.ndim == 2 else 0
+
+    def next_template_id(self):
+        return int(self.metadata['template_id'].max()) + 1 if len(self) else 0
+
+    def new_metadata(self, labels):
+        """Metadata rows for templates appended after this gallery"""
+        metadata = np.zeros(len(labels), dtype=TEMPLATE_METADATA_DTYPE)
+        metadata['template_id'] = self.next_template_id() + np.arange(len(labels))
+        metadata['label'] = labels
+        metadata['added_at'] = time.time()
+        return metadata
+
+    def grown(self, count):
+        """This gallery extended to the first count rows of its snapshot"""
+        storage = self.storage
+        return FaceGallery(
+            storage.descriptors[:count], storage.labels[:count],
+            storage.faces[:count] if storage.faces is not None else None,
+            storage.metadata[:count], storage,
+        )
+
+    def append(self, descriptors, labels, faces):
+        """New gallery with extra templates appended (copies the arrays)"""
+        descriptors = np.asarray(descriptors, dtype=np.float32)
+        labels = np.asarray(labels, dtype=np.int32).reshape(-1)
+        metadata = self.new_metadata(labels)
+
+        if len(self) == 0:
+            existing = np.empty((0, descriptors.shape[1]), dtype=np.float32)
+        else:
+            existing = self.descriptors
+
+        if self.faces is not None and faces is not None:
+            faces = np.concatenate([self.faces, np.asarray(faces, dtype=np.uint8)])
+        else:
+            faces = None
+
+        return FaceGallery(
+            np.ascontiguousarray(np.vstack([existing, descriptors])),
+            np.concatenate([self.labels, labels]),
+            faces,
+            np.concatenate([self.metadata, metadata]),
+        )
+
+    def without_label(self, label):
+        """New gallery without any template of label"""
+        keep = np.asarray(self.labels) != label
+        return FaceGallery(
+            np.ascontiguousarray(self.descriptors[keep]),
+            np.asarray(self.labels)[keep],
+            self.faces[keep] if self.faces is not None else None,
+            self.metadata[keep],
+        )
+
+
+class GallerySnapshot:
+    """Everything verification reads, published as one immutable object
+
+    Readers take service.snapshot once and use it for the whole request, so
+    they never see a gallery from one registration and label maps from
+    another, and they never need a lock. Writers build a new snapshot with
+    replace() and swap the reference. Lookup structures derived from the
+    gallery are built lazily, once per gallery.
+    """
+
+    def __init__(self, gallery, label_map, reverse_label_map, version=0, _derived=None):
+        self.gallery = gallery
+        self.label_map = MappingProxyType(dict(label_map))  # employee_id -> label
+        self.reverse_label_map = MappingProxyType(dict(reverse_label_map))  # label -> employee_id
+        self.version = version
+        # Caches that only depend on the gallery, shared by replace()
+        self._derived = _derived if _derived is not None else {}
+
+    @classmethod
+    def empty(cls):
+        return cls(FaceGallery.empty(), {}, {})
+
+    def replace(self, **changes):
+        """New snapshot with some of gallery, label_map, reverse_label_map, version changed"""
+        fields = {
+            'gallery': self.gallery,
+            'label_map': self.label_map,
+            'reverse_label_map': self.reverse_label_map,
+            'version': self.version,
+        }
+        fields.update(changes)
+        if fields['gallery'] is self.gallery:
+            derived = self._derived
+        else:
+            # A new gallery starts its indexes from this one's fits
+            derived = {'index_fits': self.index_fits()}
+        return GallerySnapshot(_derived=derived, **fields)
+
+    def index_fits(self):
+        """{index key: IndexFit} of the indexes built here, or inherited if not built"""
+        fits = dict(self._derived.get('index_fits', {}))
+        for key, value in self._derived.items():
+            if isinstance(key, tuple) and key[0] == 'index' and value.fit() is not None:
+                fits[key] = value.fit()
+        return fits
+
+    def employee_for_label(self, label):
+        """employee_id for a label (label_map.json stores the keys as strings)"""
+        return self.reverse_label_map.get(label, self.reverse_label_map.get(str(label)))
+
+    def template_rows(self):
+        """{label: gallery row indices}
+
+        Row indices only: slicing the (shared) matrix per label would give
+        every worker its own copy of the whole gallery.
+        """
+        if 'rows' not in self._derived:
+            labels = np.asarray(self.gallery.labels)
+            order = np.argsort(labels, kind='stable')
+            unique, starts = np.unique(labels[order], return_index=True)
+            self._derived['rows'] = {
+                int(label): rows for label, rows in zip(unique, np.split(order, starts[1:]))
+            }
+        return self._derived['rows']
+
+    def templates(self, label):
+        """(k, bins) descriptors stored for one label, or None"""
+        rows = self.template_rows().get(int(label))
+        return self.gallery.descriptors[rows] if rows is not None else None
+
+    def mean_template(self, label):
+        """(1, bins) mean of one label's descriptors, or None"""
+        means = self._derived.setdefault('means', {})
+        if int(label) not in means:
+            templates = self.templates(label)
+            if templates is None or len(templates) == 0:
+                return None
+            means[int(label)] = np.asarray(templates, dtype=np.float32).mean(axis=0, keepdims=True)
+        return means[int(label)]
+
+    def index(self, components=64, shortlist=200):
+        """FaceIndex over every template of this gallery
+
+        Built from the previous gallery's fit when there is one, so only
+        templates added since are projected.
+        """
+        key = ('index', components, shortlist)
+        if key not in self._derived:
+            fits = self._derived.get('index_fits', {})
+            self._derived[key] = FaceIndex(
+                self.gallery.descriptors, self.gallery.labels,
+                components=components, shortlist=shortlist,
+                ids=self.gallery.metadata['template_id'], previous_fit=fits.get(key),
+            )
+        return self._derived[key]
+
+
+class GalleryJournal:
+    """Append-only log of template adds and removes on top of one snapshot
+
+    Each record is framed as magic, header length, payload length, a JSON
+    header, the raw bytes of its arrays and a CRC32 of everything before
+    it. Appending costs only the size of the record, however large the
+    gallery is. A crash mid-append leaves a torn last record, which
+    records() detects and ignores.
+    """
+
+    MAGIC = b'GJ01'
+    FRAME = struct.Struct('<4sII')
+    CRC = struct.Struct('<I')
+
+    def __init__(self, path):
+        self.path = path
+
+    def append(self, header, arrays=()):
+        arrays = [np.ascontiguousarray(array) for array in arrays]
+        header = dict(header, arrays=[[array.dtype.str, list(array.shape)] for array in arrays])
+        header_bytes = json.dumps(header).encode('utf-8')
+        payload = b''.join(array.tobytes() for array in arrays)
+
+        body = self.FRAME.pack(self.MAGIC, len(header_bytes), len(payload)) + header_bytes + payload
+        with open(self.path, 'ab') as f:
+            f.write(body + self.CRC.pack(zlib.crc32(body)))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def size(self):
+        """Bytes written so far; a cheap way to tell the journal grew"""
+        try:
+            return os.path.getsize(self.path)
+        except FileNotFoundError:
+            return 0
+
+    def records(self):
+        """Yield (header, arrays) for every intact record, oldest first"""
+        return iter(self.read()[0])
+
+    def read(self, start=0):
+        """([(header, arrays)], end) for the intact records from byte start on
+
+        end is the offset just past the last intact record, where a later
+        read() can pick up.
+        """
+        try:
+            with open(self.path, 'rb') as f:
+                f.seek(start)
+                data = f.read()
+        except FileNotFoundError:
+            return [], start
+
+        records = []
+        offset = 0
+        while offset + self.FRAME.size <= len(data):
+            magic, header_length, payload_length = self.FRAME.unpack_from(data, offset)
+            end = offset + self.FRAME.size + header_length + payload_length
+            if magic != self.MAGIC or end + self.CRC.size > len(data):
+                break
+            (crc,) = self.CRC.unpack_from(data, end)
+            if crc != zlib.crc32(data[offset:end]):
+                break
+
+            header_start = offset + self.FRAME.size
+            header = json.loads(data[header_start:header_start + header_length])
+            arrays = []
+            position = header_start + header_length
+            for dtype, shape in header.pop('arrays'):
+                array = np.frombuffer(data, dtype=dtype, count=int(np.prod(shape)), offset=position)
+                arrays.append(array.reshape(shape))
+                position += array.nbytes
+            records.append((header, arrays))
+
+            offset = end + self.CRC.size
+
+        return records, start + offset
+
+    def __len__(self):
+        return sum(1 for _ in self.records())
+
+
+class SnapshotStorage:
+    """Full-capacity memory maps of one stored snapshot"""
+
+    def __init__(self, version, descriptors, labels, faces, metadata):
+        self.version = version
+        self.descriptors = descriptors
+        self.labels = labels
+        self.faces = faces
+        self.metadata = metadata
+
+    @property
+    def capacity(self):
+        return len(self.labels)
+
+
+class GalleryStore:
+    """Versioned gallery snapshots under one directory
+
+    Each save writes a complete snapshot to v<version>/ (header.json,
+    descriptors.npy, labels.npy, metadata.npy, faces.npy) and then points
+    CURRENT at it with an atomic rename, so readers never see a partial
+    snapshot. Arrays are opened with np.load(mmap_mode='r'): loading is
+    close to instant and worker processes share the pages through the OS
+    page cache. Changes made after a snapshot go to its journal
+    (journal-v<version>.log) until the next save folds them in.
+
+    Each array file has spare rows past header['count']. append_in_place()
+    writes new templates there, so every worker maps them from the same
+    file instead of holding a private, growing copy of the gallery.
+    """
+
+    keep_snapshots = 2
+    # Spare rows preallocated by save(): at least min_spare, or spare_ratio
+    # of the templates saved (the files are sparse until written)
+    min_spare = 64
+    spare_ratio = 0.5
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._lock = threading.RLock()
+        self._lock_file = None
+        self._lock_depth = 0
+
+    def snapshot_path(self, version):
+        return os.path.join(self.directory, f'v{version:08d}')
+
+    def journal(self, version=None):
+        """Journal of changes on top of a snapshot (default: CURRENT)"""
+        version = self.current_version() if version is None else version
+        return GalleryJournal(os.path.join(self.directory, f'journal-v{version:08d}.log'))
+
+    @contextmanager
+    def locked(self):
+        """Exclusive lock across processes for saves and journal appends
+
+        Reentrant within a thread, so a writer can hold it across a reload,
+        a gallery change and the journal append that records it.
+        """
+        with self._lock:
+            if self._lock_depth == 0:
+                os.makedirs(self.directory, exist_ok=True)
+                self._lock_file = open(os.path.join(self.directory, '.lock'), 'a')
+                if fcntl is not None:
+                    fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX)
+            self._lock_depth += 1
+            try:
+                yield
+            finally:
+                self._lock_depth -= 1
+                if self._lock_depth == 0:
+                    # Closing the file releases the flock
+                    self._lock_file.close()
+                    self._lock_file = None
+
+    def current_version(self):
+        """Version CURRENT points at, or 0 if nothing was saved yet"""
+        try:
+            with open(os.path.join(self.directory, 'CURRENT'), 'r') as f:
+                return int(f.read().strip() or 0)
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def save(self, gallery, header):
+        """Write gallery as the next snapshot and return its version
+
+        Callers hold locked() so two processes can't claim the same version.
+
+        header carries the service state that belongs with the templates
+        (backend name, label maps); the format fields are added here.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        version = self.current_version() + 1
+        path = self.snapshot_path(version)
+        staging = f'{path}.tmp-{os.getpid()}'
+        os.makedirs(staging, exist_ok=True)
+
+        count = len(gallery)
+        capacity = count + max(self.min_spare, int(count * self.spare_ratio))
+
+        header = dict(header)
+        header.update({
+            'format_version': GALLERY_FORMAT_VERSION,
+            'version': version,
+            'count': count,
+            'capacity': capacity,
+            'descriptor_dim': gallery.dimensions,
+            'has_faces': gallery.faces is not None,
+            'saved_at': time.time(),
+        })
+
+        arrays = [
+            ('descriptors.npy', np.asarray(gallery.descriptors, dtype=np.float32)),
+            ('labels.npy', np.asarray(gallery.labels, dtype=np.int32)),
+            ('metadata.npy', gallery.metadata),
+        ]
+        if gallery.faces is not None:
+            arrays.append(('faces.npy', np.asarray(gallery.faces, dtype=np.uint8).reshape(-1, 200, 200)))
+        for name, array in arrays:
+            target = np.lib.format.open_memmap(
+                os.path.join(staging, name), mode='w+', dtype=array.dtype,
+                shape=(capacity,) + array.shape[1:],
+            )
+            target[:count] = array
+            target.flush()
+            del target
+        with open(os.path.join(staging, 'header.json'), 'w') as f:
+            json.dump(header, f, indent=2)
+
+        os.replace(staging, path)
+        self._point_current(version)
+        self._prune(version)
+        return version
+
+    def load(self, version=None):
+        """(gallery, header) of a snapshot (default: CURRENT), or None"""
+        version = version or self.current_version()
+        if not version:
+            return None
+
+        path = self.snapshot_path(version)
+        with open(os.path.join(path, 'header.json'), 'r') as f:
+            header = json.load(f)
+        if header.get('format_version') not in (1, GALLERY_FORMAT_VERSION):
+            raise ValueError(f"Unsupported gallery format {header.get('format_version')}")
+
+        def mapped(name):
+            return np.load(os.path.join(path, name), mmap_mode='r')
+
+        faces = mapped('faces.npy') if header.get('has_faces') else None
+        storage = SnapshotStorage(
+            version, mapped('descriptors.npy'), mapped('labels.npy'), faces, mapped('metadata.npy')
+        )
+        empty = FaceGallery(storage.descriptors[:0], storage.labels[:0], None, storage.metadata[:0], storage)
+        return empty.grown(header['count']), header
+
+    def append_in_place(self, gallery, descriptors, labels, faces):
+        """Write templates into the spare rows after gallery's last row
+
+        gallery must be a prefix of its snapshot (its storage is set) and
+        be up to date with the journal; callers hold locked(). Crops are
+        only written if the snapshot keeps them (a gallery migrated from a
+        legacy model doesn't). Returns the grown gallery, or None if there's
+        no room or nowhere to write, in which case the caller falls back to
+        FaceGallery.append().
+        """
+        storage = gallery.storage
+        if storage is None or (storage.faces is not None and faces is None):
+            return None
+        start, end = len(gallery), len(gallery) + len(labels)
+        if end > storage.capacity or np.shape(descriptors)[1:] != storage.descriptors.shape[1:]:
+            return None
+
+        labels = np.asarray(labels, dtype=np.int32).reshape(-1)
+        rows = {
+            'descriptors.npy': np.asarray(descriptors, dtype=np.float32),
+            'labels.npy': labels,
+            'metadata.npy': gallery.new_metadata(labels),
+        }
+        if storage.faces is not None:
+            rows['faces.npy'] = np.asarray(faces, dtype=np.uint8)
+        path = self.snapshot_path(storage.version)
+        for name, values in rows.items():
+            target = np.load(os.path.join(path, name), mmap_mode='r+')
+            target[start:end] = values
+            target.flush()
+            del target
+
+        # Read-only maps of the same file see the new rows through the page cache
+        return gallery.grown(end)
+
+    def _point_current(self, version):
+        pointer = os.path.join(self.directory, 'CURRENT')
+        staging = f'{pointer}.tmp-{os.getpid()}'
+        with open(staging, 'w') as f:
+            f.write(str(version))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(staging, pointer)
+
+    def _prune(self, current):
+        """Remove snapshots older than the last keep_snapshots versions
+
+        Processes that still map an old snapshot keep their pages: unlinked
+        files stay readable until the last mapping goes away.
+        """
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.startswith('v') and name[1:].isdigit():
+                if int(name[1:]) <= current - self.keep_snapshots:
+                    shutil.rmtree(path, ignore_errors=True)
+            elif name.startswith('journal-v') and name.endswith('.log'):
+                # Older journals are folded into the current snapshot
+                if int(name[len('journal-v'):-len('.log')]) < current:
+                    os.remove(path)
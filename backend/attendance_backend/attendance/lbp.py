@@ -0,0 +1,187 @@
+# attendance/lbp.py - NumPy LBP histogram engine
+import numpy as np
+
+
+# 8-neighbour offsets (dy, dx), clockwise from the top-left pixel
+NEIGHBOUR_OFFSETS = (
+    (-1, -1), (-1, 0), (-1, 1), (0, 1),
+    (1, 1), (1, 0), (1, -1), (0, -1),
+)
+
+
+def _uniform_lookup():
+    """Map the 256 LBP codes to 59 bins: one per uniform pattern, one shared"""
+    lookup = np.full(256, 58, dtype=np.int32)
+    next_bin = 0
+    for code in range(256):
+        bits = [(code >> i) & 1 for i in range(8)]
+        transitions = sum(bits[i] != bits[(i + 1) % 8] for i in range(8))
+        if transitions <= 2:
+            lookup[code] = next_bin
+            next_bin += 1
+    return lookup
+
+
+UNIFORM_LOOKUP = _uniform_lookup()
+UNIFORM_BINS = 59
+
+
+def lbp_codes(faces):
+    """Uniform LBP bin index for every interior pixel of one or many faces
+
+    faces is (H, W) or (n, H, W) uint8; the result drops the 1-pixel border.
+    Each neighbour comparison is a whole-array shift, not a per-pixel loop.
+    """
+    faces = np.asarray(faces, dtype=np.int16)
+    height, width = faces.shape[-2:]
+    center = faces[..., 1:-1, 1:-1]
+
+    codes = np.zeros(center.shape, dtype=np.uint8)
+    for bit, (dy, dx) in enumerate(NEIGHBOUR_OFFSETS):
+        neighbour = faces[..., 1 + dy:height - 1 + dy, 1 + dx:width - 1 + dx]
+        codes |= (neighbour >= center).astype(np.uint8) << np.uint8(bit)
+
+    return UNIFORM_LOOKUP[codes]
+
+
+def chi_square_distances(probes, templates, block_pairs=2048):
+    """Chi-square distance of every probe to every template
+
+    Uses the same form as cv2.HISTCMP_CHISQR_ALT (2 * sum((p - t)^2 / (p + t)))
+    so distances are on the scale verify_face already thresholds.
+    probes is (m, D), templates (N, D); returns (m, N) float32. Work is
+    done in blocks of at most block_pairs (probe, template) pairs, so the
+    (pairs, D) temporaries stay a few tens of MB however large the gallery.
+    """
+    probes = np.atleast_2d(np.asarray(probes, dtype=np.float32))
+    templates = np.atleast_2d(np.asarray(templates, dtype=np.float32))
+    result = np.empty((len(probes), len(templates)), dtype=np.float32)
+
+    probe_rows = max(1, min(len(probes), block_pairs))
+    template_rows = max(1, block_pairs // probe_rows)
+    for start in range(0, len(probes), probe_rows):
+        block = probes[start:start + probe_rows, None, :]
+        for first in range(0, len(templates), template_rows):
+            rows = templates[None, first:first + template_rows, :]
+            diff = block - rows
+            total = block + rows
+            with np.errstate(divide='ignore', invalid='ignore'):
+                terms = np.where(total > 0, diff * diff / total, 0.0)
+            result[start:start + probe_rows, first:first + template_rows] = 2.0 * terms.sum(axis=2)
+
+    return result
+
+
+class LBPFeatureExtractor:
+    """Uniform-LBP grid histograms of preprocessed faces"""
+
+    def __init__(self, grid_x=8, grid_y=8):
+        self.grid_x = grid_x
+        self.grid_y = grid_y
+        self._cell_cache = {}
+
+    @property
+    def dimensions(self):
+        return self.grid_x * self.grid_y * UNIFORM_BINS
+
+    def _cells(self, shape):
+        """Cell index of each LBP pixel and the pixel count of each cell"""
+        if shape not in self._cell_cache:
+            height, width = shape
+            rows = np.minimum(np.arange(height) * self.grid_y // height, self.grid_y - 1)
+            cols = np.minimum(np.arange(width) * self.grid_x // width, self.grid_x - 1)
+            cell_ids = rows[:, None] * self.grid_x + cols[None, :]
+            counts = np.bincount(cell_ids.ravel(), minlength=self.grid_x * self.grid_y)
+            self._cell_cache[shape] = (cell_ids, counts.astype(np.float32))
+        return self._cell_cache[shape]
+
+    def compute(self, faces):
+        """(n, D) float32 descriptors for (n, H, W) or a single (H, W) face
+
+        Each cell histogram is normalized to sum to 1, like cv2's LBPH.
+        """
+        faces = np.asarray(faces)
+        if faces.ndim == 2:
+            faces = faces[None]
+        if len(faces) == 0:
+            return np.empty((0, self.dimensions), dtype=np.float32)
+
+        codes = lbp_codes(faces)
+        cell_ids, counts = self._cells(codes.shape[1:])
+        cells = self.grid_x * self.grid_y
+
+        # One bincount over (sample, cell, bin) for the whole batch
+        sample_offsets = np.arange(len(faces))[:, None, None] * (cells * UNIFORM_BINS)
+        index = sample_offsets + cell_ids[None] * UNIFORM_BINS + codes
+        histograms = np.bincount(index.ravel(), minlength=len(faces) * cells * UNIFORM_BINS)
+        histograms = histograms.reshape(len(faces), cells, UNIFORM_BINS).astype(np.float32)
+        histograms /= counts[None, :, None]
+
+        return histograms.reshape(len(faces), -1)
+
+
+class NumpyLBPHRecognizer:
+    """In-house replacement for cv2.face.LBPHFaceRecognizer
+
+    Templates live in one contiguous float32 matrix and distances for one
+    or many probes are computed in a single vectorized call. The methods
+    OpenCVFaceService relies on mirror the cv2 recognizer's names.
+    """
+
+    def __init__(self, grid_x=8, grid_y=8):
+        self.extractor = LBPFeatureExtractor(grid_x, grid_y)
+        self.templates = np.empty((0, self.extractor.dimensions), dtype=np.float32)
+        self.labels = np.empty(0, dtype=np.int32)
+
+    def compute_histogram(self, face):
+        """(1, D) descriptor of a single preprocessed face"""
+        return self.extractor.compute(face)
+
+    def train(self, faces, labels):
+        """Replace all templates"""
+        self.templates = np.ascontiguousarray(self.extractor.compute(np.asarray(faces)))
+        self.labels = np.asarray(labels, dtype=np.int32).reshape(-1)
+
+    def update(self, faces, labels):
+        """Append templates for new samples"""
+        descriptors = self.extractor.compute(np.asarray(faces))
+        self.templates = np.ascontiguousarray(np.vstack([self.templates, descriptors]))
+        self.labels = np.concatenate([self.labels, np.asarray(labels, dtype=np.int32).reshape(-1)])
+
+    def distances(self, faces):
+        """(n_probes, n_templates) chi-square distances"""
+        return chi_square_distances(self.extractor.compute(faces), self.templates)
+
+    def predict_batch(self, faces):
+        """Nearest-template labels and distances for a batch of faces"""
+        if len(self.templates) == 0:
+            raise ValueError("Recognizer has no templates")
+        distances = self.distances(faces)
+        nearest = distances.argmin(axis=1)
+        return self.labels[nearest], distances[np.arange(len(nearest)), nearest]
+
+    def predict(self, face):
+        """(label, distance) of the nearest template, like cv2's predict"""
+        labels, distances = self.predict_batch(np.asarray(face)[None])
+        return int(labels[0]), float(distances[0])
+
+    def getHistograms(self):
+        return [row.reshape(1, -1) for row in self.templates]
+
+    def getLabels(self):
+        return self.labels.reshape(-1, 1)
+
+    def save(self, path):
+        # Pass a file object so np.savez doesn't append '.npz' to the path
+        with open(path, 'wb') as f:
+            np.savez(
+                f, templates=self.templates, labels=self.labels,
+                grid=np.array([self.extractor.grid_x, self.extractor.grid_y]),
+            )
+
+    def read(self, path):
+        with np.load(path) as data:
+            grid_x, grid_y = (int(v) for v in data['grid'])
+            self.extractor = LBPFeatureExtractor(grid_x, grid_y)
+            self.templates = np.ascontiguousarray(data['templates'], dtype=np.float32)
+            self.labels = data['labels'].astype(np.int32)
@@ -0,0 +1,68 @@
+# attendance/management/commands/bench_detection.py
+import time
+
+import cv2
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+
+from attendance.face_service import OpenCVFaceService
+
+
+class Command(BaseCommand):
+    help = "Time Haar cascade detection against input resolution, full-size vs downscaled"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--image', help='Image to benchmark (default: synthetic frame)')
+        parser.add_argument(
+            '--sizes', default='480,720,1080,1920,3000,4000',
+            help='Comma-separated long-side resolutions to test'
+        )
+        parser.add_argument('--repeat', type=int, default=5, help='Runs per measurement')
+        parser.add_argument(
+            '--max-side', type=int, default=640,
+            help='Working resolution for the downscaled run'
+        )
+
+    def handle(self, *args, **options):
+        if options['image']:
+            base = cv2.imread(options['image'], cv2.IMREAD_GRAYSCALE)
+            if base is None:
+                raise CommandError(f"Could not read {options['image']}")
+        else:
+            base = self.synthetic_frame()
+
+        sizes = [int(size) for size in options['sizes'].split(',') if size.strip()]
+        service = OpenCVFaceService()
+
+        self.stdout.write(f"{'long side':>10} {'full (ms)':>10} {'faces':>6} {'scaled (ms)':>12} {'faces':>6} {'speedup':>8}")
+        for size in sizes:
+            ratio = size / max(base.shape[:2])
+            frame = cv2.resize(base, None, fx=ratio, fy=ratio, interpolation=cv2.INTER_LINEAR)
+
+            with override_settings(FACE_DETECTION_MAX_SIDE=0):
+                full_ms, full_faces = self.time_detection(service, frame, options['repeat'])
+            with override_settings(FACE_DETECTION_MAX_SIDE=options['max_side']):
+                scaled_ms, scaled_faces = self.time_detection(service, frame, options['repeat'])
+
+            speedup = full_ms / scaled_ms if scaled_ms else float('inf')
+            self.stdout.write(
+                f"{size:>10} {full_ms:>10.1f} {full_faces:>6} {scaled_ms:>12.1f} {scaled_faces:>6} {speedup:>7.1f}x"
+            )
+
+    def time_detection(self, service, frame, repeat):
+        """Median detect_faces time in ms and the number of faces found"""
+        timings = []
+        faces = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            faces, _ = service.detect_faces(frame)
+            timings.append((time.perf_counter() - start) * 1000)
+        return float(np.median(timings)), len(faces)
+
+    def synthetic_frame(self):
+        """Textured 4000x3000 frame, so the cascade can't reject it instantly"""
+        rng = np.random.default_rng(0)
+        noise = rng.integers(0, 256, (375, 500), dtype=np.uint8)
+        frame = cv2.resize(noise, (4000, 3000), interpolation=cv2.INTER_CUBIC)
+        return cv2.GaussianBlur(frame, (9, 9), 0)
@@ -0,0 +1,102 @@
+# attendance/management/commands/bench_detectors.py
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from attendance.benchmarks import latency_summary, training_images
+from attendance.detectors import DETECTOR_BACKENDS, DetectorUnavailable, create_detector
+from attendance.face_service import OpenCVFaceService
+
+
+class Command(BaseCommand):
+    help = "Compare face detector backends: latency and detection rate on a training_data/<EMP>/ folder"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--folder', default='training_data', help='Folder laid out as <EMP>/<image>')
+        parser.add_argument(
+            '--backends', default=','.join(DETECTOR_BACKENDS),
+            help='Comma-separated backends; backend:cascade_file picks another cascade '
+                 '(e.g. cascade:haarcascade_frontalface_alt2.xml)'
+        )
+        parser.add_argument('--scale-factor', type=float, help='Override scale_factor for every backend')
+        parser.add_argument('--min-neighbors', type=int, help='Override min_neighbors for every backend')
+        parser.add_argument('--repeat', type=int, default=1, help='Detections per image and backend')
+        parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+
+    def handle(self, *args, **options):
+        try:
+            images = training_images(options['folder'])
+        except FileNotFoundError as e:
+            raise CommandError(str(e))
+        if not images:
+            raise CommandError(f"No images found under {options['folder']}")
+
+        service = OpenCVFaceService()
+        # Decode once (as the service would) so only detection is timed
+        frames = []
+        for employee_id, path in images:
+            with open(path, 'rb') as f:
+                image, scale = service.decode_image(f.read())
+            if image is None:
+                self.stderr.write(f"Skipping unreadable {path}")
+                continue
+            frames.append((image, scale))
+        if not frames:
+            raise CommandError(f"No readable images under {options['folder']}")
+
+        results = []
+        for spec in options['backends'].split(','):
+            backend, _, cascade = spec.strip().partition(':')
+            detector_options = {}
+            if cascade:
+                detector_options['cascade'] = cascade
+            if options['scale_factor']:
+                detector_options['scale_factor'] = options['scale_factor']
+            if options['min_neighbors']:
+                detector_options['min_neighbors'] = options['min_neighbors']
+
+            try:
+                detector = create_detector(backend, detector_options, fallback=None)
+            except (DetectorUnavailable, ValueError) as e:
+                self.stderr.write(f"✗ {spec}: {e}")
+                continue
+
+            results.append(self.run(spec, detector, service, frames, options['repeat']))
+
+        if options['json']:
+            self.stdout.write(json.dumps({'images': len(frames), 'results': results}, indent=2))
+            return
+
+        self.stdout.write(f"{len(frames)} images from {options['folder']}")
+        self.stdout.write(
+            f"{'backend':<40} {'p50 (ms)':>9} {'p95 (ms)':>9} {'mean (ms)':>10} {'one face':>9} {'any face':>9}"
+        )
+        for result in results:
+            latency = result['latency_ms']
+            self.stdout.write(
+                f"{result['backend']:<40} {latency['p50']:>9.2f} {latency['p95']:>9.2f} {latency['mean']:>10.2f} "
+                f"{result['one_face_rate']:>8.1%} {result['any_face_rate']:>8.1%}"
+            )
+
+    def run(self, spec, detector, service, frames, repeat):
+        """Time detect_faces with detector on every frame"""
+        service.face_detector = detector
+        timings = []
+        one_face = any_face = 0
+        for image, scale in frames:
+            min_side = max(1, int(round(100 / scale)))
+            for _ in range(max(1, repeat)):
+                start = time.perf_counter()
+                faces, _ = service.detect_faces(image, min_size=(min_side, min_side))
+                timings.append((time.perf_counter() - start) * 1000)
+            one_face += len(faces) == 1
+            any_face += len(faces) > 0
+
+        return {
+            'backend': spec,
+            'detector': detector.describe(),
+            'latency_ms': latency_summary(timings),
+            'one_face_rate': one_face / len(frames),
+            'any_face_rate': any_face / len(frames),
+        }
@@ -0,0 +1,338 @@
+# attendance/management/commands/bench_face_service.py
+import base64
+import json
+import os
+import platform
+import tempfile
+import time
+from contextlib import redirect_stdout
+from datetime import datetime, timezone
+from itertools import count
+
+import cv2
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+
+from attendance.benchmarks import latency_summary, synthetic_face, time_calls
+from attendance.face_service import FaceFrame, OpenCVFaceService
+from attendance.gallery import FaceGallery
+
+# Stages timed once, on the capture alone
+CAPTURE_STAGES = ('base64_to_image', 'decode_image', 'detect_faces', 'preprocess_face')
+# Stages timed at every gallery size
+GALLERY_STAGES = ('register_face', 'verify_face', 'save_model', 'load_or_create_model')
+# Distinct synthetic subjects the padding templates are drawn from
+PADDING_SUBJECTS = 64
+
+
+def available_memory_mb():
+    """MemAvailable from /proc/meminfo, free physical memory elsewhere, or None"""
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    try:
+        return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def default_gallery_limit_mb():
+    """Half the available memory: the gallery is copied while it's saved and
+    loaded. 8 GB when that can't be read, enough for 50k OpenCV LBPH
+    templates (16384 dimensions, about 3.1 GB)."""
+    available = available_memory_mb()
+    return 8192.0 if available is None else available / 2
+
+
+def prepared_frame(service, decoded, detection):
+    """FaceFrame whose decode and detection are already done, so register_face
+    and verify_face are timed without them"""
+    frame = FaceFrame(service, None)
+    frame.__dict__.update(decoded=decoded, detection=detection, fast_detection=detection)
+    return frame
+
+
+def crop_frame(service, face):
+    """Prepared frame made of a single 200x200 face crop"""
+    height, width = face.shape[:2]
+    detection = (np.array([[0, 0, width, height]]), face)
+    return prepared_frame(service, (face, 1), detection)
+
+
+class Command(BaseCommand):
+    help = ("Time each face_service stage (decode, detection, preprocessing, registration, "
+            "verification, checkpoint save and load) against gallery size and write a JSON report")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--image', help='Capture with one face (default: synthetic frame and face crops)')
+        parser.add_argument('--sizes', default='10,100,1000,10000,50000',
+                            help='Comma-separated gallery sizes, in templates')
+        parser.add_argument('--templates-per-employee', type=int, default=5)
+        parser.add_argument('--repeat', type=int, default=20,
+                            help='Runs of the capture stages, register_face and verify_face')
+        parser.add_argument('--checkpoint-repeat', type=int, default=3,
+                            help='Runs of save_model and load_or_create_model')
+        parser.add_argument('--backend', help='FACE_RECOGNIZER_BACKEND for the run')
+        parser.add_argument('--max-gallery-mb', type=float,
+                            help='Skip gallery sizes whose descriptor matrix would be larger '
+                                 '(default: half the available memory)')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Write the JSON report to this file')
+        parser.add_argument('--baseline', help='Earlier JSON report to compare p50 latencies with')
+        parser.add_argument('--tolerance', type=float, default=1.25,
+                            help='p50 / baseline p50 ratio above which a stage counts as a regression')
+
+    def handle(self, *args, **options):
+        sizes = sorted(int(size) for size in options['sizes'].split(',') if size.strip())
+        if not sizes or sizes[0] < 1:
+            raise CommandError("--sizes needs positive template counts")
+
+        if options['image']:
+            with open(options['image'], 'rb') as f:
+                capture = f.read()
+        else:
+            capture = self.synthetic_capture()
+        capture_base64 = base64.b64encode(capture).decode('ascii')
+        if options['max_gallery_mb'] is None:
+            options['max_gallery_mb'] = round(default_gallery_limit_mb())
+
+        overrides = {
+            # Keep background reloads and checkpoints out of the timings
+            'FACE_GALLERY_RELOAD_INTERVAL': -1,
+            'FACE_GALLERY_CHECKPOINT_RECORDS': 10 ** 9,
+        }
+        if options['backend']:
+            overrides['FACE_RECOGNIZER_BACKEND'] = options['backend']
+
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root, **overrides):
+            # The service logs every step; only the report goes to stdout
+            with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+                try:
+                    service = OpenCVFaceService()
+                except ValueError as e:
+                    raise CommandError(str(e))
+                stages, capture_info, frame = self.capture_stages(service, capture_base64, options['repeat'])
+
+            report = {
+                'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                'environment': self.environment(service),
+                'capture': {'source': options['image'] or 'synthetic', **capture_info},
+                'stages': stages,
+                'max_gallery_mb': options['max_gallery_mb'],
+                'gallery_sizes': [],
+            }
+            rng = np.random.default_rng(options['seed'])
+            for size in sizes:
+                row = self.gallery_stages(service, size, frame, rng, options)
+                report['gallery_sizes'].append(row)
+                self.stdout.write(f"✓ {size} templates: {self.one_line(row)}")
+
+        self.report(report)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f"✓ Report written to {options['output']}")
+        if options['baseline']:
+            self.compare(report, options['baseline'], options['tolerance'])
+
+    def synthetic_capture(self):
+        """1280x720 JPEG of smooth texture; the cascade finds no face in it"""
+        rng = np.random.default_rng(0)
+        base = rng.integers(0, 256, (72, 128, 3)).astype(np.uint8)
+        frame = cv2.resize(base, (1280, 720), interpolation=cv2.INTER_CUBIC)
+        frame = cv2.GaussianBlur(frame, (0, 0), 3)
+        return cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 90])[1].tobytes()
+
+    def environment(self, service):
+        return {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'numpy': np.__version__,
+            'opencv': cv2.__version__,
+            'recognizer': service.backend.describe(),
+            'verification_mode': service.verification_mode,
+            'detector': getattr(settings, 'FACE_DETECTOR_BACKEND', 'haar'),
+            'detection_max_side': getattr(settings, 'FACE_DETECTION_MAX_SIDE', None),
+        }
+
+    def capture_stages(self, service, capture_base64, repeat):
+        """(stage summaries, capture details, prepared frame for the gallery stages)
+
+        The frame is None when no face was found in the capture; the
+        gallery stages then register and verify synthetic crops.
+        """
+        frame = service.analyze_frame(capture_base64)
+        if frame.image is None:
+            raise CommandError("Could not decode the capture")
+        min_side = max(1, int(round(100 / frame.scale)))
+
+        if len(frame.faces):
+            x, y, w, h = frame.faces[0]
+        else:
+            # Time preprocessing on a face-sized patch anyway
+            h, w = frame.image.shape[:2]
+            x, y, w, h = w // 4, h // 4, w // 2, h // 2
+        crop = frame.image[y:y+h, x:x+w]
+
+        stages = {
+            'base64_to_image': time_calls(service.base64_to_image, repeat, capture_base64),
+            'decode_image': time_calls(service.decode_image, repeat, capture_base64),
+            'detect_faces': time_calls(service.detect_faces, repeat, frame.image, min_size=(min_side, min_side)),
+            'preprocess_face': time_calls(service.preprocess_face, repeat, crop),
+        }
+        info = {
+            'bytes': len(service.base64_to_bytes(capture_base64)),
+            'decoded_shape': list(frame.image.shape[:2]),
+            'decode_scale': frame.scale,
+            'faces_found': len(frame.faces),
+        }
+        prepared = prepared_frame(service, frame.decoded, frame.detection) if len(frame.faces) else None
+        return {stage: latency_summary(stages[stage]) for stage in CAPTURE_STAGES}, info, prepared
+
+    def padding_pool(self, service):
+        """Descriptors of PADDING_SUBJECTS synthetic faces"""
+        faces = np.array([synthetic_face(subject, 0) for subject in range(1, PADDING_SUBJECTS + 1)])
+        return service.compute_histograms(faces)
+
+    def build_gallery(self, service, size, per_employee, rng, spare_rows=0):
+        """Replace the gallery with size made-up templates and checkpoint it
+
+        Descriptors are jittered copies of the synthetic pool; the padding
+        carries no face crops, like a gallery migrated from a legacy model,
+        so Eigen/Fisherfaces only train on the faces registered while
+        timing. The checkpoint keeps at least spare_rows spare rows, so
+        the timed registrations are written into the snapshot in place
+        instead of copying the gallery.
+        """
+        pool = self.padding_pool(service)
+        employees = -(-size // per_employee)
+        labels = np.repeat(np.arange(1, employees + 1, dtype=np.int32), per_employee)[:size]
+        descriptors = np.empty((size, pool.shape[1]), dtype=np.float32)
+        for start in range(0, size, 4096):
+            rows = slice(start, min(size, start + 4096))
+            jitter = rng.uniform(0.9, 1.1, (rows.stop - rows.start, pool.shape[1])).astype(np.float32)
+            descriptors[rows] = pool[labels[rows] % len(pool)] * jitter
+
+        label_map = {f"BENCH-{label:06d}": int(label) for label in range(1, employees + 1)}
+        service.clear_gallery()
+        service.publish(
+            gallery=FaceGallery(descriptors, labels),
+            label_map=label_map,
+            reverse_label_map={label: employee_id for employee_id, label in label_map.items()},
+        )
+        service.faces = []
+        service.labels = labels.tolist()
+        service.attach_recognizer()
+        service.gallery_store.min_spare = max(service.gallery_store.min_spare, spare_rows)
+        service.save_model()
+        return employees
+
+    def gallery_stages(self, service, size, frame, rng, options):
+        repeat, checkpoint_repeat = options['repeat'], options['checkpoint_repeat']
+        dimensions = service.compute_histograms(np.array([synthetic_face(1, 0)])).shape[1]
+        gallery_mb = size * dimensions * 4 / 2 ** 20
+        row = {'templates': size, 'descriptor_dimensions': dimensions, 'gallery_mb': round(gallery_mb, 1)}
+        if gallery_mb > options['max_gallery_mb']:
+            self.stderr.write(f"✗ Skipping {size} templates: {gallery_mb:.0f} MB of descriptors (--max-gallery-mb {options['max_gallery_mb']:.0f})")
+            return {**row, 'skipped': True}
+
+        def frames(subject, variants):
+            if frame is not None:
+                return [prepared_frame(service, frame.decoded, frame.detection) for _ in variants]
+            return [crop_frame(service, synthetic_face(subject, variant)) for variant in variants]
+
+        with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+            started = time.perf_counter()
+            # Room for the probe and every timed registration, 3 templates each
+            spare_rows = 3 * (repeat + 1)
+            row['employees'] = self.build_gallery(
+                service, size, options['templates_per_employee'], rng, spare_rows
+            )
+            row['build_seconds'] = round(time.perf_counter() - started, 3)
+
+            # A genuine probe for verify_face, then new employees for register_face
+            probe_subject = PADDING_SUBJECTS + 1
+            service.register_face('BENCH-PROBE', frames(probe_subject, range(3)))
+            probes = iter(frames(probe_subject, range(3, 3 + repeat)))
+            verified = []
+            verify = time_calls(lambda: verified.append(service.verify_face('BENCH-PROBE', next(probes))[0]), repeat)
+
+            employees = count(1)
+            batches = iter([frames(probe_subject + n, range(3)) for n in range(1, repeat + 1)])
+            register = time_calls(
+                lambda: service.register_face(f"BENCH-NEW-{next(employees):04d}", next(batches)), repeat
+            )
+            row['register_in_place'] = service.gallery.storage is not None
+            # A checkpoint started by the registrations finishes before save_model is timed
+            if service._checkpoint_thread is not None:
+                service._checkpoint_thread.join()
+
+            save = time_calls(service.save_model, checkpoint_repeat)
+            load = time_calls(service.load_or_create_model, checkpoint_repeat)
+
+        row['genuine_accept_rate'] = sum(verified) / len(verified) if verified else None
+        timings = {'register_face': register, 'verify_face': verify, 'save_model': save, 'load_or_create_model': load}
+        row['stages'] = {stage: latency_summary(timings[stage]) for stage in GALLERY_STAGES}
+        return row
+
+    def one_line(self, row):
+        if row.get('skipped'):
+            return 'skipped'
+        return ', '.join(f"{stage} {summary['p50']:.1f} ms" for stage, summary in row['stages'].items())
+
+    def report(self, report):
+        self.stdout.write(f"{'stage':<22} {'templates':>10} {'p50 (ms)':>10} {'p95 (ms)':>10} {'p99 (ms)':>10}")
+        for stage, summary in report['stages'].items():
+            self.stdout.write(
+                f"{stage:<22} {'-':>10} {summary['p50']:>10.2f} {summary['p95']:>10.2f} {summary['p99']:>10.2f}"
+            )
+        for stage in GALLERY_STAGES:
+            for row in report['gallery_sizes']:
+                if row.get('skipped'):
+                    continue
+                summary = row['stages'][stage]
+                self.stdout.write(
+                    f"{stage:<22} {row['templates']:>10} {summary['p50']:>10.2f} "
+                    f"{summary['p95']:>10.2f} {summary['p99']:>10.2f}"
+                )
+
+    def compare(self, report, baseline_path, tolerance):
+        """Fail if a stage's p50 grew by more than tolerance over the baseline report"""
+        try:
+            with open(baseline_path) as f:
+                baseline = json.load(f)
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Could not read baseline {baseline_path}: {e}")
+
+        def p50s(data):
+            values = {(stage, None): summary['p50'] for stage, summary in data.get('stages', {}).items()}
+            for row in data.get('gallery_sizes', []):
+                for stage, summary in row.get('stages', {}).items():
+                    values[(stage, row['templates'])] = summary['p50']
+            return values
+
+        before, after = p50s(baseline), p50s(report)
+        regressions = []
+        for key in sorted(after.keys() & before.keys(), key=lambda key: (key[0], key[1] or 0)):
+            if not before[key] or after[key] is None:
+                continue
+            ratio = after[key] / before[key]
+            if ratio > tolerance:
+                stage, templates = key
+                regressions.append(
+                    f"{stage}{f' @ {templates}' if templates else ''}: "
+                    f"{before[key]:.2f} -> {after[key]:.2f} ms ({ratio:.2f}x)"
+                )
+
+        if regressions:
+            for line in regressions:
+                self.stderr.write(f"✗ {line}")
+            raise CommandError(f"{len(regressions)} stage(s) slower than {tolerance}x the baseline")
+        self.stdout.write(f"✓ No stage slower than {tolerance}x the baseline")
@@ -0,0 +1,241 @@
+# attendance/management/commands/bench_recognizers.py
+import json
+import time
+
+import cv2
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from attendance.benchmarks import equal_error_threshold, latency_summary, training_images
+from attendance.face_service import MATCH_THRESHOLD, OpenCVFaceService
+from attendance.lbp import NumpyLBPHRecognizer
+from attendance.recognizers import RECOGNIZER_BACKENDS, SubspaceRecognizer, create_backend
+
+
+def jittered(face, rng):
+    """A shifted, rotated, relit and noisier copy of a preprocessed face"""
+    h, w = face.shape
+    matrix = cv2.getRotationMatrix2D((w / 2, h / 2), rng.uniform(-8, 8), rng.uniform(0.95, 1.05))
+    matrix[:, 2] += rng.uniform(-6, 6, 2)
+    face = cv2.warpAffine(face, matrix, (w, h), borderMode=cv2.BORDER_REFLECT)
+    face = face.astype(np.float64) + rng.uniform(-20, 20) + rng.normal(0, 4, face.shape)
+    return np.clip(face, 0, 255).astype(np.uint8)
+
+
+def label_distances(recognizer, face):
+    """{label: distance from face to that label's nearest template}"""
+    if isinstance(recognizer, SubspaceRecognizer):
+        return recognizer.label_distances(face)
+    if isinstance(recognizer, NumpyLBPHRecognizer):
+        if len(recognizer.templates) == 0:
+            return {}
+        distances = recognizer.distances(np.asarray(face)[None])[0]
+        return {
+            int(label): float(distances[recognizer.labels == label].min())
+            for label in np.unique(recognizer.labels)
+        }
+
+    collector = cv2.face.StandardCollector_create()
+    recognizer.predict_collect(face, collector)
+    distances = {}
+    for label, distance in collector.getResults():
+        distances[int(label)] = min(distance, distances.get(int(label), float('inf')))
+    return distances
+
+
+class Command(BaseCommand):
+    help = ("Compare face recognizer backends: train time, predict latency against gallery size, "
+            "memory and accuracy on a training_data/<EMP>/ folder")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--folder', default='training_data', help='Folder laid out as <EMP>/<image>')
+        parser.add_argument('--backends', default=','.join(RECOGNIZER_BACKENDS), help='Comma-separated backends')
+        parser.add_argument('--probes', type=int, default=1,
+                            help="Last images of each employee held out as probes (the rest are registered)")
+        parser.add_argument('--gallery-sizes', default='100,500,1000',
+                            help='Template counts to time, padded with jittered copies of the training faces')
+        parser.add_argument('--repeat', type=int, default=3, help='Predictions per probe when timing')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+
+    def handle(self, *args, **options):
+        try:
+            images = training_images(options['folder'])
+        except FileNotFoundError as e:
+            raise CommandError(str(e))
+
+        service = OpenCVFaceService()
+        crops = {}
+        for employee_id, path in images:
+            with open(path, 'rb') as f:
+                face = service.analyze_frame(f.read()).processed_face
+            if face is None:
+                self.stderr.write(f"Skipping {path}: no face found")
+                continue
+            crops.setdefault(employee_id, []).append(face)
+
+        train_faces, train_labels, probes = [], [], []
+        for label, (employee_id, faces) in enumerate(sorted(crops.items()), start=1):
+            held_out = options['probes'] if len(faces) > options['probes'] else 0
+            for face in faces[:len(faces) - held_out]:
+                train_faces.append(face)
+                train_labels.append(label)
+            probes += [(face, label) for face in faces[len(faces) - held_out:]]
+        if not train_faces:
+            raise CommandError(f"No faces found under {options['folder']}")
+        if not probes:
+            raise CommandError("No probes: every employee needs more than --probes images")
+
+        train_labels = np.asarray(train_labels, dtype=np.int32)
+        sizes = sorted(int(size) for size in options['gallery_sizes'].split(',') if size.strip())
+
+        results = []
+        for name in options['backends'].split(','):
+            name = name.strip()
+            try:
+                backend = create_backend(name, {})
+            except ValueError as e:
+                self.stderr.write(f"✗ {e}")
+                continue
+            result = self.accuracy(backend, train_faces, train_labels, probes, options['repeat'])
+            rng = np.random.default_rng(options['seed'])
+            result['scaling'] = [
+                self.scaling(backend, train_faces, train_labels, probes, size, rng, options['repeat'])
+                for size in sizes
+            ]
+            results.append(result)
+
+        summary = {
+            'employees': len(crops),
+            'templates': len(train_faces),
+            'probes': len(probes),
+            'match_threshold': MATCH_THRESHOLD,
+            'results': results,
+        }
+        if options['json']:
+            self.stdout.write(json.dumps(summary, indent=2))
+            return
+        self.report(summary)
+
+    def train(self, backend, faces, labels):
+        """(recognizer, training seconds)"""
+        recognizer = backend.create()
+        start = time.perf_counter()
+        recognizer.train(list(faces), labels)
+        return recognizer, time.perf_counter() - start
+
+    def predict_latency(self, recognizer, probes, repeat):
+        timings = []
+        for face, _ in probes:
+            for _ in range(max(1, repeat)):
+                start = time.perf_counter()
+                recognizer.predict(face)
+                timings.append((time.perf_counter() - start) * 1000)
+        return latency_summary(timings)
+
+    def model_bytes(self, recognizer):
+        """Bytes of the arrays the trained recognizer keeps in memory"""
+        if isinstance(recognizer, NumpyLBPHRecognizer):
+            return recognizer.templates.nbytes + recognizer.labels.nbytes
+        if isinstance(recognizer, SubspaceRecognizer):
+            if not recognizer.trained:
+                return None
+            return recognizer.mean.nbytes + recognizer.basis.nbytes + recognizer.projections.nbytes
+        return sum(histogram.nbytes for histogram in recognizer.getHistograms())
+
+    def accuracy(self, backend, train_faces, train_labels, probes, repeat):
+        """Identification and 1:1 verification of the held-out probes"""
+        recognizer, train_seconds = self.train(backend, train_faces, train_labels)
+
+        identified = accepted = false_accepts = 0
+        genuine, impostor = [], []
+        for face, label in probes:
+            distances = label_distances(recognizer, face)
+            if distances and min(distances, key=distances.get) == label:
+                identified += 1
+            own = distances.get(label, float('inf'))
+            genuine.append(own)
+            accepted += backend.confidence(own) >= MATCH_THRESHOLD
+            for other, distance in distances.items():
+                if other != label:
+                    impostor.append(distance)
+                    false_accepts += backend.confidence(distance) >= MATCH_THRESHOLD
+
+        threshold, equal_error_rate = equal_error_threshold(genuine, impostor)
+        finite_genuine = [d for d in genuine if np.isfinite(d)]
+        return {
+            'backend': backend.name,
+            'options': backend.describe(),
+            'train_ms': round(1000 * train_seconds, 3),
+            'predict_ms': self.predict_latency(recognizer, probes, repeat),
+            'model_bytes': self.model_bytes(recognizer),
+            'top1_accuracy': identified / len(probes),
+            'genuine_accept_rate': accepted / len(probes),
+            'false_accept_rate': false_accepts / len(impostor) if impostor else None,
+            'genuine_distance_p50': float(np.median(finite_genuine)) if finite_genuine else None,
+            'impostor_distance_p50': float(np.median(impostor)) if impostor else None,
+            'equal_error_rate': equal_error_rate,
+            # distance_scale putting the equal-error distance at MATCH_THRESHOLD
+            'suggested_distance_scale': (
+                round(threshold / (1 - MATCH_THRESHOLD), 2) if threshold is not None else None
+            ),
+        }
+
+    def scaling(self, backend, train_faces, train_labels, probes, size, rng, repeat):
+        """Train time, predict latency and memory with size templates
+
+        The registered faces are padded with jittered copies under new
+        labels, three per made-up employee; only timings mean anything here.
+        """
+        faces, labels = list(train_faces), list(train_labels)
+        next_label = int(train_labels.max()) + 1
+        while len(faces) < size:
+            source = train_faces[rng.integers(len(train_faces))]
+            for _ in range(min(3, size - len(faces))):
+                faces.append(jittered(source, rng))
+                labels.append(next_label)
+            next_label += 1
+
+        recognizer, train_seconds = self.train(backend, faces, np.asarray(labels, dtype=np.int32))
+        return {
+            'templates': len(faces),
+            'train_ms': round(1000 * train_seconds, 3),
+            'predict_ms': self.predict_latency(recognizer, probes, repeat),
+            'model_bytes': self.model_bytes(recognizer),
+        }
+
+    def report(self, summary):
+        self.stdout.write(
+            f"{summary['employees']} employees, {summary['templates']} templates, "
+            f"{summary['probes']} probes (threshold {summary['match_threshold']})"
+        )
+        self.stdout.write(
+            f"{'backend':<8} {'train (ms)':>11} {'p50 (ms)':>9} {'p95 (ms)':>9} {'memory (KB)':>12} "
+            f"{'top-1':>7} {'accept':>7} {'FAR':>7} {'EER':>7} {'scale':>8}"
+        )
+        for result in summary['results']:
+            latency = result['predict_ms']
+            self.stdout.write(
+                f"{result['backend']:<8} {result['train_ms']:>11.1f} {latency['p50']:>9.3f} {latency['p95']:>9.3f} "
+                f"{kilobytes(result['model_bytes']):>12} {result['top1_accuracy']:>6.1%} "
+                f"{result['genuine_accept_rate']:>6.1%} {percent(result['false_accept_rate']):>7} "
+                f"{percent(result['equal_error_rate']):>7} {str(result['suggested_distance_scale']):>8}"
+            )
+
+        self.stdout.write("")
+        self.stdout.write(f"{'backend':<8} {'templates':>10} {'train (ms)':>11} {'p50 (ms)':>9} {'p95 (ms)':>9} {'memory (KB)':>12}")
+        for result in summary['results']:
+            for row in result['scaling']:
+                latency = row['predict_ms']
+                self.stdout.write(
+                    f"{result['backend']:<8} {row['templates']:>10} {row['train_ms']:>11.1f} "
+                    f"{latency['p50']:>9.3f} {latency['p95']:>9.3f} {kilobytes(row['model_bytes']):>12}"
+                )
+
+
+def kilobytes(size):
+    return '-' if size is None else f"{size / 1024:.1f}"
+
+
+def percent(rate):
+    return '-' if rate is None else f"{rate:.1%}"
@@ -0,0 +1,16 @@
+# attendance/management/commands/rebuild_face_model.py
+from django.core.management.base import BaseCommand, CommandError
+
+from attendance.face_service import face_service
+
+
+class Command(BaseCommand):
+    help = "Recompute every gallery descriptor, retrain the recognizer from scratch and checkpoint"
+
+    def handle(self, *args, **options):
+        if not face_service.rebuild_model():
+            raise CommandError("Rebuild failed, see the log above")
+        self.stdout.write(self.style.SUCCESS(
+            f"Gallery v{face_service.gallery_version}: {len(face_service.gallery)} templates, "
+            f"{len(face_service.label_map)} employees"
+        ))
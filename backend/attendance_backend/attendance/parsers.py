@@ -0,0 +1,14 @@
+# attendance/parsers.py
+from rest_framework.parsers import BaseParser
+
+
+class RawImageParser(BaseParser):
+    """Accept a raw image body (e.g. image/jpeg) and hand over its bytes
+    
+    The bytes go straight to face_service.decode_image, skipping the
+    base64 step of the JSON contract. Other fields travel as query params.
+    """
+    media_type = 'image/*'
+    
+    def parse(self, stream, media_type=None, parser_context=None):
+        return stream.read() if stream is not None else b''
@@ -0,0 +1,146 @@
+# attendance/quality.py - Pre-detection quality gate on a frame thumbnail
+import threading
+from collections import Counter
+
+import cv2
+import numpy as np
+
+
+# Long side of the thumbnail the gate (and sharpness ranking) looks at
+THUMBNAIL_SIDE = 160
+
+# Rejection reasons, cheapest check first
+REJECT_UNDECODABLE = 'undecodable'
+REJECT_TOO_SMALL = 'too_small'
+REJECT_TOO_DARK = 'too_dark'
+REJECT_TOO_BRIGHT = 'too_bright'
+REJECT_LOW_CONTRAST = 'low_contrast'
+REJECT_BLURRY = 'blurry'
+
+# Smallest face side, in original pixels, is_valid_face_image accepts
+MIN_FACE_SIDE = 100
+# Frame exposure on the thumbnail: the 98th gray-level percentile must
+# reach DARK_FRAME_MAX, the 2nd stay under BRIGHT_FRAME_MIN, and they must
+# be MIN_CONTRAST apart
+DARK_FRAME_MAX = 40
+BRIGHT_FRAME_MIN = 230
+MIN_CONTRAST = 24
+# Mean gray level of the face box itself
+FACE_MIN_BRIGHTNESS = 30
+FACE_MAX_BRIGHTNESS = 220
+
+# Rejections of frames that would otherwise have gone on to the cascade
+# (an undecodable frame never reaches it)
+SKIPS_DETECTION = (REJECT_TOO_DARK, REJECT_TOO_BRIGHT, REJECT_LOW_CONTRAST, REJECT_BLURRY)
+
+
+def thumbnail(image, max_side=THUMBNAIL_SIDE):
+    """Copy of a grayscale image whose long side is at most max_side"""
+    ratio = min(1.0, max_side / max(image.shape[:2]))
+    if ratio == 1.0:
+        return image
+    return cv2.resize(image, None, fx=ratio, fy=ratio, interpolation=cv2.INTER_AREA)
+
+
+def sharpness(thumb):
+    """Variance of the Laplacian; low values mean defocus or motion blur"""
+    return float(cv2.Laplacian(thumb, cv2.CV_64F).var())
+
+
+def exposure(thumb):
+    """(2nd, 98th) percentile of the thumbnail's gray levels"""
+    cumulative = np.cumsum(np.bincount(thumb.ravel(), minlength=256))
+    total = cumulative[-1]
+    low = int(np.searchsorted(cumulative, 0.02 * total))
+    high = int(np.searchsorted(cumulative, 0.98 * total))
+    return low, high
+
+
+def exposure_issue(thumb):
+    """REJECT_TOO_DARK, REJECT_TOO_BRIGHT or REJECT_LOW_CONTRAST, or None"""
+    low, high = exposure(thumb)
+    if high < DARK_FRAME_MAX:
+        return REJECT_TOO_DARK
+    if low > BRIGHT_FRAME_MIN:
+        return REJECT_TOO_BRIGHT
+    if high - low < MIN_CONTRAST:
+        return REJECT_LOW_CONTRAST
+    return None
+
+
+def face_brightness_issue(face_region):
+    """'face_too_dark' or 'face_too_bright' for a face box's pixels, or None"""
+    brightness = float(np.mean(face_region))
+    if brightness < FACE_MIN_BRIGHTNESS:
+        return 'face_too_dark'
+    if brightness > FACE_MAX_BRIGHTNESS:
+        return 'face_too_bright'
+    return None
+
+
+def assess(thumb, original_size, min_side=MIN_FACE_SIDE, min_sharpness=15.0):
+    """First reason a frame can't yield a usable face, or None
+
+    original_size is (height, width) of the capture in original pixels:
+    a frame whose short side is below min_side can't hold a face of the
+    minimum size is_valid_face_image accepts.
+    """
+    if min(original_size) < min_side:
+        return REJECT_TOO_SMALL
+
+    issue = exposure_issue(thumb)
+    if issue is not None:
+        return issue
+
+    if min_sharpness and sharpness(thumb) < min_sharpness:
+        return REJECT_BLURRY
+    return None
+
+
+class QualityGateStats:
+    """Per-process counters for the gate and the detections it avoids
+
+    saved_seconds estimates the cascade time not spent: frames rejected
+    for exposure or blur (SKIPS_DETECTION) times the mean time of the
+    detections that did run.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.checked = 0
+            self.rejected = Counter()
+            self.detections = 0
+            self.detection_seconds = 0.0
+
+    def record_check(self, reason):
+        with self._lock:
+            self.checked += 1
+            if reason is not None:
+                self.rejected[reason] += 1
+
+    def record_detection(self, seconds):
+        with self._lock:
+            self.detections += 1
+            self.detection_seconds += seconds
+
+    def to_dict(self):
+        with self._lock:
+            rejected = sum(self.rejected.values())
+            mean_detection = self.detection_seconds / self.detections if self.detections else 0.0
+            skipped = sum(self.rejected[reason] for reason in SKIPS_DETECTION)
+            return {
+                'checked': self.checked,
+                'passed': self.checked - rejected,
+                'rejected': rejected,
+                'rejected_by_reason': dict(self.rejected),
+                'detections': self.detections,
+                'mean_detection_ms': round(1000 * mean_detection, 3),
+                'saved_seconds': round(skipped * mean_detection, 3),
+            }
+
+
+quality_stats = QualityGateStats()
@@ -0,0 +1,244 @@
+# attendance/recognizers.py - Face recognizer backends
+from abc import ABC, abstractmethod
+
+import cv2
+import numpy as np
+from django.conf import settings
+
+from .lbp import NumpyLBPHRecognizer
+
+
+class SubspaceRecognizer:
+    """cv2 Eigenfaces / Fisherfaces model on downscaled face crops
+
+    The subspace methods work on raw pixels, so crops are shrunk to
+    size x size first: the projection matrix is (size^2, components) and
+    its memory, like training time, grows with the pixel count. Distances
+    are divided by size (the square root of the pixel count), making them
+    RMS pixel differences, so one distance scale fits any size.
+
+    Neither cv2 model can be updated in place, so update() trains again on
+    the samples seen so far plus the new ones; the service retrains from
+    the gallery itself (SubspaceBackend.incremental is False).
+    """
+
+    def __init__(self, factory, size=64, num_components=0, min_classes=1):
+        self.factory = factory
+        self.model = factory(num_components)
+        self.size = size
+        self.num_components = num_components
+        self.min_classes = min_classes
+        self.trained = False
+        self.labels = np.empty(0, dtype=np.int32)
+        # The resized crops behind labels, for update()
+        self.samples = []
+        self.mean = self.basis = self.projections = self.projection_labels = None
+
+    def prepare(self, faces):
+        side = (self.size, self.size)
+        return [
+            face if face.shape == side else cv2.resize(face, side, interpolation=cv2.INTER_AREA)
+            for face in faces
+        ]
+
+    def train(self, faces, labels):
+        """Replace the model; left untrained if there are too few samples or classes"""
+        self.samples = self.prepare(faces)
+        self.labels = np.asarray(labels, dtype=np.int32).reshape(-1)
+        self.trained = False
+        if len(self.labels) < 2 or len(np.unique(self.labels)) < self.min_classes:
+            print(f"ℹ {len(np.unique(self.labels))} employee(s): too few to train this recognizer yet")
+            return
+        self.model = self.factory(self.num_components)
+        self.model.train(self.samples, self.labels)
+        self.cache_projections()
+
+    def update(self, faces, labels):
+        """Add samples by training again on all of them"""
+        if len(self.samples) != len(self.labels):
+            # read() restores the subspace, not the crops it was built from
+            raise ValueError("Model was read from disk without its samples; train it on every sample instead")
+        labels = np.asarray(labels, dtype=np.int32).reshape(-1)
+        self.train(self.samples + self.prepare(faces), np.concatenate([self.labels, labels]))
+
+    def cache_projections(self):
+        """Keep the trained subspace as numpy arrays for per-label distances"""
+        self.mean = self.model.getMean().reshape(-1).astype(np.float64)
+        self.basis = self.model.getEigenVectors().astype(np.float64)
+        self.projections = np.vstack([p.reshape(1, -1) for p in self.model.getProjections()])
+        self.projection_labels = self.model.getLabels().reshape(-1).astype(np.int32)
+        self.trained = True
+
+    def project(self, faces):
+        pixels = np.asarray(self.prepare(faces), dtype=np.float64).reshape(len(faces), -1)
+        return (pixels - self.mean) @ self.basis
+
+    def predict(self, face):
+        """(label, distance) of the nearest training sample, like cv2's predict"""
+        if not self.trained:
+            return -1, float('inf')
+        label, distance = self.model.predict(self.prepare([face])[0])
+        return int(label), distance / self.size
+
+    def label_distances(self, face):
+        """{label: distance to that label's nearest sample}"""
+        if not self.trained:
+            return {}
+        distances = np.linalg.norm(self.projections - self.project([face]), axis=1) / self.size
+        return {
+            int(label): float(distances[self.projection_labels == label].min())
+            for label in np.unique(self.projection_labels)
+        }
+
+    def label_distance(self, face, label):
+        """Distance to one label's nearest sample (inf if it has none)"""
+        if not self.trained:
+            return float('inf')
+        rows = self.projection_labels == label
+        if not rows.any():
+            return float('inf')
+        probe = self.project([face])
+        return float(np.linalg.norm(self.projections[rows] - probe, axis=1).min()) / self.size
+
+    def getLabels(self):
+        return self.labels.reshape(-1, 1)
+
+    def save(self, path):
+        self.model.write(path)
+
+    def read(self, path):
+        self.model.read(path)
+        self.size = int(round(np.sqrt(self.model.getMean().size)))
+        self.labels = self.model.getLabels().reshape(-1).astype(np.int32)
+        self.samples = []
+        self.cache_projections()
+
+
+class RecognizerBackend(ABC):
+    """How OpenCVFaceService builds, trains, scores and persists a recognizer
+
+    The gallery always keeps LBPH histograms (1:1 matching for the LBPH
+    backends, the identify/ index for all); descriptors names who computes
+    them, so a gallery is only recomputed when that changes. Confidence is
+    max(0, distance_scale - distance) / distance_scale.
+    """
+
+    name = None
+    # Legacy / trained model file under MEDIA_ROOT/models
+    model_file = None
+    descriptors = 'numpy'
+    # update() takes only the new samples
+    incremental = True
+    # 1:1 verification compares gallery histograms instead of asking the recognizer
+    matches_templates = True
+    # The trained model is saved at checkpoints (the LBPH ones are the gallery)
+    saves_model = False
+    distance_scale = 100.0
+
+    def __init__(self, distance_scale=None):
+        if distance_scale is not None:
+            self.distance_scale = float(distance_scale)
+
+    @abstractmethod
+    def create(self):
+        """A fresh, untrained recognizer"""
+
+    def confidence(self, distance):
+        """Map the recognizer's distance to the 0-1 confidence score"""
+        return max(0.0, self.distance_scale - distance) / self.distance_scale
+
+    def describe(self):
+        return {'backend': self.name, 'distance_scale': self.distance_scale}
+
+
+class OpenCVLBPHBackend(RecognizerBackend):
+    """cv2.face.LBPHFaceRecognizer (chi-square distances on LBP histograms)"""
+
+    name = 'opencv'
+    model_file = 'lbph_model.yml'
+    descriptors = 'opencv'
+
+    def create(self):
+        return cv2.face.LBPHFaceRecognizer_create()
+
+
+class NumpyLBPHBackend(RecognizerBackend):
+    """The vectorized uniform-LBP engine in attendance/lbp.py"""
+
+    name = 'numpy'
+    model_file = 'lbph_model.npz'
+
+    def create(self):
+        return NumpyLBPHRecognizer()
+
+
+class SubspaceBackend(RecognizerBackend):
+    """Shared options of the Eigen/Fisherfaces backends"""
+
+    descriptors = 'numpy'
+    incremental = False
+    matches_templates = False
+    saves_model = True
+    min_classes = 1
+    num_components = 0
+
+    def __init__(self, distance_scale=None, size=64, num_components=None):
+        super().__init__(distance_scale)
+        self.size = size
+        if num_components is not None:
+            self.num_components = num_components
+
+    def create(self):
+        return SubspaceRecognizer(self.factory, self.size, self.num_components, self.min_classes)
+
+    def describe(self):
+        return {**super().describe(), 'size': self.size, 'num_components': self.num_components}
+
+
+class EigenfacesBackend(SubspaceBackend):
+    """PCA of the crops: cheap to predict, but lighting dominates the
+    leading components"""
+
+    name = 'eigen'
+    model_file = 'eigenfaces_model.yml'
+    distance_scale = 60.0
+    # OpenCV's suggested component count for Eigenfaces
+    num_components = 80
+    factory = staticmethod(cv2.face.EigenFaceRecognizer_create)
+
+
+class FisherfacesBackend(SubspaceBackend):
+    """LDA on top of PCA: at most (employees - 1) components, so a tiny
+    model, but it needs two employees before it can be trained"""
+
+    name = 'fisher'
+    model_file = 'fisherfaces_model.yml'
+    distance_scale = 60.0
+    min_classes = 2
+    factory = staticmethod(cv2.face.FisherFaceRecognizer_create)
+
+
+# Backends selectable with FACE_RECOGNIZER_BACKEND
+RECOGNIZER_BACKENDS = {
+    'opencv': OpenCVLBPHBackend,
+    'numpy': NumpyLBPHBackend,
+    'eigen': EigenfacesBackend,
+    'fisher': FisherfacesBackend,
+}
+
+
+def create_backend(backend=None, options=None):
+    """The backend named by FACE_RECOGNIZER_BACKEND (default 'opencv')
+
+    options are keyword arguments for it (FACE_RECOGNIZER_OPTIONS by
+    default), e.g. {'distance_scale': 50} or {'size': 80}.
+    """
+    if backend is None:
+        backend = getattr(settings, 'FACE_RECOGNIZER_BACKEND', 'opencv')
+        if options is None:
+            options = getattr(settings, 'FACE_RECOGNIZER_OPTIONS', {})
+
+    if backend not in RECOGNIZER_BACKENDS:
+        raise ValueError(f"Unknown FACE_RECOGNIZER_BACKEND: {backend}")
+    return RECOGNIZER_BACKENDS[backend](**(options or {}))
+
@@ -1,3 +1,1318 @@
-from django.test import TestCase
+import asyncio
+import base64
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from unittest import mock
 
-# Create your tests here.
+import cv2
+import numpy as np
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from rest_framework.test import APIClient
+
+from .benchmarks import synthetic_face
+from .face_index import FaceIndex
+from .face_service import (
+    MATCH_THRESHOLD, LazyFaceService, OpenCVFaceService, jpeg_dimensions, split_jpeg_stream, warm_up_face_service,
+)
+from .gallery import FaceGallery, GalleryJournal, GallerySnapshot, GalleryStore
+from .lbp import NumpyLBPHRecognizer, chi_square_distances
+from .management.commands.bench_recognizers import label_distances
+from . import face_pool, quality
+from .detectors import DetectorUnavailable, HaarDetector, create_detector
+from .recognizers import create_backend
+from .training import job_cache, job_cache_key, registration_worker
+from .models import AttendanceRecord, Employee
+from .views import read_face_upload
+
+
+class NumpyLBPHRecognizerTests(SimpleTestCase):
+    subjects = range(1, 6)
+
+    def build_gallery(self):
+        faces = [synthetic_face(s, v) for s in self.subjects for v in range(4)]
+        labels = np.array([s for s in self.subjects for _ in range(4)], dtype=np.int32)
+        return faces, labels
+
+    def test_chi_square_matches_opencv(self):
+        rng = np.random.default_rng(0)
+        probe = rng.random((1, 300), dtype=np.float32)
+        templates = rng.random((4, 300), dtype=np.float32)
+        templates[0, :10] = 0
+        probe[0, :5] = 0
+
+        distances = chi_square_distances(probe, templates)[0]
+        expected = [cv2.compareHist(probe, t.reshape(1, -1), cv2.HISTCMP_CHISQR_ALT) for t in templates]
+        np.testing.assert_allclose(distances, expected, rtol=1e-4)
+
+    def test_chi_square_blocks_cover_every_pair(self):
+        rng = np.random.default_rng(1)
+        probes = rng.random((5, 300), dtype=np.float32)
+        templates = rng.random((7, 300), dtype=np.float32)
+
+        whole = chi_square_distances(probes, templates, block_pairs=35)
+        for block_pairs in (1, 3, 8):
+            np.testing.assert_allclose(chi_square_distances(probes, templates, block_pairs), whole, rtol=1e-6)
+        np.testing.assert_allclose(chi_square_distances(probes[:1], templates, 2), whole[:1], rtol=1e-6)
+
+    def test_decisions_match_opencv_lbph(self):
+        faces, labels = self.build_gallery()
+
+        opencv = cv2.face.LBPHFaceRecognizer_create()
+        opencv.train(faces, labels)
+        numpy_backend = NumpyLBPHRecognizer()
+        numpy_backend.train(faces, labels)
+
+        probes = [synthetic_face(s, v) for s in self.subjects for v in (7, 8)]
+        expected = [s for s in self.subjects for _ in (7, 8)]
+
+        batch_labels, _ = numpy_backend.predict_batch(np.array(probes))
+        for probe, subject, batch_label in zip(probes, expected, batch_labels):
+            opencv_label, _ = opencv.predict(probe)
+            numpy_label, _ = numpy_backend.predict(probe)
+            self.assertEqual(opencv_label, subject)
+            self.assertEqual(numpy_label, opencv_label)
+            self.assertEqual(batch_label, numpy_label)
+
+    def test_accept_reject_matches_opencv_lbph(self):
+        """1:1 decisions at MATCH_THRESHOLD agree for every probe/employee pair"""
+        faces, labels = self.build_gallery()
+        opencv, numpy_backend = create_backend('opencv'), create_backend('numpy')
+        opencv_model, numpy_model = opencv.create(), numpy_backend.create()
+        opencv_model.train(faces, labels)
+        numpy_model.train(faces, labels)
+
+        opencv_distances, numpy_distances = [], []
+        for subject in self.subjects:
+            for variant in (7, 8):
+                probe = synthetic_face(subject, variant)
+                expected = label_distances(opencv_model, probe)
+                actual = label_distances(numpy_model, probe)
+                self.assertEqual(actual.keys(), expected.keys())
+                for label in expected:
+                    accept = opencv.confidence(expected[label]) >= MATCH_THRESHOLD
+                    self.assertEqual(numpy_backend.confidence(actual[label]) >= MATCH_THRESHOLD, accept)
+                    self.assertEqual(accept, label == subject)
+                    opencv_distances.append(expected[label])
+                    numpy_distances.append(actual[label])
+
+        # Both engines order the distances (nearly) the same way
+        opencv_ranks = np.argsort(np.argsort(opencv_distances))
+        numpy_ranks = np.argsort(np.argsort(numpy_distances))
+        self.assertGreater(np.corrcoef(opencv_ranks, numpy_ranks)[0, 1], 0.9)
+
+    def test_update_appends_templates(self):
+        faces, labels = self.build_gallery()
+        recognizer = NumpyLBPHRecognizer()
+        recognizer.train(faces[:4], labels[:4])
+        recognizer.update(faces[4:], labels[4:])
+
+        self.assertEqual(recognizer.templates.shape, (len(faces), recognizer.extractor.dimensions))
+        self.assertEqual(recognizer.templates.dtype, np.float32)
+        self.assertTrue(recognizer.templates.flags['C_CONTIGUOUS'])
+        np.testing.assert_array_equal(recognizer.getLabels().reshape(-1), labels)
+
+
+class FaceIndexTests(SimpleTestCase):
+    def test_shortlist_search_matches_exact_search(self):
+        recognizer = NumpyLBPHRecognizer()
+        faces = np.array([synthetic_face(s, v) for s in range(1, 61) for v in range(3)])
+        recognizer.train(faces, np.repeat(np.arange(1, 61), 3))
+        index = FaceIndex(recognizer.templates, recognizer.labels, components=16, shortlist=30)
+        self.assertIsNotNone(index.projected)
+
+        for subject in range(1, 61, 7):
+            probe = recognizer.compute_histogram(synthetic_face(subject, 9))
+            exact = chi_square_distances(probe, recognizer.templates)[0]
+            results = index.search(probe, top_k=3)
+
+            self.assertEqual(len(results), 3)
+            self.assertEqual(results[0][0], subject)
+            self.assertAlmostEqual(results[0][1], float(exact.min()), places=3)
+
+    def test_batch_search_identifies_every_probe(self):
+        recognizer = NumpyLBPHRecognizer()
+        faces = np.array([synthetic_face(s, v) for s in range(1, 61) for v in range(3)])
+        recognizer.train(faces, np.repeat(np.arange(1, 61), 3))
+        index = FaceIndex(recognizer.templates, recognizer.labels, components=16, shortlist=30)
+
+        subjects = [3, 17, 42, 58]
+        probes = recognizer.extractor.compute(np.array([synthetic_face(s, 9) for s in subjects]))
+        results = index.search_batch(probes, top_k=1)
+
+        self.assertEqual([matches[0][0] for matches in results], subjects)
+        exact = chi_square_distances(probes, recognizer.templates).min(axis=1)
+        np.testing.assert_allclose([matches[0][1] for matches in results], exact, rtol=1e-4)
+
+
+    def test_new_gallery_reuses_the_fitted_basis(self):
+        extractor = NumpyLBPHRecognizer().extractor
+        faces = np.array([synthetic_face(s, v) for s in range(1, 61) for v in range(3)])
+        gallery = FaceGallery.empty().append(extractor.compute(faces), np.repeat(np.arange(1, 61), 3), faces)
+        snapshot = GallerySnapshot(gallery, {}, {})
+        index = snapshot.index(components=16, shortlist=30)
+
+        # A registration: the new snapshot's index projects only the new rows
+        extra = np.array([synthetic_face(61, v) for v in range(3)])
+        registered = snapshot.replace(gallery=gallery.append(extractor.compute(extra), [61] * 3, extra))
+        with mock.patch.object(FaceIndex, '_fit', autospec=True) as fit:
+            carried = registered.index(components=16, shortlist=30)
+        fit.assert_not_called()
+        self.assertIs(carried.basis, index.basis)
+        np.testing.assert_array_equal(carried.projected[:len(gallery)], index.projected)
+        np.testing.assert_allclose(carried.projected, FaceIndex(
+            registered.gallery.descriptors, registered.gallery.labels, components=16, shortlist=30,
+            ids=registered.gallery.metadata['template_id'], previous_fit=index.fit(),
+        ).projected)
+        probe = extractor.compute(synthetic_face(61, 9))
+        self.assertEqual(carried.search(probe, top_k=1)[0][0], 61)
+
+        # Removing an employee keeps the fit too; more than doubling the gallery refits
+        removed = registered.replace(gallery=registered.gallery.without_label(5)).index(components=16, shortlist=30)
+        self.assertIs(removed.basis, index.basis)
+        self.assertEqual(removed.search(probe, top_k=1)[0][0], 61)
+        tripled = gallery.append(
+            np.vstack([gallery.descriptors] * 2), np.concatenate([gallery.labels + 100, gallery.labels + 200]),
+            np.concatenate([faces, faces]),
+        )
+        self.assertIsNot(snapshot.replace(gallery=tripled).index(components=16, shortlist=30).basis, index.basis)
+
+
+class GalleryStoreTests(SimpleTestCase):
+    def test_snapshot_round_trip_is_memory_mapped(self):
+        recognizer = NumpyLBPHRecognizer()
+        faces = np.array([synthetic_face(s, v) for s in (1, 2) for v in range(2)])
+        labels = np.array([1, 1, 2, 2], dtype=np.int32)
+        gallery = FaceGallery.empty().append(recognizer.extractor.compute(faces), labels, faces)
+
+        with tempfile.TemporaryDirectory() as directory:
+            store = GalleryStore(directory)
+            self.assertEqual(store.save(gallery, {'backend': 'numpy'}), 1)
+            self.assertEqual(store.save(gallery, {'backend': 'numpy'}), 2)
+
+            loaded, header = store.load()
+            self.assertEqual(header['version'], 2)
+            self.assertEqual(header['count'], 4)
+            self.assertIsInstance(loaded.descriptors, np.memmap)
+            np.testing.assert_array_equal(loaded.descriptors, gallery.descriptors)
+            np.testing.assert_array_equal(loaded.labels, labels)
+            np.testing.assert_array_equal(loaded.faces, faces)
+            np.testing.assert_array_equal(loaded.metadata['template_id'], [0, 1, 2, 3])
+
+            grown = loaded.append(loaded.descriptors[:1], [3], loaded.faces[:1])
+            self.assertEqual(len(grown), 5)
+            self.assertEqual(grown.metadata['template_id'][-1], 4)
+
+    def test_append_in_place_is_visible_to_other_mappings(self):
+        recognizer = NumpyLBPHRecognizer()
+        faces = np.array([synthetic_face(s, v) for s in (1, 2) for v in range(2)])
+        gallery = FaceGallery.empty().append(recognizer.extractor.compute(faces), [1, 1, 2, 2], faces)
+
+        with tempfile.TemporaryDirectory() as directory:
+            store = GalleryStore(directory)
+            store.save(gallery, {'backend': 'numpy'})
+            writer, header = store.load()
+            reader, _ = store.load()
+            self.assertEqual(header['capacity'], 4 + GalleryStore.min_spare)
+
+            new_faces = np.array([synthetic_face(3, v) for v in range(2)])
+            descriptors = recognizer.extractor.compute(new_faces)
+            with store.locked():
+                grown = store.append_in_place(writer, descriptors, [3, 3], new_faces)
+
+            self.assertEqual(len(grown), 6)
+            self.assertIsInstance(grown.descriptors, np.memmap)
+            shared = reader.grown(6)
+            np.testing.assert_array_equal(shared.descriptors[4:], descriptors)
+            np.testing.assert_array_equal(shared.faces[4:], new_faces)
+            np.testing.assert_array_equal(shared.labels, [1, 1, 2, 2, 3, 3])
+            np.testing.assert_array_equal(shared.metadata['template_id'], np.arange(6))
+
+            # No room left: the caller has to fall back to a copying append
+            spare = GalleryStore.min_spare
+            too_many = np.repeat(new_faces[:1], spare, axis=0)
+            self.assertIsNone(store.append_in_place(
+                grown, recognizer.extractor.compute(too_many), [4] * spare, too_many
+            ))
+
+
+class GalleryJournalTests(SimpleTestCase):
+    def test_records_round_trip_and_torn_tail_is_ignored(self):
+        faces = np.array([synthetic_face(1, v) for v in range(2)])
+        descriptors = np.random.default_rng(0).random((2, 16), dtype=np.float32)
+
+        with tempfile.TemporaryDirectory() as directory:
+            journal = GalleryStore(directory).journal()
+            journal.append({'op': 'add', 'employee_id': 'EMP1', 'label': 1}, [descriptors, faces])
+            journal.append({'op': 'remove', 'employee_id': 'EMP1', 'label': 1})
+
+            # Simulate a crash halfway through a third append
+            with open(journal.path, 'ab') as f:
+                f.write(GalleryJournal.FRAME.pack(GalleryJournal.MAGIC, 100, 100) + b'{"op"')
+
+            records = list(journal.records())
+            self.assertEqual(len(records), 2)
+            header, (loaded_descriptors, loaded_faces) = records[0]
+            self.assertEqual(header, {'op': 'add', 'employee_id': 'EMP1', 'label': 1})
+            np.testing.assert_array_equal(loaded_descriptors, descriptors)
+            np.testing.assert_array_equal(loaded_faces, faces)
+            self.assertEqual(records[1], ({'op': 'remove', 'employee_id': 'EMP1', 'label': 1}, []))
+
+    def test_save_prunes_folded_journals(self):
+        with tempfile.TemporaryDirectory() as directory:
+            store = GalleryStore(directory)
+            store.journal().append({'op': 'remove', 'employee_id': 'EMP1', 'label': 1})
+            self.assertEqual(len(store.journal(0)), 1)
+
+            store.save(FaceGallery.empty(), {'backend': 'numpy'})
+            self.assertEqual(len(store.journal(0)), 0)
+            self.assertEqual(len(store.journal()), 0)
+
+
+class IncrementalTrainingTests(SimpleTestCase):
+    def register_all(self, service):
+        """Register a few batches; None stands for an image with no face"""
+        batches = [
+            ('EMP1', [synthetic_face(1, 0), None, synthetic_face(1, 1)]),
+            ('EMP2', [synthetic_face(2, 0), synthetic_face(2, 1)]),
+            ('EMP1', [synthetic_face(1, 2)]),
+            ('EMP3', [None]),
+        ]
+        accepted = 0
+        for employee_id, faces in batches:
+            with mock.patch.object(service, 'extract_face_features', side_effect=faces):
+                accepted += sum(service.register_face(employee_id, faces))
+        return accepted
+
+    def assert_template_count(self, backend):
+        with tempfile.TemporaryDirectory() as media_root:
+            with override_settings(MEDIA_ROOT=media_root, FACE_RECOGNIZER_BACKEND=backend):
+                service = OpenCVFaceService()
+                accepted = self.register_all(service)
+
+                self.assertEqual(accepted, 5)
+                self.assertEqual(len(service.gallery), accepted)
+                self.assertEqual(len(service.face_recognizer.getLabels()), accepted)
+                self.assertEqual(len(service.employee_templates(service.label_map['EMP1'])), 3)
+
+                self.assertTrue(service.rebuild_model())
+                self.assertEqual(len(service.gallery), accepted)
+                self.assertEqual(len(service.face_recognizer.getLabels()), accepted)
+
+    def test_opencv_backend_only_feeds_new_samples(self):
+        self.assert_template_count('opencv')
+
+    def test_numpy_backend_only_feeds_new_samples(self):
+        self.assert_template_count('numpy')
+
+
+    def test_gallery_without_crops_grows_in_place(self):
+        # A gallery migrated from a legacy model keeps descriptors only
+        extractor = NumpyLBPHRecognizer().extractor
+        legacy = np.array([synthetic_face(1, v) for v in range(3)])
+        gallery = FaceGallery(extractor.compute(legacy), np.array([1, 1, 1], dtype=np.int32))
+        with tempfile.TemporaryDirectory() as media_root:
+            with override_settings(MEDIA_ROOT=media_root, FACE_RECOGNIZER_BACKEND='numpy',
+                                   FACE_GALLERY_CHECKPOINT_RECORDS=3, FACE_GALLERY_PRIVATE_CHECKPOINT_RECORDS=2):
+                GalleryStore(os.path.join(media_root, 'models', 'gallery')).save(gallery, {
+                    'backend': 'numpy', 'label_map': {'EMP1': 1}, 'reverse_map': {'1': 'EMP1'},
+                })
+                service = OpenCVFaceService()
+                service.extract_face_features = lambda image: image
+                storage = service.gallery.storage
+                self.assertIsNone(storage.faces)
+
+                for subject in (2, 3):
+                    faces = [synthetic_face(subject, v) for v in range(3)]
+                    self.assertEqual(service.register_face(f'EMP{subject}', faces), [True] * 3)
+                    self.assertIs(service.gallery.storage, storage)
+                self.assertIsNone(service._checkpoint_thread)
+                self.assertEqual(service.gallery_version, 1)
+
+                # The third record reaches the (shared-gallery) checkpoint limit
+                service.register_face('EMP4', [synthetic_face(4, v) for v in range(3)])
+                service._checkpoint_thread.join(30)
+                self.assertEqual(service.gallery_version, 2)
+
+                # A removal copies the gallery; private copies are checkpointed
+                # in batches too, just smaller ones
+                checkpoint = service._checkpoint_thread
+                self.assertTrue(service.remove_employee('EMP2'))
+                self.assertIsNone(service.gallery.storage)
+                self.assertIs(service._checkpoint_thread, checkpoint)
+                service.register_face('EMP5', [synthetic_face(5, v) for v in range(3)])
+                service._checkpoint_thread.join(30)
+                self.assertEqual(service.gallery_version, 3)
+
+                reloaded = OpenCVFaceService()
+                reloaded.extract_face_features = lambda image: image
+                self.assertEqual(len(reloaded.gallery), 12)
+                self.assertNotIn('EMP2', reloaded.label_map)
+                self.assertEqual(reloaded.identify_face(synthetic_face(3, 7), top_k=1)[0]['employee_id'], 'EMP3')
+
+class GalleryHotReloadTests(SimpleTestCase):
+    """Two service instances on one store stand in for two worker processes"""
+
+    def register(self, service, employee_id, subject):
+        faces = [synthetic_face(subject, v) for v in range(3)]
+        with mock.patch.object(service, 'extract_face_features', side_effect=faces):
+            return service.register_face(employee_id, faces)
+
+    def test_workers_pick_up_each_others_changes(self):
+        with tempfile.TemporaryDirectory() as media_root:
+            with override_settings(MEDIA_ROOT=media_root, FACE_RECOGNIZER_BACKEND='numpy',
+                                   FACE_GALLERY_RELOAD_INTERVAL=0):
+                worker_a = OpenCVFaceService()
+                worker_b = OpenCVFaceService()
+
+                self.register(worker_a, 'EMP1', 1)
+                self.assertTrue(worker_b.gallery_changed())
+
+                # B catches up before choosing a label, so labels don't collide
+                self.register(worker_b, 'EMP2', 2)
+                self.assertEqual(worker_b.label_map, {'EMP1': 1, 'EMP2': 2})
+                self.assertEqual(len(worker_b.gallery), 6)
+
+                worker_a.maybe_reload()
+                worker_a._reload_thread.join()
+                self.assertEqual(worker_a.label_map, {'EMP1': 1, 'EMP2': 2})
+                self.assertEqual(len(worker_a.gallery), 6)
+                self.assertFalse(worker_a.gallery_changed())
+
+                # A checkpoint publishes a new version; B loads it instead of the journal
+                self.assertTrue(worker_a.save_model())
+                worker_b.reload_gallery()
+                self.assertEqual(worker_b.gallery_version, worker_a.gallery_version)
+                self.assertEqual(len(worker_b.gallery), 6)
+                self.assertIsInstance(worker_b.gallery.descriptors, np.memmap)
+
+
+    def test_unknown_employee_catch_up_is_rate_limited(self):
+        with tempfile.TemporaryDirectory() as media_root:
+            with override_settings(MEDIA_ROOT=media_root, FACE_RECOGNIZER_BACKEND='numpy',
+                                   FACE_GALLERY_RELOAD_INTERVAL=60):
+                service = OpenCVFaceService()
+                service.extract_face_features = lambda image: image
+                with mock.patch.object(service, 'reload_if_changed') as reload_if_changed:
+                    for _ in range(5):
+                        self.assertEqual(service.verify_face('NOBODY', synthetic_face(1, 0)), (False, 0.0))
+                reload_if_changed.assert_called_once()
+
+
+class ConcurrentAccessTests(SimpleTestCase):
+    """Verification threads running while another thread registers and removes"""
+
+    def check_snapshot(self, snapshot):
+        """Label maps and gallery of one snapshot always belong together"""
+        gallery_labels = {int(label) for label in np.unique(snapshot.gallery.labels)}
+        self.assertEqual(set(snapshot.label_map.values()), gallery_labels)
+        self.assertEqual(set(snapshot.reverse_label_map), gallery_labels)
+        for employee_id, label in snapshot.label_map.items():
+            self.assertEqual(snapshot.employee_for_label(label), employee_id)
+
+    def test_concurrent_verify_and_register(self):
+        errors = []
+        done = threading.Event()
+
+        with tempfile.TemporaryDirectory() as media_root:
+            with override_settings(MEDIA_ROOT=media_root, FACE_RECOGNIZER_BACKEND='numpy'):
+                service = OpenCVFaceService()
+                # Images are already preprocessed faces in this test
+                service.extract_face_features = lambda image: image
+                service.register_face('EMP1', [synthetic_face(1, v) for v in range(3)])
+                probe = synthetic_face(1, 7)
+
+                def verifier():
+                    try:
+                        while not done.is_set():
+                            match, confidence = service.verify_face('EMP1', probe)
+                            self.assertTrue(match)
+                            self.assertEqual(service.identify_face(probe, top_k=1)[0]['employee_id'], 'EMP1')
+                            self.check_snapshot(service.snapshot)
+                    except Exception as e:
+                        errors.append(e)
+
+                def writer():
+                    try:
+                        for subject in range(2, 12):
+                            employee_id = f'EMP{subject}'
+                            faces = [synthetic_face(subject, v) for v in range(3)]
+                            self.assertEqual(service.register_face(employee_id, faces), [True] * 3)
+                            if subject % 2:
+                                self.assertTrue(service.remove_employee(employee_id))
+                    except Exception as e:
+                        errors.append(e)
+                    finally:
+                        done.set()
+
+                threads = [threading.Thread(target=verifier) for _ in range(4)]
+                threads.append(threading.Thread(target=writer))
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join(60)
+                if service._checkpoint_thread is not None:
+                    service._checkpoint_thread.join(60)
+
+                self.assertEqual(errors, [])
+                expected = {'EMP1'} | {f'EMP{subject}' for subject in range(2, 12, 2)}
+                self.assertEqual(set(service.label_map), expected)
+                self.assertEqual(len(service.gallery), 3 * len(expected))
+                self.check_snapshot(service.snapshot)
+
+                # Everything written under contention reloads intact
+                reloaded = OpenCVFaceService()
+                self.assertEqual(dict(reloaded.label_map), dict(service.label_map))
+                self.assertEqual(len(reloaded.gallery), len(service.gallery))
+
+
+class BurstVerificationTests(SimpleTestCase):
+    def encode(self, face, blur=0):
+        if blur:
+            face = cv2.GaussianBlur(face, (0, 0), blur)
+        return cv2.imencode('.jpg', face)[1].tobytes()
+
+    def test_sharpest_frame_is_tried_first_and_ends_the_burst(self):
+        face = np.tile(synthetic_face(1, 0), (2, 2))
+        sharp = self.encode(face)
+        burst = [self.encode(face, blur=3), sharp, self.encode(face, blur=6)]
+
+        with tempfile.TemporaryDirectory() as media_root:
+            with override_settings(MEDIA_ROOT=media_root):
+                service = OpenCVFaceService()
+                with mock.patch.object(service, 'is_valid_face_image', return_value=True), \
+                        mock.patch.object(service, 'verify_face', return_value=(True, 0.9)) as verify:
+                    result = service.verify_burst('EMP1', burst)
+
+                self.assertEqual(result, (True, 0.9, 1, sharp))
+                self.assertEqual(verify.call_args[0][1].source, sharp)
+
+                with mock.patch.object(service, 'is_valid_face_image', return_value=True), \
+                        mock.patch.object(service, 'verify_face', side_effect=[(False, 0.3), (False, 0.5)]) as verify:
+                    result = service.verify_burst('EMP1', burst, max_frames=2)
+
+                self.assertEqual(result[:3], (False, 0.5, 2))
+                self.assertEqual(verify.call_count, 2)
+
+
+class QualityGateTests(SimpleTestCase):
+    def check(self, image):
+        return quality.assess(quality.thumbnail(image), image.shape)
+
+    def test_rejection_reasons(self):
+        face = np.tile(synthetic_face(1, 0), (2, 2))
+        self.assertIsNone(self.check(face))
+        self.assertEqual(self.check(cv2.GaussianBlur(face, (0, 0), 12)), quality.REJECT_BLURRY)
+        self.assertEqual(self.check(face // 8), quality.REJECT_TOO_DARK)
+        self.assertEqual(self.check(255 - face // 16), quality.REJECT_TOO_BRIGHT)
+        self.assertEqual(self.check(np.full_like(face, 128)), quality.REJECT_LOW_CONTRAST)
+        self.assertEqual(self.check(face[:80, :80]), quality.REJECT_TOO_SMALL)
+
+    def test_gate_skips_detection(self):
+        dark = cv2.imencode('.jpg', np.zeros((400, 400), dtype=np.uint8))[1].tobytes()
+        with tempfile.TemporaryDirectory() as media_root:
+            with override_settings(MEDIA_ROOT=media_root):
+                service = OpenCVFaceService()
+                frame = service.analyze_frame(dark)
+                with mock.patch.object(service, 'detect_faces') as detect:
+                    self.assertFalse(service.is_valid_face_image(frame))
+                detect.assert_not_called()
+                self.assertEqual(frame.rejection, quality.REJECT_TOO_DARK)
+
+    def test_preflight_reports_guidance_codes(self):
+        dark = cv2.imencode('.jpg', np.tile(synthetic_face(1, 0), (2, 2)) // 8)[1].tobytes()
+        with tempfile.TemporaryDirectory() as media_root:
+            with override_settings(MEDIA_ROOT=media_root):
+                result = OpenCVFaceService().preflight(dark)
+
+        self.assertFalse(result['ready'])
+        self.assertFalse(result['face_present'])
+        self.assertEqual(result['lighting'], quality.REJECT_TOO_DARK)
+        self.assertEqual(result['issues'], ['no_face', quality.REJECT_TOO_DARK])
+
+
+    def test_preflight_and_gate_share_the_limits(self):
+        image = np.tile(synthetic_face(1, 0), (2, 2)) // 8
+        dark = cv2.imencode('.jpg', image)[1].tobytes()
+        with tempfile.TemporaryDirectory() as media_root:
+            with override_settings(MEDIA_ROOT=media_root), mock.patch.object(quality, 'DARK_FRAME_MAX', 0):
+                service = OpenCVFaceService()
+                self.assertIsNone(quality.exposure_issue(quality.thumbnail(image)))
+                self.assertEqual(service.preflight(dark)['lighting'], 'ok')
+
+        face = np.full((120, 120), 25, dtype=np.uint8)
+        self.assertEqual(quality.face_brightness_issue(face), 'face_too_dark')
+        with mock.patch.object(quality, 'FACE_MIN_BRIGHTNESS', 20):
+            self.assertIsNone(quality.face_brightness_issue(face))
+
+class QualityGateStatsTests(SimpleTestCase):
+    def test_saved_time_counts_only_frames_that_skipped_detection(self):
+        stats = quality.QualityGateStats()
+        for reason in (None, quality.REJECT_UNDECODABLE, quality.REJECT_UNDECODABLE,
+                       quality.REJECT_BLURRY, quality.REJECT_TOO_DARK):
+            stats.record_check(reason)
+        stats.record_detection(0.02)
+        stats.record_detection(0.04)
+
+        report = stats.to_dict()
+        self.assertEqual((report['checked'], report['rejected']), (5, 4))
+        self.assertEqual(report['mean_detection_ms'], 30.0)
+        self.assertAlmostEqual(report['saved_seconds'], 0.06)
+
+
+class DetectorBackendTests(SimpleTestCase):
+    def test_options_and_fallback(self):
+        detector = create_detector('cascade', {'cascade': 'haarcascade_frontalface_alt2.xml', 'min_neighbors': 3})
+        self.assertEqual(detector.describe()['cascade'], 'haarcascade_frontalface_alt2.xml')
+        self.assertEqual(detector.min_neighbors, 3)
+
+        # A missing cascade (e.g. LBP on a pip install) falls back to Haar
+        self.assertIsInstance(create_detector('cascade', {'cascade': 'missing.xml'}), HaarDetector)
+        with self.assertRaises(DetectorUnavailable):
+            create_detector('cascade', {'cascade': 'missing.xml'}, fallback=None)
+        with self.assertRaises(ValueError):
+            create_detector('unknown')
+
+    def test_service_uses_configured_detector(self):
+        with tempfile.TemporaryDirectory() as media_root:
+            with override_settings(MEDIA_ROOT=media_root, FACE_DETECTOR_BACKEND='cascade',
+                                   FACE_DETECTOR_OPTIONS={'cascade': 'haarcascade_frontalface_alt2.xml'}):
+                service = OpenCVFaceService()
+
+        self.assertEqual(service.face_detector.describe()['cascade'], 'haarcascade_frontalface_alt2.xml')
+        faces, gray = service.detect_faces(np.zeros((200, 200), dtype=np.uint8))
+        self.assertEqual(len(faces), 0)
+        self.assertEqual(gray.shape, (200, 200))
+
+
+class RecognizerBackendTests(SimpleTestCase):
+    def register(self, service, employee_id, subject):
+        return service.register_face(employee_id, [synthetic_face(subject, v) for v in range(3)])
+
+    def test_confidence_mapping(self):
+        self.assertAlmostEqual(create_backend('opencv', {}).confidence(40), 0.6)
+        self.assertAlmostEqual(create_backend('eigen', {'distance_scale': 50}).confidence(20), 0.6)
+        self.assertEqual(create_backend('fisher', {}).confidence(float('inf')), 0.0)
+        with self.assertRaises(ValueError):
+            create_backend('unknown', {})
+
+    def test_subspace_backends_verify_and_persist(self):
+        for backend in ('eigen', 'fisher'):
+            with self.subTest(backend=backend), tempfile.TemporaryDirectory() as media_root:
+                with override_settings(MEDIA_ROOT=media_root, FACE_RECOGNIZER_BACKEND=backend):
+                    service = OpenCVFaceService()
+                    # Images are already preprocessed faces in this test
+                    service.extract_face_features = lambda image: image
+
+                    self.register(service, 'EMP1', 1)
+                    self.register(service, 'EMP2', 2)
+                    self.assertEqual(len(service.face_recognizer.getLabels()), 6)
+                    self.assertTrue(service.verify_face('EMP1', synthetic_face(1, 7))[0])
+                    self.assertFalse(service.verify_face('EMP1', synthetic_face(2, 7))[0])
+
+                    # A restarted worker reads the checkpointed model instead of retraining
+                    self.assertTrue(service.save_model())
+                    restarted = OpenCVFaceService()
+                    restarted.extract_face_features = lambda image: image
+                    self.assertFalse(restarted._recognizer_stale)
+                    self.assertTrue(restarted.verify_face('EMP2', synthetic_face(2, 7))[0])
+
+    def test_identify_mode_predicts_from_the_snapshot_without_the_lock(self):
+        for backend in ('opencv', 'numpy'):
+            with self.subTest(backend=backend), tempfile.TemporaryDirectory() as media_root:
+                with override_settings(MEDIA_ROOT=media_root, FACE_RECOGNIZER_BACKEND=backend,
+                                       FACE_VERIFICATION_MODE='identify'):
+                    service = OpenCVFaceService()
+                    service.extract_face_features = lambda image: image
+                    self.register(service, 'EMP1', 1)
+                    self.register(service, 'EMP2', 2)
+
+                    probe = synthetic_face(2, 7)
+                    label, distance = service.predict(probe)
+                    expected_label, expected_distance = service.face_recognizer.predict(probe)
+                    self.assertEqual(label, expected_label)
+                    self.assertAlmostEqual(distance, expected_distance, places=2)
+
+                    # A registration holding the recognizer lock doesn't block verification
+                    results = []
+                    with service._recognizer_lock:
+                        thread = threading.Thread(target=lambda: results.append(service.verify_face('EMP2', probe)))
+                        thread.start()
+                        thread.join(10)
+                    self.assertFalse(thread.is_alive())
+                    self.assertTrue(results[0][0])
+                    if service._checkpoint_thread is not None:
+                        service._checkpoint_thread.join(30)
+
+    def test_subspace_update_trains_on_every_sample(self):
+        recognizer = create_backend('eigen', {}).create()
+        recognizer.train([synthetic_face(s, v) for s in (1, 2) for v in range(3)], [1, 1, 1, 2, 2, 2])
+        recognizer.update([synthetic_face(3, v) for v in range(3)], [3, 3, 3])
+
+        self.assertEqual(recognizer.getLabels().reshape(-1).tolist(), [1, 1, 1, 2, 2, 2, 3, 3, 3])
+        self.assertEqual(recognizer.predict(synthetic_face(3, 7))[0], 3)
+        self.assertEqual(recognizer.predict(synthetic_face(1, 7))[0], 1)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'eigen.yml')
+            recognizer.save(path)
+            restored = create_backend('eigen', {}).create()
+            restored.read(path)
+        with self.assertRaises(ValueError):
+            restored.update([synthetic_face(4, 0)], [4])
+
+    def test_identify_uses_the_backend_scale(self):
+        with tempfile.TemporaryDirectory() as media_root:
+            with override_settings(MEDIA_ROOT=media_root, FACE_RECOGNIZER_BACKEND='numpy',
+                                   FACE_RECOGNIZER_OPTIONS={'distance_scale': 400}):
+                service = OpenCVFaceService()
+                self.assertIs(service.backend, service.backend)
+                service.extract_face_features = lambda image: image
+                self.register(service, 'EMP1', 1)
+
+                candidates = service.identify_face(synthetic_face(1, 7))
+
+                frame = cv2.resize(synthetic_face(1, 7), (400, 400), interpolation=cv2.INTER_CUBIC)
+                whole_frame = np.array([[0, 0, 400, 400]], dtype=np.int32)
+                with mock.patch.object(service, 'detect_faces', side_effect=lambda image, **kwargs: (
+                        whole_frame * image.shape[0] // 400, image)):
+                    faces = service.identify_faces(cv2.imencode('.png', frame)[1].tobytes())
+                if service._checkpoint_thread is not None:
+                    service._checkpoint_thread.join(30)
+
+        for candidate in (candidates[0], faces[0]['candidates'][0]):
+            self.assertGreater(candidate['distance'], 0)
+            self.assertAlmostEqual(candidate['confidence_score'], (400 - candidate['distance']) / 400)
+
+    def test_fisherfaces_waits_for_a_second_employee(self):
+        with tempfile.TemporaryDirectory() as media_root:
+            with override_settings(MEDIA_ROOT=media_root, FACE_RECOGNIZER_BACKEND='fisher'):
+                service = OpenCVFaceService()
+                service.extract_face_features = lambda image: image
+
+                self.register(service, 'EMP1', 1)
+                self.assertEqual(service.verify_face('EMP1', synthetic_face(1, 7)), (False, 0.0))
+                self.register(service, 'EMP2', 2)
+                self.assertTrue(service.verify_face('EMP1', synthetic_face(1, 7))[0])
+
+
+class TieredVerificationTests(SimpleTestCase):
+    def capture(self, subject, variant):
+        face = np.tile(synthetic_face(subject, variant), (2, 2))
+        return cv2.imencode('.png', face)[1].tobytes()
+
+    def test_fast_tier_accepts_and_full_tier_decides_the_rest(self):
+        def detect(image, min_size=(100, 100), max_side=None, detector=None):
+            return np.array([[0, 0, image.shape[1], image.shape[0]]], dtype=np.int32), image
+
+        with tempfile.TemporaryDirectory() as media_root:
+            with override_settings(MEDIA_ROOT=media_root, FACE_VERIFICATION_MODE='tiered'):
+                service = OpenCVFaceService()
+                with mock.patch.object(service, 'detect_faces', side_effect=detect) as detect_faces:
+                    service.register_face('EMP1', [self.capture(1, v) for v in range(3)])
+                    service.register_face('EMP2', [self.capture(2, v) for v in range(3)])
+                    detect_faces.reset_mock()
+
+                    genuine = service.analyze_frame(self.capture(1, 1))
+                    self.assertTrue(service.verify_face('EMP1', genuine)[0])
+                    self.assertEqual(genuine.tier, 'fast')
+                    # The full-resolution detection never ran
+                    self.assertEqual(
+                        [call.kwargs.get('detector') for call in detect_faces.call_args_list],
+                        [service.fast_detector]
+                    )
+
+                    # Not clearly EMP1: the one_to_one pipeline decides
+                    other = service.analyze_frame(self.capture(2, 1))
+                    result = service.verify_face('EMP1', other)
+                    self.assertEqual(other.tier, 'full')
+                    with override_settings(FACE_VERIFICATION_MODE='one_to_one'):
+                        self.assertEqual(service.verify_face('EMP1', self.capture(2, 1)), result)
+
+
+class ReducedDecodeTests(SimpleTestCase):
+    def test_jpeg_dimensions_reads_the_frame_header(self):
+        jpeg = cv2.imencode('.jpg', np.zeros((30, 50), dtype=np.uint8))[1].tobytes()
+        self.assertEqual(jpeg_dimensions(jpeg), (50, 30))
+
+        png = cv2.imencode('.png', np.zeros((30, 50), dtype=np.uint8))[1].tobytes()
+        self.assertIsNone(jpeg_dimensions(png))
+        self.assertIsNone(jpeg_dimensions(b'\xff\xd8\xff'))
+        self.assertIsNone(jpeg_dimensions(jpeg[:20]))
+        self.assertIsNone(jpeg_dimensions(b'not an image at all'))
+
+    def test_large_jpeg_decodes_reduced(self):
+        capture = np.tile(synthetic_face(1, 0), (15, 20))
+        self.assertEqual(capture.shape, (3000, 4000))
+        jpeg = cv2.imencode('.jpg', capture)[1].tobytes()
+
+        with tempfile.TemporaryDirectory() as media_root:
+            with override_settings(MEDIA_ROOT=media_root, FACE_DECODE_MIN_SIDE=480):
+                service = OpenCVFaceService()
+                self.assertEqual(service.reduced_decode_factor(jpeg), 4)
+
+                frame = service.analyze_frame(jpeg)
+                self.assertEqual(frame.scale, 4)
+                self.assertEqual(frame.image.shape, (750, 1000))
+                self.assertEqual(frame.image.ndim, 2)
+
+    def test_other_input_falls_back_to_a_full_decode(self):
+        png = cv2.imencode('.png', np.tile(synthetic_face(1, 0), (5, 5)))[1].tobytes()
+
+        with tempfile.TemporaryDirectory() as media_root:
+            with override_settings(MEDIA_ROOT=media_root):
+                service = OpenCVFaceService()
+                self.assertEqual(service.reduced_decode_factor(png), 1)
+                gray, scale = service.decode_image(png)
+                self.assertEqual((gray.shape, scale), ((1000, 1000), 1))
+
+                for garbage in (b'not an image at all', b'\xff\xd8\xff\xe0garbage', b''):
+                    self.assertEqual(service.decode_image(garbage), (None, 1))
+                frame = service.analyze_frame(b'\xff\xd8\xff\xe0garbage')
+                self.assertIsNone(frame.image)
+                self.assertEqual(list(frame.faces), [])
+
+
+def create_employee(employee_id, **fields):
+    user = User.objects.create_user(username=employee_id.lower(), password='secret', first_name='Test')
+    return Employee.objects.create(user=user, employee_id=employee_id, **fields)
+
+
+class JpegStreamTests(SimpleTestCase):
+    def jpeg(self, subject, size=64):
+        return cv2.imencode('.jpg', cv2.resize(synthetic_face(subject, 0), (size, size)))[1].tobytes()
+
+    def test_concatenated_jpegs_are_split(self):
+        first, second = self.jpeg(1), self.jpeg(2, size=80)
+        self.assertEqual(split_jpeg_stream(first + second), [first, second])
+        self.assertEqual(split_jpeg_stream(first), [first])
+
+    def test_embedded_thumbnail_does_not_end_the_image(self):
+        thumbnail = self.jpeg(3, size=16)
+        payload = b'Exif\x00\x00' + thumbnail
+        app1 = b'\xff\xe1' + (len(payload) + 2).to_bytes(2, 'big') + payload
+        jpeg = self.jpeg(1)
+        with_exif = jpeg[:2] + app1 + jpeg[2:]
+
+        self.assertEqual(split_jpeg_stream(with_exif + jpeg), [with_exif, jpeg])
+
+    def test_png_and_truncated_data(self):
+        png = cv2.imencode('.png', synthetic_face(1, 0))[1].tobytes()
+        jpeg = self.jpeg(1)
+
+        self.assertEqual(split_jpeg_stream(png), [])
+        self.assertEqual(split_jpeg_stream(b''), [])
+        self.assertEqual(split_jpeg_stream(jpeg[:len(jpeg) // 2]), [])
+        # A complete image followed by a cut-off one keeps the complete one
+        self.assertEqual(split_jpeg_stream(jpeg + jpeg[:len(jpeg) // 2]), [jpeg])
+
+
+class FaceServiceAPIMixin:
+    """Views talk to a fresh service on a temporary MEDIA_ROOT"""
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.service = OpenCVFaceService()
+        self.addCleanup(self.join_checkpoint)
+        self.patch('attendance.views.face_service', self.service)
+        self.client = APIClient()
+
+    def join_checkpoint(self):
+        """Let a background checkpoint finish before MEDIA_ROOT is removed"""
+        if self.service._checkpoint_thread is not None:
+            self.service._checkpoint_thread.join(30)
+
+    def patch(self, *args, **kwargs):
+        """mock.patch (a dotted path) or mock.patch.object (an object and a name) for the whole test"""
+        patcher = mock.patch(*args, **kwargs) if isinstance(args[0], str) else mock.patch.object(*args, **kwargs)
+        mocked = patcher.start()
+        self.addCleanup(patcher.stop)
+        return mocked
+
+    def capture(self, subject, variant):
+        """PNG of a synthetic face scaled to 400px (detection is patched to find it)"""
+        face = cv2.resize(synthetic_face(subject, variant), (400, 400), interpolation=cv2.INTER_CUBIC)
+        return cv2.imencode('.png', face)[1].tobytes()
+
+    def detect_whole_frame(self):
+        """Make the detector report one face covering the whole frame"""
+        def detect(image, min_size=(100, 100), max_side=None, detector=None):
+            return np.array([[0, 0, image.shape[1], image.shape[0]]], dtype=np.int32), image
+        return self.patch(self.service, 'detect_faces', side_effect=detect)
+
+
+class FaceServiceAPITestCase(FaceServiceAPIMixin, TestCase):
+    pass
+
+
+class FaceUploadTests(FaceServiceAPITestCase):
+    """mark-attendance/ gets the same capture from every upload format"""
+
+    def setUp(self):
+        super().setUp()
+        self.frames = []
+        self.patch(self.service, 'is_valid_face_image', side_effect=self.accept)
+        self.patch(self.service, 'verify_face', return_value=(True, 0.9))
+
+        create_employee('EMP1')
+        self.capture = np.tile(synthetic_face(1, 0), (2, 3))
+        self.jpeg = cv2.imencode('.jpg', self.capture)[1].tobytes()
+
+    def accept(self, frame):
+        # Decode while the request (and any uploaded file) is still open
+        self.assertIsNotNone(frame.image)
+        self.frames.append(frame)
+        return True
+
+    def assert_marked(self, response):
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertTrue(response.json()['attendance']['is_verified'])
+        self.assertEqual(AttendanceRecord.objects.count(), 1)
+        self.assertEqual(len(self.frames), 1)
+        self.assertEqual(self.frames[0].image.shape, self.capture.shape)
+
+    def test_legacy_base64_json(self):
+        face_image = 'data:image/jpeg;base64,' + base64.b64encode(self.jpeg).decode()
+        response = self.client.post('/api/mark-attendance/', {
+            'employee_id': 'EMP1', 'attendance_type': 'CHECK_IN', 'face_image': face_image,
+        }, format='json')
+        self.assert_marked(response)
+
+    def test_multipart_upload(self):
+        upload = SimpleUploadedFile('capture.jpg', self.jpeg, content_type='image/jpeg')
+        response = self.client.post('/api/mark-attendance/', {
+            'employee_id': 'EMP1', 'attendance_type': 'CHECK_IN', 'face_image': upload,
+        }, format='multipart')
+        self.assert_marked(response)
+
+    def test_raw_jpeg_body(self):
+        response = self.client.generic(
+            'POST', '/api/mark-attendance/?employee_id=EMP1&attendance_type=CHECK_IN',
+            self.jpeg, content_type='image/jpeg'
+        )
+        self.assert_marked(response)
+        self.assertEqual(self.frames[0].source, self.jpeg)
+
+    def test_read_face_upload_for_the_async_views(self):
+        factory = RequestFactory()
+
+        request = factory.generic('POST', '/?employee_id=EMP1', self.jpeg + self.jpeg, content_type='image/jpeg')
+        data, images = read_face_upload(request, 'face_image')
+        self.assertEqual((data.get('employee_id'), images), ('EMP1', [self.jpeg, self.jpeg]))
+
+        upload = SimpleUploadedFile('capture.jpg', self.jpeg, content_type='image/jpeg')
+        request = factory.post('/', {'employee_id': 'EMP1', 'face_images': [upload]})
+        data, images = read_face_upload(request, 'face_image', 'face_images')
+        self.assertEqual((data.get('employee_id'), images), ('EMP1', [self.jpeg]))
+
+        encoded = base64.b64encode(self.jpeg).decode()
+        request = factory.post('/', {'employee_id': 'EMP1', 'face_image': encoded}, content_type='application/json')
+        data, images = read_face_upload(request, 'face_image')
+        self.assertEqual((data.get('employee_id'), images), ('EMP1', [encoded]))
+
+
+class IdentifyViewTests(FaceServiceAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.detect = self.detect_whole_frame()
+        for subject in (1, 2):
+            employee_id = f'EMP{subject}'
+            create_employee(employee_id)
+            self.service.register_face(employee_id, [self.capture(subject, v) for v in range(3)])
+
+    def identify(self, capture):
+        return self.client.post('/api/identify/', {'face_image': base64.b64encode(capture).decode()}, format='json')
+
+    def test_registered_employee_is_identified(self):
+        response = self.identify(self.capture(2, 5))
+
+        self.assertEqual(response.status_code, 200, response.content)
+        data = response.json()
+        self.assertTrue(data['identified'])
+        self.assertEqual(data['employee_id'], 'EMP2')
+        self.assertEqual(data['employee_name'], 'Test')
+        self.assertGreaterEqual(data['confidence_score'], MATCH_THRESHOLD)
+        self.assertEqual(data['candidates'][0]['employee_id'], 'EMP2')
+        self.assertTrue(data['candidates'][0]['is_match'])
+
+    def test_unknown_face_is_below_the_threshold(self):
+        response = self.identify(self.capture(9, 0))
+
+        self.assertEqual(response.status_code, 200, response.content)
+        data = response.json()
+        self.assertFalse(data['identified'])
+        self.assertIsNone(data['employee_id'])
+        self.assertTrue(data['candidates'])
+        for candidate in data['candidates']:
+            self.assertLess(candidate['confidence_score'], MATCH_THRESHOLD)
+            self.assertFalse(candidate['is_match'])
+
+    def test_frame_without_a_face_is_rejected(self):
+        self.detect.side_effect = lambda image, **kwargs: (np.empty((0, 4), dtype=np.int32), image)
+        response = self.identify(self.capture(1, 5))
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['validation'], 'failed')
+
+
+class GroupCheckInViewTests(FaceServiceAPITestCase):
+    """group-check-in/ on a frame with EMP1, an unknown person and EMP2"""
+
+    subjects = (1, 9, 2)
+
+    def setUp(self):
+        super().setUp()
+        self.detect = self.patch(self.service, 'detect_faces', side_effect=self.detect_tiles)
+        for subject in (1, 2):
+            create_employee(f'EMP{subject}')
+            self.service.register_face(f'EMP{subject}', [self.capture(subject, v) for v in range(3)])
+
+    def detect_tiles(self, image, min_size=(100, 100), max_side=None, detector=None):
+        """One face per square tile, whether the registration capture or the group frame"""
+        side = image.shape[0]
+        count = image.shape[1] // side
+        return np.array([[i * side, 0, side, side] for i in range(count)], dtype=np.int32), image
+
+    def group_frame(self):
+        tiles = [cv2.imdecode(np.frombuffer(self.capture(s, 5), np.uint8), cv2.IMREAD_COLOR) for s in self.subjects]
+        return base64.b64encode(cv2.imencode('.png', np.hstack(tiles))[1].tobytes()).decode()
+
+    def check_in(self, face_image):
+        return self.client.post('/api/group-check-in/', {
+            'face_image': face_image, 'attendance_type': 'CHECK_IN',
+        }, format='json')
+
+    def test_every_recognized_face_is_recorded(self):
+        response = self.check_in(self.group_frame())
+
+        self.assertEqual(response.status_code, 200, response.content)
+        data = response.json()
+        self.assertEqual(data['faces_detected'], 3)
+        self.assertEqual(data['recognized'], 2)
+        self.assertEqual([face['employee_id'] for face in data['faces']], ['EMP1', None, 'EMP2'])
+        self.assertEqual([face['box'][0] for face in data['faces']], [0, 400, 800])
+        self.assertLess(data['faces'][1]['confidence_score'], MATCH_THRESHOLD)
+        for face in (data['faces'][0], data['faces'][2]):
+            self.assertGreaterEqual(face['confidence_score'], MATCH_THRESHOLD)
+
+        records = AttendanceRecord.objects.order_by('employee__employee_id')
+        self.assertEqual([r.employee.employee_id for r in records], ['EMP1', 'EMP2'])
+        self.assertTrue(all(r.is_verified and r.attendance_type == 'CHECK_IN' for r in records))
+        self.assertEqual(sorted(a['employee_id'] for a in data['attendance']), ['EMP1', 'EMP2'])
+        self.assertEqual(data['duplicates'], [])
+
+        # The same queue in the next frame is not recorded twice
+        data = self.check_in(self.group_frame()).json()
+        self.assertEqual(data['attendance'], [])
+        self.assertEqual(data['duplicates'], ['EMP1', 'EMP2'])
+        self.assertEqual(AttendanceRecord.objects.count(), 2)
+
+    def test_frame_without_faces(self):
+        self.detect.side_effect = lambda image, **kwargs: (np.empty((0, 4), dtype=np.int32), image)
+        response = self.check_in(self.group_frame())
+
+        self.assertEqual(response.status_code, 200, response.content)
+        data = response.json()
+        self.assertEqual((data['faces_detected'], data['recognized']), (0, 0))
+        self.assertEqual((data['faces'], data['attendance']), ([], []))
+        self.assertFalse(AttendanceRecord.objects.exists())
+
+        self.assertEqual(self.check_in('').status_code, 400)
+
+
+@override_settings(FACE_PROCESS_WORKERS=0)
+class AsyncFaceViewTests(FaceServiceAPITestCase):
+    """async/ endpoints, with pool tasks run on a thread against the test service"""
+
+    def setUp(self):
+        super().setUp()
+        self.patch('attendance.face_pool.face_service', self.service)
+        self.detect_whole_frame()
+        self.employee = create_employee('EMP1')
+
+    def encode(self, subject, variant):
+        return base64.b64encode(self.capture(subject, variant)).decode()
+
+    def register(self, images):
+        return self.client.post('/api/async/register-face/', {
+            'employee_id': 'EMP1', 'face_images': images,
+        }, format='json')
+
+    def mark(self, face_image, employee_id='EMP1'):
+        return self.client.post('/api/async/mark-attendance/', {
+            'employee_id': employee_id, 'attendance_type': 'CHECK_IN', 'face_image': face_image,
+        }, format='json')
+
+    def test_register_then_mark_attendance(self):
+        response = self.register([self.encode(1, v) for v in range(3)])
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertTrue(response.json()['success'])
+        self.employee.refresh_from_db()
+        self.assertTrue(self.employee.is_face_registered)
+        self.assertEqual(self.employee.face_label, self.service.label_map['EMP1'])
+
+        response = self.mark(self.encode(1, 5))
+        self.assertEqual(response.status_code, 200, response.content)
+        data = response.json()
+        self.assertTrue(data['attendance']['is_verified'])
+        self.assertTrue(data['verification_details']['in_model'])
+
+        response = self.mark(self.encode(9, 0))
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertFalse(response.json()['attendance']['is_verified'])
+        self.assertEqual(
+            list(AttendanceRecord.objects.order_by('id').values_list('is_verified', flat=True)), [True, False]
+        )
+
+    def test_rejected_requests(self):
+        response = self.register([self.encode(1, 0)])
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(response.json()['success'])
+
+        with mock.patch.object(self.service, 'is_valid_face_image', return_value=False):
+            response = self.register([self.encode(1, v) for v in range(3)])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['valid_images_count'], 0)
+
+        self.assertEqual(self.mark(self.encode(1, 0), employee_id='NOBODY').status_code, 404)
+        self.assertEqual(self.mark('').status_code, 400)
+        response = self.client.generic(
+            'POST', '/api/async/mark-attendance/', b'{not json', content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['error'], 'Invalid JSON data')
+        self.assertFalse(AttendanceRecord.objects.exists())
+        self.employee.refresh_from_db()
+        self.assertFalse(self.employee.is_face_registered)
+
+
+class FakeExecutor:
+    """Runs tasks inline, or fails them all like a pool whose worker died"""
+
+    def __init__(self, broken):
+        self.broken = broken
+        self.is_shut_down = False
+
+    def submit(self, func, *args):
+        future = Future()
+        if self.broken:
+            future.set_exception(BrokenProcessPool('a worker died'))
+        else:
+            future.set_result(func(*args))
+        return future
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        self.is_shut_down = True
+
+
+class FacePoolTests(SimpleTestCase):
+    def run_with_executors(self, *executors, retry=True):
+        with mock.patch.object(face_pool, '_executor', None), \
+                mock.patch.object(face_pool, 'ProcessPoolExecutor', side_effect=executors) as create:
+            try:
+                return asyncio.run(face_pool.run_in_pool(abs, -3, retry=retry)), create
+            finally:
+                self.next_executor = face_pool._executor
+
+    def test_pool_size(self):
+        self.assertEqual(face_pool.pool_size(), os.cpu_count() or 1)
+        with override_settings(FACE_PROCESS_WORKERS=3):
+            self.assertEqual(face_pool.pool_size(), 3)
+        with override_settings(FACE_PROCESS_WORKERS=0):
+            self.assertEqual(face_pool.pool_size(), 0)
+            self.assertEqual(asyncio.run(face_pool.run_in_pool(abs, -3)), 3)
+
+    @override_settings(FACE_PROCESS_WORKERS=1)
+    def test_broken_pool_is_rebuilt_and_the_task_retried(self):
+        broken, healthy = FakeExecutor(broken=True), FakeExecutor(broken=False)
+        result, create = self.run_with_executors(broken, healthy)
+
+        self.assertEqual(result, 3)
+        self.assertEqual(create.call_count, 2)
+        self.assertTrue(broken.is_shut_down)
+        self.assertFalse(healthy.is_shut_down)
+
+    @override_settings(FACE_PROCESS_WORKERS=1)
+    def test_retries_only_once(self):
+        with self.assertRaises(BrokenProcessPool):
+            self.run_with_executors(FakeExecutor(broken=True), FakeExecutor(broken=True))
+
+    @override_settings(FACE_PROCESS_WORKERS=1)
+    def test_tasks_that_write_are_not_retried(self):
+        broken = FakeExecutor(broken=True)
+        with self.assertRaises(BrokenProcessPool):
+            self.run_with_executors(broken, FakeExecutor(broken=False), retry=False)
+        # The broken pool is dropped; the next task gets a new one
+        self.assertTrue(broken.is_shut_down)
+        self.assertIsNone(self.next_executor)
+
+
+class LazyFaceServiceTests(SimpleTestCase):
+    def test_importing_views_does_not_build_the_service(self):
+        script = (
+            "import django; django.setup(); import attendance.views; "
+            "from attendance.face_service import face_service; print(face_service.is_initialized)"
+        )
+        env = {**os.environ, 'DJANGO_SETTINGS_MODULE': 'attendance_backend.settings'}
+        result = subprocess.run(
+            [sys.executable, '-c', script], cwd=settings.BASE_DIR, env=env,
+            capture_output=True, text=True, timeout=120,
+        )
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(result.stdout.strip().splitlines()[-1], 'False')
+        self.assertNotIn('INITIALIZING FACE SERVICE', result.stdout)
+
+    def test_first_access_builds_the_service_once(self):
+        built = []
+
+        def factory():
+            time.sleep(0.05)
+            service = mock.Mock(label_map={'EMP1': 1})
+            built.append(service)
+            return service
+
+        lazy = LazyFaceService(factory)
+        self.assertFalse(lazy.is_initialized)
+
+        seen = []
+        threads = [threading.Thread(target=lambda: seen.append(lazy.label_map)) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(built), 1)
+        self.assertEqual(seen, [{'EMP1': 1}] * 8)
+        self.assertTrue(lazy.is_initialized)
+
+        # Writes go to the real service too
+        lazy.labels = [1]
+        self.assertEqual(built[0].labels, [1])
+        self.assertEqual(len(built), 1)
+
+    def test_warm_up_is_idempotent(self):
+        factory = mock.Mock(return_value=mock.Mock())
+        lazy = LazyFaceService(factory)
+
+        with mock.patch('attendance.face_service.face_service', lazy):
+            with override_settings(FACE_SERVICE_WARM_UP=False):
+                warm_up_face_service()
+            factory.assert_not_called()
+
+            warm_up_face_service()
+            warm_up_face_service()
+
+        factory.assert_called_once()
+        self.assertIs(lazy.get_service(), factory.return_value)
+
+
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'face_jobs': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'face-jobs-tests'},
+})
+class RegistrationJobTests(FaceServiceAPIMixin, TransactionTestCase):
+    """register-face/ and registration-status/ (the job runs on the real worker thread)"""
+
+    def setUp(self):
+        super().setUp()
+        self.detect_whole_frame()
+        self.employee = create_employee('EMP1')
+        self.images = [base64.b64encode(self.capture(1, v)).decode() for v in range(3)]
+
+    def register(self, **fields):
+        return self.client.post('/api/register-face/', {
+            'employee_id': 'EMP1', 'face_images': self.images, **fields,
+        }, format='json')
+
+    def status(self, job_id, **params):
+        return self.client.get('/api/registration-status/', {'job_id': job_id, **params})
+
+    def wait_for(self, job_id):
+        self.assertTrue(registration_worker.get(job_id).done.wait(30))
+
+    def test_default_answer_is_the_registration_result(self):
+        response = self.register()
+
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertTrue(response.json()['success'])
+        self.employee.refresh_from_db()
+        self.assertTrue(self.employee.is_face_registered)
+
+    def test_queued_job_runs_to_completion(self):
+        response = self.register(**{'async': True})
+
+        self.assertEqual(response.status_code, 202, response.content)
+        queued = response.json()
+        self.assertNotIn('success', queued)
+        self.assertIn(queued['status'], ('queued', 'running', 'completed'))
+        self.assertIn(f"job_id={queued['job_id']}", queued['status_url'])
+
+        self.wait_for(queued['job_id'])
+        job = self.status(queued['job_id']).json()
+        self.assertEqual(job['status'], 'completed')
+        self.assertEqual((job['stage'], job['progress']), ('done', 1.0))
+        self.assertTrue(job['result']['success'])
+        self.assertEqual(job_cache().get(job_cache_key(queued['job_id']))['status'], 'completed')
+
+    def test_failed_jobs_are_reported_as_failures(self):
+        # The registration itself rejects the images: 400 with the reason
+        with mock.patch.object(self.service, 'is_valid_face_image', return_value=False):
+            response = self.register()
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(response.json()['success'])
+        self.assertEqual(self.status(response.json()['job_id']).json()['status'], 'failed')
+
+        # The job crashed: 500, never the queued answer
+        with mock.patch.object(self.service, 'register_face', side_effect=RuntimeError('disk full')):
+            response = self.register(wait=True)
+        self.assertEqual(response.status_code, 500)
+        data = response.json()
+        self.assertFalse(data['success'])
+        self.assertIn('disk full', data['error'])
+        self.assertEqual(data['status'], 'failed')
+
+        self.employee.refresh_from_db()
+        self.assertFalse(self.employee.is_face_registered)
+
+    def test_wait_timeout_hands_over_the_job(self):
+        release = threading.Event()
+        register_face = self.service.register_face
+
+        def slow_register(*args):
+            release.wait(30)
+            return register_face(*args)
+
+        with mock.patch.object(self.service, 'register_face', side_effect=slow_register), \
+                override_settings(FACE_REGISTRATION_WAIT_TIMEOUT=0.05):
+            response = self.register()
+            release.set()
+            self.assertEqual(response.status_code, 202)
+            self.assertNotIn('success', response.json())
+            self.wait_for(response.json()['job_id'])
+
+    def test_unknown_job_ids(self):
+        response = self.status('missing')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json()['status'], 'unknown')
+
+        # A registered employee doesn't make an unknown job a success
+        self.employee.is_face_registered = True
+        self.employee.save()
+        self.assertEqual(self.status('missing', employee_id='EMP1').status_code, 404)
+
+        # Queued by another worker process: only the shared cache knows it
+        job_cache().set(job_cache_key('elsewhere'), {'job_id': 'elsewhere', 'status': 'running'})
+        self.assertEqual(self.status('elsewhere').json()['status'], 'running')
\ No newline at end of file
@@ -0,0 +1,157 @@
+# attendance/training.py - Background face registration jobs
+import queue
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import close_old_connections
+
+
+def job_cache():
+    """Cache shared by every worker process that holds job state (FACE_REGISTRATION_CACHE)"""
+    return caches[getattr(settings, 'FACE_REGISTRATION_CACHE', 'default')]
+
+
+def job_cache_key(job_id):
+    return f'face-registration-job:{job_id}'
+
+
+class RegistrationJob:
+    """One queued face registration and its progress
+
+    status goes queued -> running -> completed | failed; result holds the
+    payload the registration endpoint used to return synchronously. Every
+    change is saved to the job cache, so registration-status/ can answer
+    from any worker process.
+    """
+
+    def __init__(self, employee_id, images_received):
+        self.job_id = uuid.uuid4().hex
+        self.employee_id = employee_id
+        self.images_received = images_received
+        self.status = 'queued'
+        self.stage = 'queued'
+        self.progress = 0.0
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.done = threading.Event()
+
+    def update(self, stage, progress):
+        self.stage = stage
+        self.progress = round(min(max(progress, 0.0), 1.0), 3)
+        self.save()
+
+    def save(self):
+        """Publish the job's state to the job cache (best effort)"""
+        try:
+            job_cache().set(
+                job_cache_key(self.job_id), self.to_dict(),
+                getattr(settings, 'FACE_REGISTRATION_JOB_TTL', 24 * 3600)
+            )
+        except Exception as e:
+            print(f"✗ Could not save registration job {self.job_id}: {e}")
+
+    def to_dict(self):
+        return {
+            'job_id': self.job_id,
+            'employee_id': self.employee_id,
+            'status': self.status,
+            'stage': self.stage,
+            'progress': self.progress,
+            'images_received': self.images_received,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'result': self.result,
+            'error': self.error,
+        }
+
+
+class RegistrationWorker:
+    """Single daemon thread that runs registration jobs in submission order
+
+    Jobs run in the process that queued them; their state is also saved
+    to the job cache, which status() reads for jobs from other processes.
+    The thread starts on the first submit.
+    """
+
+    max_finished_jobs = 500
+
+    def __init__(self):
+        self.jobs = OrderedDict()
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def submit(self, employee_id, images_received, handler, *args):
+        """Queue handler(job, *args); returns the job right away
+
+        handler returns the job result dict; result['success'] decides
+        between completed and failed.
+        """
+        job = RegistrationJob(employee_id, images_received)
+        job.save()
+        with self._lock:
+            self.jobs[job.job_id] = job
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='face-registration', daemon=True)
+                self._thread.start()
+        self._queue.put((job, handler, args))
+        print(f"✓ Queued registration job {job.job_id} for {employee_id} ({self._queue.qsize()} waiting)")
+        return job
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def status(self, job_id):
+        """to_dict() of a job queued by any worker process, or None if unknown"""
+        job = self.get(job_id)
+        if job is not None:
+            return job.to_dict()
+        try:
+            return job_cache().get(job_cache_key(job_id))
+        except Exception as e:
+            print(f"✗ Could not read registration job {job_id}: {e}")
+            return None
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def _run(self):
+        while True:
+            job, handler, args = self._queue.get()
+            job.status = 'running'
+            job.started_at = time.time()
+            job.save()
+            try:
+                job.result = handler(job, *args)
+                job.status = 'completed' if job.result.get('success') else 'failed'
+                job.error = job.result.get('error')
+            except Exception as e:
+                print(f"✗ Registration job {job.job_id} failed: {e}")
+                traceback.print_exc()
+                job.status = 'failed'
+                job.error = f'Server error: {str(e)}'
+            finally:
+                job.finished_at = time.time()
+                job.update('done', 1.0)
+                job.done.set()
+                close_old_connections()
+                self._prune()
+
+    def _prune(self):
+        """Forget the oldest finished jobs beyond max_finished_jobs"""
+        with self._lock:
+            finished = [job_id for job_id, job in self.jobs.items() if job.done.is_set()]
+            for job_id in finished[:max(0, len(finished) - self.max_finished_jobs)]:
+                del self.jobs[job_id]
+
+
+registration_worker = RegistrationWorker()
@@ -15,12 +15,20 @@ urlpatterns = [
     
     # ========== FACE OPERATIONS ==========
     path('register-face/', views.FaceRegistrationView.as_view(), name='register-face'),
+    path('registration-status/', views.RegistrationStatusView.as_view(), name='registration-status'),
     path('check-face-status/', views.CheckFaceStatusView.as_view(), name='check-face-status'),
+    path('preflight/', views.PreflightView.as_view(), name='preflight'),
     
     # ========== ATTENDANCE ==========
     path('mark-attendance/', views.MarkAttendanceView.as_view(), name='mark-attendance'),
+    path('identify/', views.IdentifyFaceView.as_view(), name='identify'),
+    path('group-check-in/', views.GroupCheckInView.as_view(), name='group-check-in'),
     path('attendance-history/', views.AttendanceHistoryView.as_view(), name='attendance-history'),
     
+    # ========== ASYNC (ASGI, face work on a process pool) ==========
+    path('async/register-face/', views.AsyncFaceRegistrationView.as_view(), name='async-register-face'),
+    path('async/mark-attendance/', views.AsyncMarkAttendanceView.as_view(), name='async-mark-attendance'),
+    
     # ========== PROFILE ==========
     path('profile/', views.EmployeeProfileView.as_view(), name='profile'),
     path('profile/<str:employee_id>/', views.EmployeeProfileView.as_view(), name='profile-detail'),
@@ -5,6 +5,7 @@ from rest_framework.decorators import api_view, permission_classes, action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.views import APIView
+from rest_framework.parsers import JSONParser, MultiPartParser, FormParser
 from django.contrib.auth.models import User
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
@@ -13,7 +14,8 @@ from django.contrib.auth import authenticate, login
 import json
 import traceback
 import logging
-import os
+import time
+from urllib.parse import urlencode
 
 from .models import Employee, AttendanceRecord
 from .serializers import (
@@ -22,12 +24,28 @@ from .serializers import (
     FaceRegistrationSerializer, MarkAttendanceSerializer,
     AttendanceHistorySerializer
 )
-from .face_service import face_service
+from .face_service import face_service, split_jpeg_stream, MATCH_THRESHOLD
+from .parsers import RawImageParser
+from .quality import quality_stats
+from .training import registration_worker
+from . import face_pool
+from django.http import JsonResponse
+from django.views import View
 from rest_framework_simplejwt.tokens import RefreshToken
 
 # Add this at the top of the views.py file (after imports)
 logger = logging.getLogger(__name__)
 
+# Face endpoints take JSON/base64 (older app builds), multipart/form-data
+# uploads, or a raw image/jpeg body with the other fields as query params
+FACE_UPLOAD_PARSERS = [JSONParser, MultiPartParser, FormParser, RawImageParser]
+
+def face_image_excerpt(face_image):
+    """What to keep of a capture on the AttendanceRecord (base64 only)"""
+    if not isinstance(face_image, str):
+        return None
+    return face_image[:500] + "..." if len(face_image) > 500 else face_image
+
 # ==================== TEST ENDPOINTS ====================
 
 @api_view(['GET'])
@@ -48,7 +66,13 @@ def test_endpoint(request):
             'login': '/api/login/',
             'register': '/api/register/',
             'register_face': '/api/register-face/',
+            'registration_status': '/api/registration-status/',
             'mark_attendance': '/api/mark-attendance/',
+            'identify': '/api/identify/',
+            'group_check_in': '/api/group-check-in/',
+            'preflight': '/api/preflight/',
+            'async_register_face': '/api/async/register-face/',
+            'async_mark_attendance': '/api/async/mark-attendance/',
         },
         'demo_credentials': {
             'username': 'demo',
@@ -89,14 +113,18 @@ class TestFaceServiceView(APIView):
             'model_info': {
                 'employees_registered': len(face_service.label_map),
                 'total_faces': len(face_service.faces),
-                'label_map': face_service.label_map,
-                'reverse_map': face_service.reverse_label_map
+                'label_map': dict(face_service.label_map),
+                'reverse_map': dict(face_service.reverse_label_map)
             },
-            'cascade_loaded': face_service.face_cascade is not None,
+            'cascade_loaded': face_service.face_detector is not None,
+            'detector': face_service.face_detector.describe() if face_service.face_detector else None,
             'recognizer_ready': face_service.face_recognizer is not None,
+            'recognizer': face_service.backend.describe(),
             'paths': {
                 'media_root': settings.MEDIA_ROOT if hasattr(settings, 'MEDIA_ROOT') else 'Not set',
-                'model_path': os.path.join(settings.MEDIA_ROOT, 'models', 'lbph_model.yml') if hasattr(settings, 'MEDIA_ROOT') else 'Not set'
+                'model_path': face_service.model_path() if hasattr(settings, 'MEDIA_ROOT') else 'Not set',
+                'gallery_path': face_service.gallery_store.directory,
+                'gallery_version': face_service.gallery_version
             }
         })
 
@@ -417,9 +445,123 @@ class LoginView(APIView):
 
 # ==================== FACE REGISTRATION (FIXED) ====================
 
+def process_face_registration(job, employee, face_images):
+    """Validate, register and record a registration (runs on the training worker)
+    
+    Returns the payload FaceRegistrationView used to answer with.
+    """
+    employee_id = employee.employee_id
+    
+    # Validate each image
+    valid_images = []
+    invalid_images = []
+    invalid_reasons = []
+    
+    print("Validating face images...")
+    for i, img_data in enumerate(face_images):
+        job.update('validating', 0.5 * i / len(face_images))
+        # Keep the analyzed frame so register_face reuses the detection
+        frame = face_service.analyze_frame(img_data)
+        if face_service.is_valid_face_image(frame):
+            valid_images.append(frame)
+        else:
+            invalid_images.append(i + 1)  # Track which images failed
+            invalid_reasons.append(frame.rejection)
+    
+    print(f"Valid images: {len(valid_images)}, Invalid images: {len(invalid_images)}")
+    
+    if len(valid_images) < 3:
+        return {
+            'success': False,
+            'error': f'Need at least 3 valid face images. Only {len(valid_images)} passed validation.',
+            'invalid_images': invalid_images,
+            'invalid_reasons': invalid_reasons,
+            'valid_images_count': len(valid_images),
+            'advice': 'Please provide clear frontal face images with good lighting'
+        }
+    
+    # Register faces using OpenCV LBPH
+    job.update('training', 0.5)
+    print(f"Registering {len(valid_images)} valid face images...")
+    registration_results = face_service.register_face(employee_id, valid_images)
+    
+    successful_registrations = sum(registration_results)
+    
+    if successful_registrations >= 3:
+        job.update('saving', 0.9)
+        # Update employee status
+        employee.is_face_registered = True
+        
+        # Assign face label from the service
+        if employee_id in face_service.label_map:
+            employee.face_label = face_service.label_map[employee_id]
+        
+        # Store sample encodings in employee model
+        sample_encodings = []
+        if valid_images and len(valid_images) > 0:
+            # Store first valid image as reference
+            sample_encodings.append({
+                'image_index': 0,
+                'registration_time': timezone.now().isoformat()
+            })
+            employee.set_face_encodings(sample_encodings)
+        
+        employee.save()
+        
+        print(f"✅ Face registration SUCCESSFUL for {employee_id}")
+        print(f"  Label: {employee.face_label}")
+        print(f"  Successful images: {successful_registrations}")
+        
+        return {
+            'success': True,
+            'message': 'Face registration successful!',
+            'employee_id': employee_id,
+            'employee_name': employee.user.get_full_name(),
+            'is_face_registered': True,
+            'face_label': employee.face_label,
+            'registration_stats': {
+                'images_received': len(face_images),
+                'images_valid': len(valid_images),
+                'registration_successful': successful_registrations,
+                'invalid_image_indices': invalid_images
+            },
+            'model_info': {
+                'algorithm': 'OpenCV LBPH',
+                'employees_in_model': len(face_service.label_map),
+                'total_faces': len(face_service.gallery),
+                'gallery_version': face_service.gallery_version
+            },
+            'next_steps': 'You can now mark attendance using face recognition'
+        }
+    else:
+        print(f"❌ Face registration FAILED for {employee_id}")
+        
+        return {
+            'success': False,
+            'error': f'Face registration failed. Only {successful_registrations} faces could be registered.',
+            'registration_results': registration_results,
+            'valid_images_count': len(valid_images),
+            'advice': 'Please provide clear frontal face images with good lighting'
+        }
+
+def request_flag(request, data, name, default=False):
+    """Boolean request field, from the body or the query string"""
+    value = data.get(name, request.query_params.get(name))
+    if value is None or value == '':
+        return default
+    return str(value).lower() in ('1', 'true', 'yes')
+
 class FaceRegistrationView(APIView):
-    """Fixed face registration view with OpenCV LBPH"""
+    """Face registration, run as a job on the training worker
+    
+    Answers with the registration result (200/400, or 500 if the job
+    crashed) like it always has. With async=true (or FACE_REGISTRATION_ASYNC
+    = True and no wait=true) it answers 202 with the job id at once; poll
+    registration-status/ for the result. A 202 carries no 'success' key:
+    the registration hasn't succeeded yet.
+    """
     permission_classes = [AllowAny]
+    parser_classes = FACE_UPLOAD_PARSERS
     
     def post(self, request):
         print("=== FACE REGISTRATION REQUEST (FIXED) ===")
@@ -428,8 +570,17 @@ class FaceRegistrationView(APIView):
             # Get data
             data = request.data
             
+            if isinstance(data, bytes):
+                # Raw image/jpeg body: one or more concatenated JPEGs
+                face_images = split_jpeg_stream(data)
+                data = request.query_params
+            elif hasattr(data, 'getlist'):
+                # multipart/form-data: repeated face_images file parts
+                face_images = data.getlist('face_images')
+            else:
+                face_images = data.get('face_images', [])
+            
             employee_id = data.get('employee_id')
-            face_images = data.get('face_images', [])
             
             print(f"Employee ID: {employee_id}")
             print(f"Number of images: {len(face_images)}")
@@ -456,88 +607,38 @@ class FaceRegistrationView(APIView):
                     'error': 'Employee not found'
                 }, status=status.HTTP_404_NOT_FOUND)
             
-            # Validate each image
-            valid_images = []
-            invalid_images = []
+            # Uploaded files are closed when the request ends; read them now
+            face_images = [
+                img.read() if hasattr(img, 'read') else img
+                for img in face_images
+            ]
             
-            print("Validating face images...")
-            for i, img_data in enumerate(face_images):
-                if face_service.is_valid_face_image(img_data):
-                    valid_images.append(img_data)
-                else:
-                    invalid_images.append(i + 1)  # Track which images failed
-            
-            print(f"Valid images: {len(valid_images)}, Invalid images: {len(invalid_images)}")
-            
-            if len(valid_images) < 3:
-                return Response({
-                    'success': False,
-                    'error': f'Need at least 3 valid face images. Only {len(valid_images)} passed validation.',
-                    'invalid_images': invalid_images,
-                    'valid_images_count': len(valid_images),
-                    'advice': 'Please provide clear frontal face images with good lighting'
-                }, status=status.HTTP_400_BAD_REQUEST)
+            job = registration_worker.submit(
+                employee_id, len(face_images), process_face_registration, employee, face_images
+            )
             
-            # Register faces using OpenCV LBPH
-            print(f"Registering {len(valid_images)} valid face images...")
-            registration_results = face_service.register_face(employee_id, valid_images)
+            run_async = request_flag(request, data, 'async', getattr(settings, 'FACE_REGISTRATION_ASYNC', False))
+            if run_async and not request_flag(request, data, 'wait'):
+                return Response(self.job_accepted(job, 'Face registration queued'), status=status.HTTP_202_ACCEPTED)
             
-            successful_registrations = sum(registration_results)
+            if not job.done.wait(getattr(settings, 'FACE_REGISTRATION_WAIT_TIMEOUT', 120)):
+                # Still queued or running: hand over the job instead
+                return Response(
+                    self.job_accepted(job, 'Face registration is taking longer than usual'),
+                    status=status.HTTP_202_ACCEPTED
+                )
             
-            if successful_registrations >= 3:
-                # Update employee status
-                employee.is_face_registered = True
-                
-                # Assign face label from the service
-                if employee_id in face_service.label_map:
-                    employee.face_label = face_service.label_map[employee_id]
-                
-                # Store sample encodings in employee model
-                sample_encodings = []
-                if valid_images and len(valid_images) > 0:
-                    # Store first valid image as reference
-                    sample_encodings.append({
-                        'image_index': 0,
-                        'registration_time': timezone.now().isoformat()
-                    })
-                    employee.set_face_encodings(sample_encodings)
-                
-                employee.save()
-                
-                print(f"✅ Face registration SUCCESSFUL for {employee_id}")
-                print(f"  Label: {employee.face_label}")
-                print(f"  Successful images: {successful_registrations}")
-                
-                return Response({
-                    'success': True,
-                    'message': 'Face registration successful!',
-                    'employee_id': employee_id,
-                    'employee_name': employee.user.get_full_name(),
-                    'is_face_registered': True,
-                    'face_label': employee.face_label,
-                    'registration_stats': {
-                        'images_received': len(face_images),
-                        'images_valid': len(valid_images),
-                        'registration_successful': successful_registrations,
-                        'invalid_image_indices': invalid_images
-                    },
-                    'model_info': {
-                        'algorithm': 'OpenCV LBPH',
-                        'employees_in_model': len(face_service.label_map),
-                        'total_faces': len(face_service.faces)
-                    },
-                    'next_steps': 'You can now mark attendance using face recognition'
-                })
-            else:
-                print(f"❌ Face registration FAILED for {employee_id}")
-                
+            if job.result is None:
+                # The job raised instead of returning a result
                 return Response({
                     'success': False,
-                    'error': f'Face registration failed. Only {successful_registrations} faces could be registered.',
-                    'registration_results': registration_results,
-                    'valid_images_count': len(valid_images),
-                    'advice': 'Please provide clear frontal face images with good lighting'
-                }, status=status.HTTP_400_BAD_REQUEST)
+                    'error': job.error or 'Face registration failed',
+                    'job_id': job.job_id,
+                    'status': job.status
+                }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            
+            result = dict(job.result, job_id=job.job_id)
+            return Response(result, status=status.HTTP_200_OK if result.get('success') else status.HTTP_400_BAD_REQUEST)
                 
         except Exception as e:
             print(f"❌ Face registration error: {str(e)}")
@@ -546,6 +647,49 @@ class FaceRegistrationView(APIView):
                 'success': False,
                 'error': f'Server error: {str(e)}'
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    
+    def job_accepted(self, job, message):
+        """202 body for a job that hasn't finished (deliberately no 'success')"""
+        query = urlencode({'job_id': job.job_id})
+        return {
+            'message': message,
+            'job_id': job.job_id,
+            'employee_id': job.employee_id,
+            'status': job.status,
+            'status_url': f'/api/registration-status/?{query}',
+            'queue_length': registration_worker.pending()
+        }
+
+class RegistrationStatusView(APIView):
+    """Progress and result of a queued face registration
+    
+    An unknown job_id (mistyped, or expired from the job cache) is a 404:
+    the job's outcome isn't known, so check the employee's profile/.
+    """
+    permission_classes = [AllowAny]
+    
+    def get(self, request):
+        job_id = request.query_params.get('job_id')
+        
+        if not job_id:
+            return Response({
+                'success': False,
+                'error': 'job_id is required'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        job = registration_worker.status(job_id)
+        if job is None:
+            return Response({
+                'success': False,
+                'job_id': job_id,
+                'status': 'unknown',
+                'error': 'Registration job not found; check profile/ for is_face_registered'
+            }, status=status.HTTP_404_NOT_FOUND)
+        
+        return Response({
+            'success': True,
+            **job
+        })
 
 # ==================== FACE STATUS ====================
 
@@ -747,6 +891,7 @@ class CheckFaceStatusView(APIView):
 class MarkAttendanceView(APIView):
     """Fixed attendance marking with actual face verification"""
     permission_classes = [AllowAny]
+    parser_classes = FACE_UPLOAD_PARSERS
     
     def post(self, request):
         print("=" * 60)
@@ -759,8 +904,29 @@ class MarkAttendanceView(APIView):
             else:
                 data = json.loads(request.body)
             
+            if isinstance(data, bytes):
+                # Raw image/jpeg body: fields come from the query string;
+                # several concatenated JPEGs are a burst
+                face_images = split_jpeg_stream(data)
+                face_image = data if len(face_images) <= 1 else face_images[0]
+                data = request.query_params
+            else:
+                # base64 string (JSON/form) or uploaded file (multipart),
+                # or a burst as a face_images list / repeated file parts
+                face_image = data.get('face_image')
+                if hasattr(data, 'getlist'):
+                    face_images = data.getlist('face_images')
+                else:
+                    face_images = data.get('face_images') or []
+                if not face_image and face_images:
+                    face_image = face_images[0]
+            
+            burst = len(face_images) > 1
+            frames_evaluated = 1
+            rejection_reason = None
+            verification_tier = None
+            
             employee_id = data.get('employee_id')
-            face_image = data.get('face_image')
             attendance_type = data.get('attendance_type', 'CHECK_IN')
             
             print(f"Employee ID: {employee_id}")
@@ -792,12 +958,29 @@ class MarkAttendanceView(APIView):
                 is_verified = True
                 confidence_score = 0.95
                 verification_reason = "Test mode"
+            elif burst:
+                print(f"\n=== ATTEMPTING BURST VERIFICATION ({len(face_images)} frames) ===")
+                frames = [face_service.analyze_frame(image) for image in face_images]
+                is_verified, confidence_score, frames_evaluated, face_image = face_service.verify_burst(
+                    employee_id, frames
+                )
+                verification_tier = next(frame.tier for frame in frames if frame.source is face_image)
+                
+                if is_verified:
+                    verification_reason = f"Verified (confidence: {confidence_score:.2f})"
+                elif confidence_score > 0:
+                    verification_reason = f"Face mismatch (confidence: {confidence_score:.2f})"
+                else:
+                    verification_reason = "Invalid face image"
             else:
                 print("\n=== ATTEMPTING FACE VERIFICATION ===")
                 
+                # Decode and detect once; both steps share this frame
+                frame = face_service.analyze_frame(face_image)
+                
                 # First, validate the image
                 print("1. Validating face image...")
-                is_valid = face_service.is_valid_face_image(face_image)
+                is_valid = face_service.is_valid_face_image(frame)
                 print(f"   Image valid: {is_valid}")
                 
                 if not is_valid:
@@ -805,10 +988,12 @@ class MarkAttendanceView(APIView):
                     is_verified = False
                     confidence_score = 0.0
                     verification_reason = "Invalid face image"
+                    rejection_reason = frame.rejection
                 else:
                     print("2. Verifying face...")
-                    is_verified, confidence_score = face_service.verify_face(employee_id, face_image)
-                    print(f"   Verified: {is_verified}")
+                    is_verified, confidence_score = face_service.verify_face(employee_id, frame)
+                    verification_tier = frame.tier
+                    print(f"   Verified: {is_verified} ({verification_tier} tier)")
                     print(f"   Confidence: {confidence_score}")
                     
                     if not is_verified:
@@ -839,7 +1024,7 @@ class MarkAttendanceView(APIView):
                 longitude=data.get('longitude'),
                 is_verified=is_verified,
                 confidence_score=confidence_score,
-                face_image=face_image[:500] + "..." if face_image and len(face_image) > 500 else face_image
+                face_image=face_image_excerpt(face_image)
             )
             
             # Prepare response
@@ -860,6 +1045,10 @@ class MarkAttendanceView(APIView):
                     'passed': is_verified,
                     'confidence': confidence_score,
                     'reason': verification_reason,
+                    'rejection_reason': rejection_reason,
+                    'verification_tier': verification_tier,
+                    'frames_received': max(1, len(face_images)),
+                    'frames_evaluated': frames_evaluated,
                     'in_model': employee_id in face_service.label_map,
                     'face_label': face_service.label_map.get(employee_id),
                     'model_stats': {
@@ -898,6 +1087,527 @@ class MarkAttendanceView(APIView):
                 'error': f'Server error: {str(e)}'
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+# ==================== FACE IDENTIFICATION (1:N) ====================
+
+class IdentifyFaceView(APIView):
+    """Identify who is in front of a kiosk without an employee_id"""
+    permission_classes = [AllowAny]
+    parser_classes = FACE_UPLOAD_PARSERS
+    
+    def post(self, request):
+        print("=== IDENTIFY FACE ===")
+        
+        try:
+            data = request.data
+            if isinstance(data, bytes):
+                face_image = data
+                data = request.query_params
+            else:
+                face_image = data.get('face_image')
+            
+            if not face_image:
+                return Response({
+                    'success': False,
+                    'error': 'face_image is required'
+                }, status=status.HTTP_400_BAD_REQUEST)
+            
+            try:
+                top_k = max(1, min(int(data.get('top_k', 5)), 20))
+            except (TypeError, ValueError):
+                return Response({
+                    'success': False,
+                    'error': 'top_k must be an integer'
+                }, status=status.HTTP_400_BAD_REQUEST)
+            
+            frame = face_service.analyze_frame(face_image)
+            if not face_service.is_valid_face_image(frame):
+                return Response({
+                    'success': False,
+                    'error': 'Invalid face image. Please provide a clear frontal face image.',
+                    'validation': 'failed',
+                    'rejection_reason': frame.rejection
+                }, status=status.HTTP_400_BAD_REQUEST)
+            
+            candidates = face_service.identify_face(frame, top_k=top_k)
+            if candidates is None:
+                return Response({
+                    'success': False,
+                    'error': 'Could not extract a face from the image'
+                }, status=status.HTTP_400_BAD_REQUEST)
+            
+            employees = Employee.objects.select_related('user').in_bulk(
+                [c['employee_id'] for c in candidates], field_name='employee_id'
+            )
+            for candidate in candidates:
+                employee = employees.get(candidate['employee_id'])
+                candidate['employee_name'] = employee.user.get_full_name() if employee else None
+                candidate['is_match'] = candidate['confidence_score'] >= MATCH_THRESHOLD
+            
+            best = candidates[0] if candidates and candidates[0]['is_match'] else None
+            
+            return Response({
+                'success': True,
+                'identified': best is not None,
+                'employee_id': best['employee_id'] if best else None,
+                'employee_name': best['employee_name'] if best else None,
+                'confidence_score': best['confidence_score'] if best else None,
+                'threshold': MATCH_THRESHOLD,
+                'candidates': candidates,
+                'model_stats': {
+                    'total_employees': len(face_service.label_map),
+                    'total_templates': len(face_service.face_index())
+                }
+            })
+            
+        except Exception as e:
+            print(f"❌ Identify error: {str(e)}")
+            traceback.print_exc()
+            return Response({
+                'success': False,
+                'error': f'Server error: {str(e)}'
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+# ==================== CAPTURE PRE-FLIGHT ====================
+
+# What the app can show for each preflight issue code
+PREFLIGHT_ADVICE = {
+    'undecodable': 'Could not read the image',
+    'no_face': 'No face found - look straight at the camera',
+    'multiple_faces': 'Only one person should be in the frame',
+    'move_closer': 'Move closer to the camera',
+    'move_back': 'Move a little further from the camera',
+    'too_dark': 'Find better lighting',
+    'face_too_dark': 'Your face is too dark - face the light',
+    'too_bright': 'Too much light - avoid direct sunlight',
+    'face_too_bright': 'Your face is overexposed - move out of direct light',
+    'low_contrast': 'The picture is washed out - improve the lighting',
+    'blurry': 'Hold the phone still',
+}
+
+class PreflightView(APIView):
+    """Check a ~160px thumbnail before uploading the full capture
+    
+    Answers in a few milliseconds whether a face is present, its size in
+    the frame and the lighting, so the app only uploads captures that can
+    pass validation. Pass capture_width (the width of the full capture) to
+    have the face size checked against the full-resolution minimum.
+    """
+    permission_classes = [AllowAny]
+    parser_classes = FACE_UPLOAD_PARSERS
+    
+    def post(self, request):
+        started = time.perf_counter()
+        
+        try:
+            data = request.data
+            if isinstance(data, bytes):
+                face_image = data
+                data = request.query_params
+            else:
+                face_image = data.get('face_image')
+            
+            if not face_image:
+                return Response({
+                    'success': False,
+                    'error': 'face_image is required'
+                }, status=status.HTTP_400_BAD_REQUEST)
+            
+            try:
+                capture_width = int(data.get('capture_width') or 0) or None
+            except (TypeError, ValueError):
+                return Response({
+                    'success': False,
+                    'error': 'capture_width must be an integer'
+                }, status=status.HTTP_400_BAD_REQUEST)
+            
+            result = face_service.preflight(face_image, capture_width=capture_width)
+            
+            return Response({
+                'success': True,
+                **result,
+                'advice': [PREFLIGHT_ADVICE.get(issue, issue) for issue in result['issues']],
+                'elapsed_ms': round(1000 * (time.perf_counter() - started), 2)
+            })
+            
+        except Exception as e:
+            print(f"❌ Preflight error: {str(e)}")
+            traceback.print_exc()
+            return Response({
+                'success': False,
+                'error': f'Server error: {str(e)}'
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+# ==================== GROUP CHECK-IN ====================
+
+class GroupCheckInView(APIView):
+    """Record attendance for everyone recognized in one kiosk frame
+    
+    Every detected face is identified against the whole gallery; each
+    employee recognized at MATCH_THRESHOLD or better gets one verified
+    AttendanceRecord, written with a single bulk_create. An employee
+    already recorded for this attendance_type in the last 5 minutes is
+    reported as a duplicate rather than recorded again, since a queue
+    walking past the tablet shows up in consecutive frames.
+    """
+    permission_classes = [AllowAny]
+    parser_classes = FACE_UPLOAD_PARSERS
+    
+    def post(self, request):
+        print("=== GROUP CHECK-IN ===")
+        
+        try:
+            data = request.data
+            if isinstance(data, bytes):
+                face_image = data
+                data = request.query_params
+            else:
+                face_image = data.get('face_image')
+            
+            attendance_type = data.get('attendance_type', 'CHECK_IN')
+            
+            if not face_image:
+                return Response({
+                    'success': False,
+                    'error': 'face_image is required'
+                }, status=status.HTTP_400_BAD_REQUEST)
+            
+            frame = face_service.analyze_frame(face_image)
+            faces = face_service.identify_faces(frame)
+            if faces is None:
+                return Response({
+                    'success': False,
+                    'error': 'Could not decode the image'
+                }, status=status.HTTP_400_BAD_REQUEST)
+            
+            # Best face per recognized employee
+            recognized = {}
+            for face in faces:
+                best = face['candidates'][0] if face['candidates'] else None
+                face['employee_id'] = None
+                face['confidence_score'] = best['confidence_score'] if best else None
+                if best and best['confidence_score'] >= MATCH_THRESHOLD:
+                    face['employee_id'] = best['employee_id']
+                    current = recognized.get(best['employee_id'])
+                    if current is None or best['confidence_score'] > current['confidence_score']:
+                        recognized[best['employee_id']] = face
+            
+            employees = Employee.objects.select_related('user').in_bulk(
+                list(recognized), field_name='employee_id'
+            )
+            five_minutes_ago = timezone.now() - timedelta(minutes=5)
+            recent = set(AttendanceRecord.objects.filter(
+                employee__employee_id__in=list(employees),
+                attendance_type=attendance_type,
+                timestamp__gte=five_minutes_ago
+            ).values_list('employee__employee_id', flat=True))
+            
+            records = [
+                AttendanceRecord(
+                    employee=employee,
+                    attendance_type=attendance_type,
+                    latitude=data.get('latitude'),
+                    longitude=data.get('longitude'),
+                    is_verified=True,
+                    confidence_score=recognized[employee_id]['confidence_score'],
+                    face_image=face_image_excerpt(face_image)
+                )
+                for employee_id, employee in employees.items()
+                if employee_id not in recent
+            ]
+            records = AttendanceRecord.objects.bulk_create(records)
+            
+            attendance = [{
+                'id': record.id,
+                'employee_id': record.employee.employee_id,
+                'employee_name': record.employee.user.get_full_name(),
+                'attendance_type': attendance_type,
+                'timestamp': record.timestamp.isoformat(),
+                'confidence_score': record.confidence_score,
+            } for record in records]
+            
+            print(f"✓ {len(faces)} faces, {len(recognized)} recognized, {len(records)} recorded")
+            
+            return Response({
+                'success': True,
+                'message': f'{len(records)} {attendance_type.replace("_", " ")} recorded',
+                'faces_detected': len(faces),
+                'rejection_reason': frame.rejection,
+                'recognized': len(recognized),
+                'attendance': attendance,
+                'duplicates': sorted(recent),
+                'unknown_employee_ids': sorted(set(recognized) - set(employees)),
+                'faces': [{
+                    'box': face['box'],
+                    'issue': face['issue'],
+                    'employee_id': face['employee_id'],
+                    'confidence_score': face['confidence_score'],
+                } for face in faces],
+                'threshold': MATCH_THRESHOLD
+            })
+            
+        except Exception as e:
+            print(f"❌ Group check-in error: {str(e)}")
+            traceback.print_exc()
+            return Response({
+                'success': False,
+                'error': f'Server error: {str(e)}'
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+# ==================== ASYNC FACE ENDPOINTS (ASGI) ====================
+
+def read_face_upload(request, *fields):
+    """Fields and captures from a JSON, multipart or raw image body
+    
+    The async views below run outside DRF, so this does the job of
+    FACE_UPLOAD_PARSERS. Captures come from the first of fields that has
+    any (a raw body may hold several concatenated JPEGs). Uploaded files
+    are read here: pool processes get base64 strings or bytes, never file
+    objects.
+    """
+    content_type = request.content_type or ''
+    
+    if content_type.startswith('image/'):
+        # Raw image/jpeg body: fields come from the query string
+        return request.GET, split_jpeg_stream(request.body) or [request.body]
+    
+    if content_type.startswith('multipart/') or content_type == 'application/x-www-form-urlencoded':
+        data = request.POST
+        for field in fields:
+            images = request.FILES.getlist(field) or data.getlist(field)
+            if images:
+                return data, [img.read() if hasattr(img, 'read') else img for img in images]
+        return data, []
+    
+    data = json.loads(request.body or b'{}')
+    for field in fields:
+        images = data.get(field)
+        if images:
+            return data, [images] if isinstance(images, str) else list(images)
+    return data, []
+
+
+class AsyncFaceView(View):
+    """Base for async face endpoints: JSON errors, no CSRF (like APIView)"""
+    http_method_names = ['post', 'options']
+    
+    @classmethod
+    def as_view(cls, **initkwargs):
+        view = super().as_view(**initkwargs)
+        # csrf_exempt() would wrap the coroutine view in a sync function
+        view.csrf_exempt = True
+        return view
+    
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            return await super().dispatch(request, *args, **kwargs)
+        except json.JSONDecodeError:
+            return JsonResponse({
+                'success': False,
+                'error': 'Invalid JSON data'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            print(f"❌ {type(self).__name__} error: {str(e)}")
+            traceback.print_exc()
+            return JsonResponse({
+                'success': False,
+                'error': f'Server error: {str(e)}'
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class AsyncMarkAttendanceView(AsyncFaceView):
+    """MarkAttendanceView for ASGI: verification runs on the face process pool
+    
+    Same request and response as mark-attendance/; the event loop only
+    parses the request and awaits the ORM while a pool process decodes,
+    detects and predicts.
+    """
+    
+    async def post(self, request):
+        data, face_images = read_face_upload(request, 'face_images', 'face_image')
+        face_image = face_images[0] if face_images else None
+        employee_id = data.get('employee_id')
+        attendance_type = data.get('attendance_type', 'CHECK_IN')
+        
+        try:
+            employee = await Employee.objects.select_related('user').aget(employee_id=employee_id)
+        except Employee.DoesNotExist:
+            return JsonResponse({
+                'success': False,
+                'error': f'Employee {employee_id} not found'
+            }, status=status.HTTP_404_NOT_FOUND)
+        
+        if not face_image:
+            return JsonResponse({
+                'success': False,
+                'error': 'face_image is required'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        if face_image in ['test', 'skip', 'dummy']:
+            verification = {
+                'is_verified': True,
+                'confidence_score': 0.95,
+                'reason': 'Test mode',
+                'model_stats': face_pool.model_stats(employee_id)
+            }
+        else:
+            verification = await face_pool.run_in_pool(
+                face_pool.verify_task, employee_id, face_images, retry=True
+            )
+            face_image = face_images[verification['source_index']]
+        
+        is_verified = verification['is_verified']
+        confidence_score = verification['confidence_score']
+        stats = verification['model_stats']
+        
+        five_minutes_ago = timezone.now() - timedelta(minutes=5)
+        recent_attendance = await AttendanceRecord.objects.filter(
+            employee=employee,
+            attendance_type=attendance_type,
+            timestamp__gte=five_minutes_ago
+        ).aexists()
+        
+        attendance = await AttendanceRecord.objects.acreate(
+            employee=employee,
+            attendance_type=attendance_type,
+            latitude=data.get('latitude'),
+            longitude=data.get('longitude'),
+            is_verified=is_verified,
+            confidence_score=confidence_score,
+            face_image=face_image_excerpt(face_image)
+        )
+        
+        response_data = {
+            'success': True,
+            'message': f'Attendance {attendance_type.replace("_", " ")} recorded!',
+            'attendance': {
+                'id': attendance.id,
+                'employee_id': employee_id,
+                'employee_name': employee.user.get_full_name(),
+                'attendance_type': attendance_type,
+                'timestamp': attendance.timestamp.isoformat(),
+                'is_verified': is_verified,
+                'confidence_score': confidence_score,
+                'verification_status': 'VERIFIED' if is_verified else 'FAILED'
+            },
+            'verification_details': {
+                'passed': is_verified,
+                'confidence': confidence_score,
+                'reason': verification['reason'],
+                'rejection_reason': verification.get('rejection_reason'),
+                'verification_tier': verification.get('verification_tier'),
+                'frames_received': len(face_images),
+                'frames_evaluated': verification.get('frames_evaluated', 1),
+                'in_model': stats['in_model'],
+                'face_label': stats['face_label'],
+                'model_stats': {
+                    'total_employees': stats['total_employees'],
+                    'total_faces': stats['total_faces']
+                }
+            }
+        }
+        
+        if not is_verified:
+            response_data['warning'] = 'Face verification failed'
+            response_data['advice'] = 'Try re-registering your face or ensure good lighting'
+        
+        if recent_attendance:
+            response_data['note'] = f'{attendance_type} was already recorded recently'
+        
+        print(f"✓ {attendance_type} for {employee_id}: verified={is_verified} ({confidence_score:.2f})")
+        return JsonResponse(response_data)
+
+
+class AsyncFaceRegistrationView(AsyncFaceView):
+    """FaceRegistrationView for ASGI: registers on the face process pool
+    
+    Answers with the registration result, like register-face/ does by
+    default. The pool process journals the new templates, so this
+    process and the other pool workers pick them up on their next reload.
+    """
+    
+    async def post(self, request):
+        data, face_images = read_face_upload(request, 'face_images')
+        employee_id = data.get('employee_id')
+        
+        if not employee_id:
+            return JsonResponse({
+                'success': False,
+                'error': 'employee_id is required'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        if len(face_images) < 3:
+            return JsonResponse({
+                'success': False,
+                'error': 'At least 3 face images are required'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        try:
+            employee = await Employee.objects.select_related('user').aget(employee_id=employee_id)
+        except Employee.DoesNotExist:
+            return JsonResponse({
+                'success': False,
+                'error': 'Employee not found'
+            }, status=status.HTTP_404_NOT_FOUND)
+        
+        outcome = await face_pool.run_in_pool(face_pool.register_task, employee_id, face_images)
+        
+        valid_count = outcome['valid_images_count']
+        invalid_images = outcome['invalid_images']
+        if valid_count < 3:
+            return JsonResponse({
+                'success': False,
+                'error': f'Need at least 3 valid face images. Only {valid_count} passed validation.',
+                'invalid_images': invalid_images,
+                'invalid_reasons': outcome['invalid_reasons'],
+                'valid_images_count': valid_count,
+                'advice': 'Please provide clear frontal face images with good lighting'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        registration_results = outcome['registration_results']
+        successful_registrations = sum(registration_results)
+        if successful_registrations < 3:
+            return JsonResponse({
+                'success': False,
+                'error': f'Face registration failed. Only {successful_registrations} faces could be registered.',
+                'registration_results': registration_results,
+                'valid_images_count': valid_count,
+                'advice': 'Please provide clear frontal face images with good lighting'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        stats = outcome['model_stats']
+        employee.is_face_registered = True
+        if stats['face_label'] is not None:
+            employee.face_label = stats['face_label']
+        employee.set_face_encodings([{
+            'image_index': 0,
+            'registration_time': timezone.now().isoformat()
+        }])
+        await employee.asave()
+        
+        print(f"✅ Face registration SUCCESSFUL for {employee_id} (label {employee.face_label})")
+        
+        return JsonResponse({
+            'success': True,
+            'message': 'Face registration successful!',
+            'employee_id': employee_id,
+            'employee_name': employee.user.get_full_name(),
+            'is_face_registered': True,
+            'face_label': employee.face_label,
+            'registration_stats': {
+                'images_received': len(face_images),
+                'images_valid': valid_count,
+                'registration_successful': successful_registrations,
+                'invalid_image_indices': invalid_images
+            },
+            'model_info': {
+                'algorithm': 'OpenCV LBPH',
+                'employees_in_model': stats['total_employees'],
+                'total_faces': stats['total_faces'],
+                'gallery_version': stats['gallery_version']
+            },
+            'next_steps': 'You can now mark attendance using face recognition'
+        })
+
 # ==================== ATTENDANCE HISTORY ====================
 
 class AttendanceHistoryView(APIView):
@@ -1038,15 +1748,8 @@ class ResetFaceDataView(APIView):
                 employee.face_encodings = None
                 employee.save()
                 
-                # Remove from face service
-                if employee_id in face_service.label_map:
-                    label = face_service.label_map[employee_id]
-                    del face_service.label_map[employee_id]
-                    if label in face_service.reverse_label_map:
-                        del face_service.reverse_label_map[label]
-                
-                # Save updated model
-                face_service.save_model()
+                # Remove from face service (journaled, no full rewrite)
+                face_service.remove_employee(employee_id)
                 
                 return Response({
                     'success': True,
@@ -1062,12 +1765,7 @@ class ResetFaceDataView(APIView):
                 )
                 
                 # Clear face service
-                face_service.label_map = {}
-                face_service.reverse_label_map = {}
-                face_service.faces = []
-                face_service.labels = []
-                face_service.face_recognizer = cv2.face.LBPHFaceRecognizer_create()
-                face_service.save_model()
+                face_service.clear_gallery()
                 
                 return Response({
                     'success': True,
@@ -1100,7 +1798,7 @@ def health_check(request):
             db_status = 'error'
         
         # Check face service
-        face_service_status = 'active' if face_service.face_cascade is not None else 'inactive'
+        face_service_status = 'active' if face_service.face_detector is not None else 'inactive'
         
         # Count records
         user_count = User.objects.count()
@@ -1121,6 +1819,7 @@ def health_check(request):
                 'face_registered': Employee.objects.filter(is_face_registered=True).count(),
                 'model_employees': len(face_service.label_map)
             },
+            'quality_gate': quality_stats.to_dict(),
             'environment': {
                 'debug': settings.DEBUG if hasattr(settings, 'DEBUG') else 'Unknown',
                 'timezone': settings.TIME_ZONE if hasattr(settings, 'TIME_ZONE') else 'UTC'
@@ -1133,11 +1832,5 @@ def health_check(request):
             'error': str(e)
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-# Import cv2 for ResetFaceDataView
-try:
-    import cv2
-except ImportError:
-    print("Warning: OpenCV not installed. Some features may not work.")
-
 # Import settings
 from django.conf import settings
\ No newline at end of file
@@ -14,3 +14,14 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'attendance_backend.settings')
 
 application = get_asgi_application()
+
+# Load the face gallery now rather than on the first request
+from attendance.face_service import warm_up_face_service  # noqa: E402
+from attendance import face_pool  # noqa: E402
+
+warm_up_face_service()
+
+# Spawn the face process pool so its workers load the gallery up front.
+# This runs in every ASGI server process; FACE_PROCESS_WORKERS (default: one
+# per CPU) sets the workers per process, 0 keeps face work on a thread.
+face_pool.start()
@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 
 # attendance_backend/settings.py
 import os
+import tempfile
 from pathlib import Path
 from datetime import timedelta
 
@@ -137,4 +138,100 @@ SIMPLE_JWT = {
     'REFRESH_TOKEN_LIFETIME': timedelta(days=7),
     'ROTATE_REFRESH_TOKENS': True,
     'BLACKLIST_AFTER_ROTATION': True,
-}
\ No newline at end of file
+}
+
+# Face recognition
+# Large JPEGs are decoded at a reduced size (1/2, 1/4, 1/8) as long as the
+# short side stays at or above this many pixels.
+FACE_DECODE_MIN_SIDE = 480
+# The Haar cascade runs on a copy downscaled to this long side (0 disables);
+# boxes are mapped back to the decoded frame for cropping.
+FACE_DETECTION_MAX_SIDE = 640
+# 'one_to_one' compares a check-in only with the claimed employee's own
+# templates; 'identify' runs a full LBPH predict over every employee;
+# 'tiered' tries a fast path first (see FACE_FAST_*) and falls back to
+# 'one_to_one' when it is inconclusive.
+FACE_VERIFICATION_MODE = 'one_to_one'
+# 'opencv' uses cv2.face.LBPHFaceRecognizer; 'numpy' the vectorized
+# uniform-LBP engine in attendance/lbp.py; 'eigen' / 'fisher' cv2's
+# Eigenfaces / Fisherfaces on downscaled crops (retrained on the whole
+# gallery at each registration; Fisherfaces needs two employees).
+# FACE_RECOGNIZER_OPTIONS are passed to the backend: 'distance_scale' (the
+# distance at which confidence reaches 0; bench_recognizers suggests one),
+# and for eigen/fisher 'size' and 'num_components'.
+FACE_RECOGNIZER_BACKEND = 'opencv'
+FACE_RECOGNIZER_OPTIONS = {}
+# identify/ projects templates onto this many principal components and
+# re-ranks this many shortlisted templates with the exact distance.
+FACE_INDEX_COMPONENTS = 64
+FACE_INDEX_SHORTLIST = 200
+# Journal records before a background checkpoint writes a new gallery snapshot
+FACE_GALLERY_CHECKPOINT_RECORDS = 50
+# ...or this many once the gallery is a private copy (after a removal, or
+# when the snapshot's spare rows ran out), since each change copies it again
+FACE_GALLERY_PRIVATE_CHECKPOINT_RECORDS = 10
+# Build the face service when the WSGI/ASGI application loads instead of
+# on the first face request (it's created lazily either way).
+FACE_SERVICE_WARM_UP = True
+# register-face/ runs registrations as background jobs. It answers with the
+# result, waiting at most FACE_REGISTRATION_WAIT_TIMEOUT seconds, unless the
+# request passes async=true: then it returns the job id at once (poll
+# registration-status/). True makes that the default (wait=true opts out).
+FACE_REGISTRATION_ASYNC = False
+FACE_REGISTRATION_WAIT_TIMEOUT = 120
+# Job state lives in this cache for FACE_REGISTRATION_JOB_TTL seconds so any
+# worker process can answer registration-status/; it must be shared by all
+# of them (file, database, Redis or memcached - not local memory). The file
+# cache stays outside MEDIA_ROOT so it's never served as media.
+FACE_REGISTRATION_CACHE = 'face_jobs'
+FACE_REGISTRATION_JOB_TTL = 24 * 3600
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'face_jobs': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(tempfile.gettempdir(), 'attendance_registration_jobs'),
+    },
+}
+# Seconds between checks for gallery changes saved by other worker
+# processes; changes are then loaded in the background (negative disables).
+FACE_GALLERY_RELOAD_INTERVAL = 2.0
+# Process pool behind the async/ endpoints (ASGI): worker processes
+# (None = one per CPU, 0 = run on a thread) and how many requests may hand
+# work to the pool at once (None = 2 x workers). Workers map the shared
+# gallery snapshot rather than copying it, but each ASGI server process
+# starts its own pool: with several server processes, divide the CPUs.
+FACE_PROCESS_WORKERS = None
+FACE_PROCESS_QUEUE_LIMIT = None
+# mark-attendance/ with several frames (face_images, or concatenated JPEGs)
+# tries them sharpest first and stops at the first that passes or after
+# this many frames.
+FACE_BURST_MAX_FRAMES = 3
+# Frames are checked on a 160px thumbnail before the cascade runs: too
+# small, dark, bright, flat or blurred (Laplacian variance below
+# FACE_QUALITY_MIN_SHARPNESS) ones are rejected without a detection.
+FACE_QUALITY_GATE = True
+FACE_QUALITY_MIN_SHARPNESS = 15.0
+# Face detector: 'haar' (haarcascade_frontalface_default), 'lbp'
+# (lbpcascade_frontalface_improved, faster; falls back to Haar when the file
+# isn't installed - pip wheels don't ship it) or 'cascade' (any cascade file).
+# FACE_DETECTOR_OPTIONS are passed to the backend, e.g. {'cascade':
+# 'haarcascade_frontalface_alt2.xml', 'scale_factor': 1.2, 'min_neighbors': 4}.
+# Cascade files are also looked for in FACE_DETECTOR_CASCADE_DIRS.
+FACE_DETECTOR_BACKEND = 'haar'
+FACE_DETECTOR_OPTIONS = {}
+FACE_DETECTOR_CASCADE_DIRS = []
+# Fast path of FACE_VERIFICATION_MODE = 'tiered': detect with this backend
+# (the Haar cascade with the same options if the LBP one isn't installed)
+# and a coarser scale step, looking only for faces at least
+# FACE_FAST_MIN_FACE_FRACTION of the frame's short side, on a copy at most
+# FACE_FAST_DETECTION_MAX_SIDE pixels long (None = FACE_DETECTION_MAX_SIDE;
+# smaller sides shift the boxes enough to make most matches inconclusive).
+# The face is compared with the employee's mean template and accepted at
+# FACE_FAST_ACCEPT_CONFIDENCE or above.
+FACE_FAST_DETECTOR_BACKEND = 'lbp'
+FACE_FAST_DETECTOR_OPTIONS = {'scale_factor': 1.2, 'min_neighbors': 4}
+FACE_FAST_DETECTION_MAX_SIDE = None
+FACE_FAST_MIN_FACE_FRACTION = 0.2
+FACE_FAST_ACCEPT_CONFIDENCE = 0.8
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'attendance_backend.settings')
 
 application = get_wsgi_application()
+
+# Load the face gallery now rather than on the first request
+from attendance.face_service import warm_up_face_service  # noqa: E402
+
+warm_up_face_service()
@@ -93,9 +93,11 @@ def create_synthetic_faces():
             # Add to training data
             if employee.employee_id not in face_service.label_map:
                 # Assign new label
-                new_label = max(face_service.label_map.values(), default=0) + 1
-                face_service.label_map[employee.employee_id] = new_label
-                face_service.reverse_label_map[new_label] = employee.employee_id
+                new_label = face_service.next_label()
+                face_service.publish(
+                    label_map={**face_service.label_map, employee.employee_id: new_label},
+                    reverse_label_map={**face_service.reverse_label_map, new_label: employee.employee_id},
+                )
             
             label = face_service.label_map[employee.employee_id]
             face_service.faces.append(face)
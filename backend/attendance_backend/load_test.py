@@ -0,0 +1,384 @@
+# load_test.py - Concurrent load generator for the attendance API
+"""Seed employees with real face images, then fire a concurrent mix of
+requests at a running server and report per-endpoint latency.
+
+    python load_test.py --images training_data --concurrency 8 --duration 60
+    python load_test.py --mix mark-attendance=90,profile=10 --requests 500 --record trace.jsonl
+    python load_test.py --replay trace.jsonl --speed 2
+
+Employees come from an <images>/<EMP>/<image> folder (the training_data
+layout) and are registered as <prefix><EMP> through register/ and
+register-face/, so real data is left alone. mark-attendance/ sends one of
+the employee's own images.
+
+A trace is one JSON object per line: {"t": seconds from the start,
+"endpoint": ..., "employee_id": ..., "image": index} ("images": [indexes]
+for register-face/). --record writes one for the run; --replay sends a
+trace's requests at their recorded offsets (divided by --speed).
+"""
+import argparse
+import base64
+import json
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib import error, parse
+from urllib import request as urlrequest
+
+from attendance.benchmarks import latency_summary, training_images
+
+BASE_URL = "http://localhost:8000/api"
+ENDPOINTS = ('mark-attendance', 'attendance-history', 'register-face', 'profile')
+# Endpoints whose requests carry the employee's own images
+IMAGE_ENDPOINTS = ('mark-attendance', 'register-face')
+DEFAULT_MIX = 'mark-attendance=70,attendance-history=15,profile=10,register-face=5'
+# Images sent to register-face/, when seeding and under load
+REGISTRATION_IMAGES = 3
+
+
+class Client:
+    """Minimal JSON-over-HTTP client on urllib (one connection per request)"""
+
+    def __init__(self, base_url, timeout):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+
+    def call(self, method, path, payload=None, body=None, content_type='application/json', query=None):
+        """(status, parsed JSON or None); status is None if the request never got an answer"""
+        url = f"{self.base_url}/{path}"
+        if query:
+            url += '?' + parse.urlencode(query)
+        if payload is not None:
+            body = json.dumps(payload).encode()
+        headers = {'Content-Type': content_type} if body is not None else {}
+
+        req = urlrequest.Request(url, data=body, headers=headers, method=method)
+        try:
+            with urlrequest.urlopen(req, timeout=self.timeout) as response:
+                return response.status, parse_json(response.read())
+        except error.HTTPError as e:
+            return e.code, parse_json(e.read())
+        except (error.URLError, OSError) as e:
+            return None, {'error': str(e)}
+
+
+def parse_json(raw):
+    try:
+        return json.loads(raw)
+    except ValueError:
+        return None
+
+
+def load_images(folder, prefix):
+    """{employee_id: [encoded image bytes]} from <folder>/<EMP>/<image>"""
+    images = {}
+    for employee_id, path in training_images(folder):
+        with open(path, 'rb') as f:
+            images.setdefault(f"{prefix}{employee_id}", []).append(f.read())
+    return images
+
+
+def encode(image):
+    return base64.b64encode(image).decode('ascii')
+
+
+def parse_mix(mix):
+    """{endpoint: weight} from 'mark-attendance=70,profile=30'"""
+    weights = {}
+    for part in mix.split(','):
+        if not part.strip():
+            continue
+        endpoint, _, weight = part.partition('=')
+        endpoint = endpoint.strip()
+        if endpoint not in ENDPOINTS:
+            raise ValueError(f"Unknown endpoint '{endpoint}' (choose from {', '.join(ENDPOINTS)})")
+        weights[endpoint] = float(weight or 1)
+    if not weights or sum(weights.values()) <= 0:
+        raise ValueError("The mix needs at least one endpoint with a positive weight")
+    return weights
+
+
+def seed(client, images, password):
+    """Create every employee and register their faces; returns the usable ids"""
+    print(f"=== SEEDING {len(images)} EMPLOYEES ===")
+    ready = []
+    for employee_id, employee_images in sorted(images.items()):
+        if len(employee_images) < REGISTRATION_IMAGES:
+            print(f"✗ {employee_id}: needs at least {REGISTRATION_IMAGES} images")
+            continue
+
+        status, data = client.call('GET', f'profile/{employee_id}/')
+        if status == 404:
+            status, data = client.call('POST', 'register/', {
+                'username': f"loadtest_{employee_id}".lower(),
+                'password': password,
+                'employee_id': employee_id,
+                'first_name': 'Load',
+                'last_name': employee_id,
+            })
+            if status != 201:
+                print(f"✗ {employee_id}: could not create employee ({status}: {(data or {}).get('error')})")
+                continue
+            print(f"✓ {employee_id}: employee created")
+        elif status != 200:
+            print(f"✗ {employee_id}: profile/ answered {status}")
+            continue
+
+        if (data or {}).get('is_face_registered'):
+            print(f"ℹ {employee_id}: face already registered")
+            ready.append(employee_id)
+            continue
+
+        status, data = client.call('POST', 'register-face/', {
+            'employee_id': employee_id,
+            'face_images': [encode(image) for image in employee_images[:REGISTRATION_IMAGES]],
+            'wait': True,
+        })
+        if status == 200 and (data or {}).get('success'):
+            print(f"✓ {employee_id}: face registered")
+            ready.append(employee_id)
+        else:
+            print(f"✗ {employee_id}: face registration failed ({status}: {(data or {}).get('error')})")
+    return ready
+
+
+def generated_events(mix, employees, images, rng, count=None):
+    """Random requests following the mix; endless unless count is given"""
+    endpoints, weights = zip(*mix.items())
+    issued = 0
+    while count is None or issued < count:
+        endpoint = rng.choices(endpoints, weights)[0]
+        employee_id = rng.choice(employees)
+        event = {'endpoint': endpoint, 'employee_id': employee_id}
+        available = range(len(images[employee_id]))
+        if endpoint == 'mark-attendance':
+            event['image'] = rng.choice(available)
+        elif endpoint == 'register-face':
+            if len(available) >= REGISTRATION_IMAGES:
+                event['images'] = rng.sample(available, REGISTRATION_IMAGES)
+            else:
+                event['images'] = rng.choices(available, k=REGISTRATION_IMAGES)
+        yield event
+        issued += 1
+
+
+def read_trace(path):
+    with open(path) as f:
+        events = [json.loads(line) for line in f if line.strip()]
+    return sorted(events, key=lambda event: event.get('t', 0))
+
+
+def send(client, event, images, options):
+    """(status, parsed response) of one trace event"""
+    endpoint, employee_id = event['endpoint'], event['employee_id']
+    employee_images = images.get(employee_id, [])
+
+    if endpoint == 'profile':
+        return client.call('GET', f'profile/{employee_id}/')
+    if endpoint == 'attendance-history':
+        return client.call('POST', 'attendance-history/', {'employee_id': employee_id})
+    if endpoint == 'register-face':
+        chosen = [employee_images[i % len(employee_images)] for i in event.get('images', [])]
+        payload = {'employee_id': employee_id, 'face_images': [encode(image) for image in chosen]}
+        if options.wait_registrations:
+            payload['wait'] = True
+        return client.call('POST', 'register-face/', payload)
+    if endpoint == 'mark-attendance':
+        image = employee_images[event.get('image', 0) % len(employee_images)]
+        attendance_type = event.get('attendance_type', 'CHECK_IN')
+        if options.body == 'jpeg':
+            return client.call(
+                'POST', 'mark-attendance/', body=image, content_type='image/jpeg',
+                query={'employee_id': employee_id, 'attendance_type': attendance_type},
+            )
+        return client.call('POST', 'mark-attendance/', {
+            'employee_id': employee_id,
+            'attendance_type': attendance_type,
+            'face_image': encode(image),
+        })
+    raise ValueError(f"Unknown endpoint '{endpoint}'")
+
+
+def run(client, events, images, options, paced=False):
+    """Send events from options.concurrency threads; returns (results,
+    seconds, skipped)
+
+    paced sends each event at its 't' offset (divided by options.speed),
+    as far as free threads allow; otherwise every thread sends as soon as
+    its previous request is answered. Events that need images of an
+    employee with none under --images (a trace replayed against another
+    folder) are not sent; skipped counts them.
+    """
+    lock = threading.Lock()
+    results = []
+    skipped = 0
+    recorder = open(options.record, 'w') if options.record else None
+    start = time.perf_counter()
+    deadline = start + options.duration if options.duration else None
+
+    def worker():
+        nonlocal skipped
+        while True:
+            with lock:
+                event = next(events, None)
+            if event is None:
+                return
+            if event['endpoint'] in IMAGE_ENDPOINTS and not images.get(event['employee_id']):
+                with lock:
+                    skipped += 1
+                continue
+            if paced:
+                delay = start + event.get('t', 0) / options.speed - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            sent = time.perf_counter()
+            if deadline is not None and sent >= deadline:
+                return
+
+            try:
+                status, data = send(client, event, images, options)
+            except ValueError as e:
+                status, data = None, {'error': str(e)}
+            elapsed_ms = (time.perf_counter() - sent) * 1000
+
+            with lock:
+                results.append((event['endpoint'], elapsed_ms, status, data))
+                if recorder:
+                    recorder.write(json.dumps({**event, 't': round(sent - start, 4)}) + '\n')
+
+    try:
+        with ThreadPoolExecutor(max_workers=options.concurrency) as pool:
+            workers = [pool.submit(worker) for _ in range(options.concurrency)]
+            for future in workers:
+                future.result()
+    finally:
+        if recorder:
+            recorder.close()
+    return results, time.perf_counter() - start, skipped
+
+
+def failed(status, data):
+    """Transport errors, 4xx/5xx answers and success: false bodies"""
+    if status is None or status >= 400:
+        return True
+    return isinstance(data, dict) and data.get('success') is False
+
+
+def summarize(results, seconds, skipped=0):
+    """Per-endpoint and overall throughput, error rate and latency percentiles"""
+    def summary(rows):
+        errors = sum(failed(status, data) for _, _, status, data in rows)
+        statuses = {}
+        for _, _, status, _ in rows:
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+        return {
+            'requests': len(rows),
+            'errors': errors,
+            'error_rate': errors / len(rows) if rows else None,
+            'throughput_rps': round(len(rows) / seconds, 2) if seconds else None,
+            'latency_ms': latency_summary([elapsed for _, elapsed, _, _ in rows]),
+            'statuses': statuses,
+        }
+
+    endpoints = {}
+    for endpoint in ENDPOINTS:
+        rows = [row for row in results if row[0] == endpoint]
+        if not rows:
+            continue
+        endpoints[endpoint] = summary(rows)
+        if endpoint == 'mark-attendance':
+            answered = [data for _, _, status, data in rows if status == 200 and isinstance(data, dict)]
+            verified = sum(bool((data.get('attendance') or {}).get('is_verified')) for data in answered)
+            endpoints[endpoint]['verified_rate'] = verified / len(answered) if answered else None
+
+    return {'seconds': round(seconds, 3), 'overall': summary(results), 'endpoints': endpoints, 'skipped': skipped}
+
+
+def report(summary):
+    print(f"\n=== RESULTS ({summary['seconds']:.1f} s) ===")
+    print(f"{'endpoint':<20} {'requests':>9} {'req/s':>8} {'errors':>8} {'p50 (ms)':>10} {'p95 (ms)':>10} {'p99 (ms)':>10}")
+    rows = list(summary['endpoints'].items()) + [('overall', summary['overall'])]
+    for endpoint, row in rows:
+        latency = row['latency_ms']
+        if not row['requests']:
+            continue
+        print(
+            f"{endpoint:<20} {row['requests']:>9} {row['throughput_rps']:>8.2f} {row['error_rate']:>7.1%} "
+            f"{latency['p50']:>10.1f} {latency['p95']:>10.1f} {latency['p99']:>10.1f}"
+        )
+    verified_rate = summary['endpoints'].get('mark-attendance', {}).get('verified_rate')
+    if verified_rate is not None:
+        print(f"mark-attendance verified: {verified_rate:.1%}")
+    if summary['skipped']:
+        print(f"ℹ Skipped {summary['skipped']} requests for employees without images")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Concurrent load test of the attendance API")
+    parser.add_argument('--base-url', default=BASE_URL)
+    parser.add_argument('--images', default='training_data', help='Folder laid out as <EMP>/<image>')
+    parser.add_argument('--prefix', default='LT-', help='Prepended to the folder names to make employee ids')
+    parser.add_argument('--password', default='loadtest-password', help='Password of the seeded users')
+    parser.add_argument('--no-seed', action='store_true', help='Assume the employees are registered already')
+    parser.add_argument('--seed-only', action='store_true')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help='endpoint=weight pairs')
+    parser.add_argument('--concurrency', type=int, default=8, help='Requests in flight')
+    parser.add_argument('--requests', type=int, default=200, help='Requests to send (ignored with --duration)')
+    parser.add_argument('--duration', type=float, help='Send requests for this many seconds instead')
+    parser.add_argument('--body', choices=('json', 'jpeg'), default='json',
+                        help='mark-attendance/ body: base64 in JSON or the raw image/jpeg bytes')
+    parser.add_argument('--wait-registrations', action='store_true',
+                        help='Make register-face/ answer once the registration is done')
+    parser.add_argument('--timeout', type=float, default=60, help='Seconds to wait for each answer')
+    parser.add_argument('--record', help='Write the requests sent to this trace file')
+    parser.add_argument('--replay', help='Send the requests of a recorded trace at their offsets')
+    parser.add_argument('--speed', type=float, default=1.0, help='Replay speed-up factor')
+    parser.add_argument('--random-seed', type=int, default=0)
+    parser.add_argument('--output', help='Write the results as JSON to this file')
+    options = parser.parse_args(argv)
+
+    try:
+        images = load_images(options.images, options.prefix)
+        mix = parse_mix(options.mix)
+    except (FileNotFoundError, ValueError) as e:
+        print(f"✗ {e}")
+        return 1
+    if options.concurrency < 1 or options.speed <= 0:
+        print("✗ --concurrency and --speed must be positive")
+        return 1
+
+    client = Client(options.base_url, options.timeout)
+    if options.no_seed:
+        employees = sorted(images)
+    else:
+        employees = seed(client, images, options.password)
+    if options.seed_only:
+        return 0
+    if not employees:
+        print("✗ No employees to send requests for")
+        return 1
+
+    if options.replay:
+        events = read_trace(options.replay)
+        print(f"\n=== REPLAYING {len(events)} REQUESTS x{options.speed} ({options.concurrency} threads) ===")
+        results, seconds, skipped = run(client, iter(events), images, options, paced=True)
+    else:
+        count = None if options.duration else options.requests
+        events = generated_events(mix, employees, images, random.Random(options.random_seed), count)
+        amount = f"{options.duration:g} s" if options.duration else f"{count} requests"
+        print(f"\n=== SENDING {amount} ({options.concurrency} threads, mix {options.mix}) ===")
+        results, seconds, skipped = run(client, events, images, options)
+
+    summary = summarize(results, seconds, skipped)
+    report(summary)
+    if options.output:
+        with open(options.output, 'w') as f:
+            json.dump(summary, f, indent=2)
+        print(f"✓ Results written to {options.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -15,6 +15,7 @@ import { SafeAreaView } from 'react-native-safe-area-context';
 import AsyncStorage from '@react-native-async-storage/async-storage';
 import { Ionicons, MaterialIcons } from '@expo/vector-icons';
 import { LinearGradient } from 'expo-linear-gradient';
+import { faceAPI } from '../services/api';
 
 const { width } = Dimensions.get('window');
 
@@ -24,8 +25,6 @@ const FaceRegistrationScreen = ({ navigation, route }: any) => {
     const [employee, setEmployee] = useState<any>(null);
     const [currentStep, setCurrentStep] = useState(1);
 
-    const API_BASE_URL = 'http://192.168.29.157:8000';
-
     useEffect(() => {
         const initialize = async () => {
             const employeeData = await AsyncStorage.getItem('employee_data');
@@ -88,24 +87,14 @@ const FaceRegistrationScreen = ({ navigation, route }: any) => {
                 return;
             }
 
-            const response = await fetch(`${API_BASE_URL}/api/register-face/`, {
-                method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({
-                    employee_id: currentEmployeeId,
-                    face_images: capturedImages,
-                }),
-            });
+            let data = await faceAPI.registerFace(currentEmployeeId, capturedImages);
 
-            const text = await response.text();
-            let data;
-            try {
-                data = JSON.parse(text);
-            } catch (e) {
-                data = { error: 'Invalid JSON response' };
+            // Queued as a background job (no success yet): poll until it finishes
+            if (data.job_id && data.success === undefined) {
+                data = await faceAPI.waitForRegistration(data.job_id);
             }
 
-            if (response.ok && data.success) {
+            if (data.success) {
                 if (employee) {
                     const updatedEmployee = {
                         ...employee,
@@ -168,7 +168,66 @@ export const faceAPI = {
                 },
                 body: JSON.stringify({
                     employee_id: employeeId,
-                    face_images: faceImages
+                    face_images: faceImages,
+                    // Answer with a job id right away; poll it with waitForRegistration
+                    async: true
+                }),
+            });
+
+            const text = await response.text();
+            try {
+                return JSON.parse(text);
+            } catch (e) {
+                return { error: 'Invalid JSON response' };
+            }
+        } catch (error: any) {
+            return { error: error.message };
+        }
+    },
+
+    // Registration runs as a background job; poll until it finishes
+    // An unknown job (404) has no known outcome: check the profile instead
+    getRegistrationStatus: async (jobId: string) => {
+        try {
+            const response = await fetch(`${API_BASE_URL}/api/registration-status/?job_id=${encodeURIComponent(jobId)}`);
+            const text = await response.text();
+            try {
+                return JSON.parse(text);
+            } catch (e) {
+                return { error: 'Invalid JSON response' };
+            }
+        } catch (error: any) {
+            return { error: error.message };
+        }
+    },
+
+    waitForRegistration: async (jobId: string, intervalMs = 1000, timeoutMs = 120000) => {
+        const deadline = Date.now() + timeoutMs;
+        while (Date.now() < deadline) {
+            const job = await faceAPI.getRegistrationStatus(jobId);
+            if (job.status === 'unknown' || (job.error && !job.status)) {
+                return { success: false, error: job.error };
+            }
+            if (job.status === 'completed' || job.status === 'failed') {
+                return job.result || { success: false, error: job.error || 'Face registration failed' };
+            }
+            await new Promise(resolve => setTimeout(resolve, intervalMs));
+        }
+        return { success: false, error: 'Face registration is taking too long, please check again later' };
+    },
+
+    // Quick check of a ~160px thumbnail before uploading the full capture;
+    // returns { ready, face_present, face_size, lighting, issues, advice }
+    preflight: async (thumbnailBase64: string, captureWidth?: number) => {
+        try {
+            const response = await fetch(`${API_BASE_URL}/api/preflight/`, {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                },
+                body: JSON.stringify({
+                    face_image: thumbnailBase64,
+                    capture_width: captureWidth
                 }),
             });
 